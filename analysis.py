@@ -1,506 +1,763 @@
 # analysis.py
+import re
 import pandas as pd
 from datetime import timedelta
-import traceback
 
+from analysis_backend import AnalysisBackend
+from app_logging import get_logger
+from data_index import day_number
+from dataset import DatasetError, as_dataset
+from analysis_cache import memoize
 
-# --- Popular Items Analysis (Using Unique Order Count) ---
-def get_popular_items_by_frequency(merchant_id, datasets, days=30):
-    """Analyzes popular items by unique order count in the last N days for a SPECIFIC merchant."""
-    function_name = "get_popular_items_by_frequency"
-    print(
-        f"Analysis [{function_name}]: Analyzing for merchant: {merchant_id}, last {days} days."
-    )
+log = get_logger("analysis")
+
+
+def _dataset(datasets):
+    """Returns (Dataset, None), or (None, error string) if the data fails validation.
+
+    A Dataset from data_utils was validated when it was loaded and is returned
+    as-is; a plain dict of DataFrames is validated on every call.
+    """
     try:
-        # --- Input Validation ---
-        required_tables = ["transaction_data", "transaction_items", "items"]
-        if not datasets or not all(k in datasets for k in required_tables):
-            missing = (
-                [k for k in required_tables if k not in datasets]
-                if datasets
-                else required_tables
-            )
-            return f"Error: Missing required data tables: {missing}."
-
-        td_df = datasets["transaction_data"]
-        ti_df = datasets["transaction_items"]
-        i_df = datasets["items"]
-
-        # Define column names (ensure consistency)
-        merchant_id_col = "merchant_id"
-        trans_id_col = "order_id"
-        ts_col_dt = "order_time_dt"
-        item_id_col = "item_id"
-        item_name_col = "item_name"
-
-        # Check required columns in dataframes
-        if not all(
-            c in td_df.columns for c in [merchant_id_col, ts_col_dt, trans_id_col]
-        ):
-            return "Error: Missing required columns in transaction_data."
-        if not all(
-            c in ti_df.columns for c in [trans_id_col, item_id_col, merchant_id_col]
-        ):
-            return "Error: Missing required columns in transaction_items."
-        if not all(c in i_df.columns for c in [item_id_col, item_name_col]):
-            return "Error: Missing required columns in items."
-
-        # Ensure key columns are correct type (should be handled by data_utils.py, but good resilience)
-        if i_df[item_id_col].dtype != "object":
-            return f"Error: items.{item_id_col} is not string type."
-        if ti_df[item_id_col].dtype != "object":
-            return f"Error: transaction_items.{item_id_col} is not string type."
-        if ti_df[trans_id_col].dtype != "object":
-            return f"Error: transaction_items.{trans_id_col} is not string type."
-        if td_df[merchant_id_col].dtype != "object":
-            return f"Error: transaction_data.{merchant_id_col} is not string type."
+        return as_dataset(datasets), None
+    except DatasetError as e:
+        return None, f"Error: {e}"
+
+
+def _get_index(datasets, name):
+    """Returns a lookup index built by data_utils, or None if it was not built."""
+    return datasets.index(name)
+
+
+def _merchant_transactions(datasets, td_df, merchant_id, start_date, end_date):
+    """One merchant's transactions with start_date <= order_time_dt <= end_date.
+
+    Uses the merchant/time index (a positional slice of the sorted table) when it
+    is available, otherwise falls back to a boolean mask over the whole table.
+    """
+    index = _get_index(datasets, "merchant_time")
+    if index is not None and index.covers(td_df):
+        return index.slice(td_df, merchant_id, start_date, end_date)
+    return td_df[
+        (td_df["merchant_id"] == merchant_id)
+        & (td_df["order_time_dt"] >= start_date)
+        & (td_df["order_time_dt"] <= end_date)
+    ]
+
+
+def _items_for_orders(datasets, ti_df, order_ids):
+    """transaction_items rows belonging to the given orders.
+
+    Uses the order->items CSR index (cost proportional to the result) when it is
+    available, otherwise an isin() over the whole table.
+    """
+    index = _get_index(datasets, "order_items")
+    if index is not None and index.covers(ti_df):
+        return ti_df.iloc[index.positions(order_ids)]
+    return ti_df[ti_df["order_id"].isin(pd.unique(order_ids))]
+
+
+def _merchants_transactions(datasets, td_df, merchant_ids, start_date, end_date):
+    """Like _merchant_transactions, for a set of merchants (e.g. all merchants in a city)."""
+    index = _get_index(datasets, "merchant_time")
+    if index is not None and index.covers(td_df):
+        return td_df.iloc[index.positions(merchant_ids, start_date, end_date)]
+    return td_df[
+        (td_df["merchant_id"].isin(merchant_ids))
+        & (td_df["order_time_dt"] >= start_date)
+        & (td_df["order_time_dt"] <= end_date)
+    ]
+
+
+# --- Item Ranking Engine (Using Unique Order Count) ---
+def _item_order_counts(datasets, ti_df, recent_trans):
+    """Unique orders per item (in item ID order) for the given transactions, or None.
+
+    This is the one item gather of the scan path: everything ranked from the
+    same transactions can share its result.
+    """
+    item_id_col = "item_id"
+    trans_id_col = "order_id"
+    if recent_trans.empty:
+        return None
+    # Gather relevant transaction items FIRST by order_id
+    relevant_items_df = _items_for_orders(datasets, ti_df, recent_trans[trans_id_col])
+    if relevant_items_df.empty:
+        return None
+    # Count unique orders per item (groupby output is in item ID order)
+    return relevant_items_df.groupby(item_id_col, observed=True)[trans_id_col].nunique()
+
+
+def _rank_item_counts(item_order_counts, i_df, top_n, ascending):
+    """Top (or bottom) N of _item_order_counts as [(item_id, item_name or NA, count)]."""
+    item_id_col = "item_id"
+    item_name_col = "item_name"
+    if item_order_counts is None:
+        return []
+    ranked = item_order_counts.sort_values(ascending=ascending, kind="stable").head(
+        top_n
+    )
+    names = (
+        i_df[[item_id_col, item_name_col]]
+        .drop_duplicates(subset=[item_id_col])
+        .set_index(item_id_col)[item_name_col]
+    )
+    return [
+        (str(item_id), names.get(item_id, pd.NA), int(count))
+        for item_id, count in ranked.items()
+    ]
 
-        # --- Date Range Calculation ---
-        latest_date = td_df[ts_col_dt].max()
-        if pd.isna(latest_date):
-            return "Error: Cannot determine latest date from data."
-        start_date = (latest_date.normalize() - timedelta(days=days - 1)).replace(
-            tzinfo=latest_date.tzinfo
-        )
-        end_date = latest_date
-        print(
-            f"Analysis [{function_name}]: Date range: {start_date.strftime('%Y-%m-%d %H:%M:%S')} to {end_date.strftime('%Y-%m-%d %H:%M:%S')}"
-        )
 
-        # --- Data Filtering ---
-        recent_trans = td_df[
-            (td_df[merchant_id_col] == merchant_id)
-            & (td_df[ts_col_dt] >= start_date)
-            & (td_df[ts_col_dt] <= end_date)
-        ]
-        if recent_trans.empty:
-            print(
-                f"Analysis [{function_name}]: No recent transactions found for merchant {merchant_id}."
-            )
-            return None  # Indicates no data, not an error
-
-        recent_trans_ids = recent_trans[trans_id_col].unique()
-        # Filter relevant transaction items FIRST by order_id
-        relevant_items_df = ti_df[ti_df[trans_id_col].isin(recent_trans_ids)]
-        # Optional: Filter again by merchant if order_id could contain multiple merchants (unlikely)
-        # relevant_items_df = relevant_items_df[relevant_items_df[merchant_id_col] == merchant_id]
-        if relevant_items_df.empty:
-            print(
-                f"Analysis [{function_name}]: No corresponding items found in transaction_items."
-            )
-            return None
+def _rank_items_scan(datasets, td_df, ti_df, i_df, merchant_id, start_date, end_date, top_n, ascending):
+    """Ranks items from the raw transactions (used when no popularity cube is loaded)."""
+    recent_trans = _merchant_transactions(
+        datasets, td_df, merchant_id, start_date, end_date
+    )
+    return _rank_item_counts(
+        _item_order_counts(datasets, ti_df, recent_trans), i_df, top_n, ascending
+    )
 
-        # --- MODIFIED Calculation: Count unique orders per item ---
-        item_order_counts = relevant_items_df.groupby(item_id_col)[
-            trans_id_col
-        ].nunique()
-        item_frequency = item_order_counts.reset_index()
-        item_frequency.columns = [item_id_col, "unique_order_count"]  # New column name
-        # --- End Modification ---
-
-        # Get TOP N most frequent by unique orders
-        top_items_freq = item_frequency.sort_values(
-            by="unique_order_count", ascending=False
-        ).head(5)
-        if top_items_freq.empty:
-            print(f"Analysis [{function_name}]: No items found after frequency count.")
-            return None
 
-        # --- Result Formatting ---
-        top_items_details = pd.merge(
-            top_items_freq,
-            i_df[[item_id_col, item_name_col]],
-            on=item_id_col,
-            how="left",
+def _format_ranked_items(ranked):
+    """Result dicts of the item analyses for [(item_id, item_name or NA, count)]."""
+    return [
+        {
+            "item_id": item_id,
+            "unique_order_count": count,
+            "item_name": item_name
+            if pd.notna(item_name)
+            else f"Unknown Item (ID: {item_id})",
+        }
+        for item_id, item_name, count in ranked
+    ]
+
+
+def _rank_items(function_name, merchant_id, datasets, days, top_n, ascending):
+    """Shared engine behind the popular and low-performing item analyses.
+
+    Answers from the (merchant, day, item) popularity cube when it is loaded,
+    otherwise from the raw transactions. Returns the same values the public
+    functions do: a list of result dicts, None for no data, or an error string.
+    """
+    # --- Input Validation (done once, when the Dataset was built) ---
+    datasets, error = _dataset(datasets)
+    if error:
+        return error
+    td_df = datasets.transactions
+    ti_df = datasets.transaction_items
+    i_df = datasets.menu_items
+
+    # --- Date Range Calculation ---
+    latest_date = datasets.latest_timestamp
+    if pd.isna(latest_date):
+        return "Error: Cannot determine latest date from data."
+    start_date = (latest_date.normalize() - timedelta(days=days - 1)).replace(
+        tzinfo=latest_date.tzinfo
+    )
+    end_date = latest_date
+    log.debug("[%s] Date range: %s to %s", function_name, start_date, end_date)
+
+    # --- Ranking ---
+    cube = _get_index(datasets, "item_popularity")
+    if cube is not None and cube.covers(td_df, ti_df):
+        ranked = cube.rank(
+            merchant_id, day_number(start_date), day_number(end_date), top_n, ascending
+        )
+    else:
+        ranked = _rank_items_scan(
+            datasets, td_df, ti_df, i_df, merchant_id, start_date, end_date, top_n, ascending
         )
-        top_items_details[item_name_col] = top_items_details.apply(
-            lambda row: row[item_name_col]
-            if pd.notna(row[item_name_col])
-            else f"Unknown Item (ID: {row[item_id_col]})",
-            axis=1,
+    if not ranked:
+        log.debug(
+            "[%s] No items ordered for merchant %s in the period.",
+            function_name, merchant_id
         )
+        return None  # Indicates no data, not an error
 
-        results = top_items_details.to_dict("records")
-        for item in results:
-            item["unique_order_count"] = int(
-                item["unique_order_count"]
-            )  # Ensure int type
+    # --- Result Formatting ---
+    return _format_ranked_items(ranked)
 
-        print(
-            f"Analysis [{function_name}]: Found popular items for merchant {merchant_id}: {results}"
+
+# --- Popular Items Analysis (Using Unique Order Count) ---
+@memoize
+def get_popular_items_by_frequency(merchant_id, datasets, days=30, top_n=5):
+    """Analyzes popular items by unique order count in the last N days for a SPECIFIC merchant."""
+    if isinstance(datasets, AnalysisBackend):
+        return datasets.get_popular_items_by_frequency(merchant_id, days, top_n)
+    function_name = "get_popular_items_by_frequency"
+    log.debug(
+        "[%s] Analyzing for merchant: %s, last %s days.",
+        function_name, merchant_id, days
+    )
+    try:
+        results = _rank_items(
+            function_name, merchant_id, datasets, days, top_n, ascending=False
         )
+        if isinstance(results, list):
+            log.debug(
+                "[%s] Found popular items for merchant %s: %s",
+                function_name, merchant_id, results
+            )
         return results
 
     except KeyError as e:
-        print(f"Analysis Error [{function_name}]: Missing column {e}")
+        log.error("[%s] Missing column %s", function_name, e)
         return f"Error: Analysis failed due to missing column ({e}). Check data files and column names in code."
     except Exception as e:
-        print(f"Analysis Error [{function_name}]: {e}")
-        traceback.print_exc()
+        log.exception("[%s] %s", function_name, e)
         return f"Error: An unexpected error occurred during {function_name}."
 
 
 # --- Sales Summary Analysis ---
-def get_sales_summary(merchant_id, datasets, time_period_str="last_7_days"):
-    """Calculates sales summary for a SPECIFIC merchant."""
-    function_name = "get_sales_summary"
-    print(
-        f"Analysis [{function_name}]: Analyzing for merchant: {merchant_id}, period: {time_period_str}"
-    )
-    try:
-        # --- Input Validation ---
-        if not datasets or "transaction_data" not in datasets:
-            return "Error: Missing transaction_data table."
-        trans_df = datasets["transaction_data"]
-
-        merchant_id_col = "merchant_id"
-        ts_col_dt = "order_time_dt"
-        order_value_col = "order_value"
-        order_id_col = "order_id"
-        required_cols = [merchant_id_col, ts_col_dt, order_value_col, order_id_col]
-        if not all(c in trans_df.columns for c in required_cols):
-            missing_cols = [c for c in required_cols if c not in trans_df.columns]
-            return (
-                f"Error: Missing required columns in transaction_data: {missing_cols}."
-            )
-        if not pd.api.types.is_numeric_dtype(trans_df[order_value_col]):
-            return f"Error: '{order_value_col}' column is not numeric."
-        if trans_df[merchant_id_col].dtype != "object":
-            return f"Error: transaction_data.{merchant_id_col} is not string type."
+SALES_SUMMARY_MODES = ("rollup", "scan", "verify")
 
-        # --- Date Range Calculation ---
-        latest_date = trans_df[ts_col_dt].max()
-        if pd.isna(latest_date):
-            return "Error: Cannot determine date range."
-        days_map = {"last_7_days": 7, "last_30_days": 30, "last_90_days": 90}
-        days = days_map.get(
-            time_period_str, 30
-        )  # Default 30 days if invalid period string
-        start_date = (latest_date.normalize() - timedelta(days=days - 1)).replace(
-            tzinfo=latest_date.tzinfo
+
+def _period_days(time_period_str, default=30):
+    """Number of days for 'last_N_days' style period strings (default if unrecognised)."""
+    match = re.fullmatch(r"last_(\d+)_days", time_period_str or "")
+    days = int(match.group(1)) if match else default
+    return days if days > 0 else default
+
+
+def _resolve_sales_window(latest_date, time_period_str, start_date=None, end_date=None):
+    """Returns (start_ts, end_ts) for a sales summary.
+
+    Explicit start/end dates are whole days, inclusive. Otherwise the window is
+    the last N calendar days ending at the latest transaction.
+    """
+    if start_date is not None or end_date is not None:
+        end_ts = (
+            pd.Timestamp(end_date).normalize() + timedelta(days=1) - pd.Timedelta(1, "ns")
+            if end_date is not None
+            else latest_date
         )
-        end_date = latest_date
-        print(
-            f"Analysis [{function_name}]: Date range: {start_date.strftime('%Y-%m-%d %H:%M:%S')} to {end_date.strftime('%Y-%m-%d %H:%M:%S')}"
+        if end_ts.tzinfo is None and latest_date.tzinfo is not None:
+            end_ts = end_ts.tz_localize(latest_date.tzinfo)
+        start_ts = (
+            pd.Timestamp(start_date).normalize()
+            if start_date is not None
+            else end_ts.normalize() - timedelta(days=_period_days(time_period_str) - 1)
         )
+        if start_ts.tzinfo is None and latest_date.tzinfo is not None:
+            start_ts = start_ts.tz_localize(latest_date.tzinfo)
+        return start_ts, end_ts
+    days = _period_days(time_period_str)
+    start_ts = (latest_date.normalize() - timedelta(days=days - 1)).replace(
+        tzinfo=latest_date.tzinfo
+    )
+    return start_ts, latest_date
+
+
+def _sales_totals(datasets, trans_df, merchant_id, start_ts, end_ts, mode, filtered_trans=None):
+    """Total sales, distinct orders and distinct customers for one merchant window.
+
+    mode 'rollup' reads sales/orders from the daily prefix sums (O(1)); 'scan'
+    aggregates the raw transactions; 'verify' does both and reports differences.
+    Distinct customers always come from the raw (index-sliced) transactions,
+    since they do not add up across days. Pass filtered_trans to reuse a slice
+    the caller already has.
+    """
+    if filtered_trans is None:
+        filtered_trans = _merchant_transactions(datasets, trans_df, merchant_id, start_ts, end_ts)
+    totals = {}
+    if "eater_id" in trans_df.columns:
+        totals["unique_customers"] = int(filtered_trans["eater_id"].nunique())
+
+    rollup = _get_index(datasets, "daily_sales")
+    if mode != "scan" and (rollup is None or not rollup.covers(trans_df)):
+        mode = "scan"
+    if mode in ("scan", "verify"):
+        totals["total_sales"] = filtered_trans["order_value"].sum()
+        totals["order_count"] = int(filtered_trans["order_id"].nunique())
+    if mode in ("rollup", "verify"):
+        window = rollup.window_totals(merchant_id, day_number(start_ts), day_number(end_ts))
+        if mode == "verify":
+            if abs(window["sales"] - totals["total_sales"]) > 1e-6 * max(1.0, abs(totals["total_sales"])) or int(window["orders"]) != totals["order_count"]:
+                log.warning(
+                    "[get_sales_summary] rollup mismatch for merchant %s %s - %s: rollup=(%s, %s) scan=(%s, %s)",
+                    merchant_id,
+                    start_ts,
+                    end_ts,
+                    window["sales"],
+                    window["orders"],
+                    totals["total_sales"],
+                    totals["order_count"],
+                )
+        else:
+            totals["total_sales"] = window["sales"]
+            totals["order_count"] = int(window["orders"])
+    return totals
+
+
+def _sales_result(totals, start_date, end_date, period_analyzed):
+    """The get_sales_summary result dict for one window's totals."""
+    results = {
+        "total_sales": totals["total_sales"],
+        "order_count": totals["order_count"],
+        "start_date": start_date.strftime("%Y-%m-%d"),
+        "end_date": end_date.strftime("%Y-%m-%d"),
+        "period_analyzed": period_analyzed,
+    }
+    if "unique_customers" in totals:
+        results["unique_customers"] = totals["unique_customers"]
+    return results
+
+
+def _pct_change(current, previous):
+    return round((current - previous) / previous * 100, 2) if previous else None
+
+
+def _summarize_sales(
+    function_name,
+    merchant_id,
+    latest_date,
+    totals_for,
+    time_period_str,
+    start_date=None,
+    end_date=None,
+    compare_previous=False,
+):
+    """get_sales_summary's result, whichever backend computes the totals.
+
+    totals_for(start_ts, end_ts) returns one inclusive window's totals (as
+    _sales_totals does); windows, formatting and the comparison with the
+    previous period are shared.
+    """
+    # --- Date Range Calculation ---
+    if pd.isna(latest_date):
+        return "Error: Cannot determine date range."
+    start_date_arg, end_date_arg = start_date, end_date
+    start_date, end_date = _resolve_sales_window(
+        latest_date, time_period_str, start_date, end_date
+    )
+    if start_date > end_date:
+        return "Error: Start date is after end date."
+    log.debug("[%s] Date range: %s to %s", function_name, start_date, end_date)
+
+    # --- Calculation ---
+    totals = totals_for(start_date, end_date)
+    if totals["order_count"] == 0:
+        log.debug(
+            "[%s] No transactions found for merchant %s in the period.",
+            function_name, merchant_id
+        )
+        return None
+
+    # --- Result Formatting ---
+    results = _sales_result(
+        totals,
+        start_date,
+        end_date,
+        time_period_str
+        if start_date_arg is None and end_date_arg is None
+        else f"{start_date.strftime('%Y-%m-%d')}_to_{end_date.strftime('%Y-%m-%d')}",
+    )
 
-        # --- Data Filtering ---
-        filtered_trans = trans_df[
-            (trans_df[merchant_id_col] == merchant_id)
-            & (trans_df[ts_col_dt] >= start_date)
-            & (trans_df[ts_col_dt] <= end_date)
-        ]
-        if filtered_trans.empty:
-            print(
-                f"Analysis [{function_name}]: No transactions found for merchant {merchant_id} in the period."
-            )
-            return None
-
-        # --- Calculation ---
-        total_sales = filtered_trans[
-            order_value_col
-        ].sum()  # NaNs already handled during load
-        order_count = filtered_trans[order_id_col].nunique()
-
-        # --- Result Formatting ---
-        results = {
-            "total_sales": total_sales,
-            "order_count": order_count,
-            "start_date": start_date.strftime("%Y-%m-%d"),
-            "end_date": end_date.strftime("%Y-%m-%d"),
-            "period_analyzed": time_period_str,
+    if compare_previous:
+        period_days = day_number(end_date) - day_number(start_date) + 1
+        prev_end = start_date - pd.Timedelta(1, "ns")
+        prev_start = start_date - timedelta(days=period_days)
+        previous = totals_for(prev_start, prev_end)
+        results["previous_period"] = {
+            "total_sales": previous["total_sales"],
+            "order_count": previous["order_count"],
+            "start_date": prev_start.strftime("%Y-%m-%d"),
+            "end_date": prev_end.strftime("%Y-%m-%d"),
         }
-        print(
-            f"Analysis [{function_name}]: Calculated sales summary for merchant {merchant_id}: {results}"
+        if "unique_customers" in previous:
+            results["previous_period"]["unique_customers"] = previous["unique_customers"]
+        results["sales_change_pct"] = _pct_change(
+            results["total_sales"], previous["total_sales"]
+        )
+        results["order_change_pct"] = _pct_change(
+            results["order_count"], previous["order_count"]
+        )
+
+    log.debug(
+        "[%s] Calculated sales summary for merchant %s: %s",
+        function_name, merchant_id, results
+    )
+    return results
+
+
+@memoize
+def get_sales_summary(
+    merchant_id,
+    datasets,
+    time_period_str="last_7_days",
+    start_date=None,
+    end_date=None,
+    compare_previous=False,
+    mode="rollup",
+):
+    """Calculates sales summary for a SPECIFIC merchant.
+
+    The window is either a 'last_N_days' period ending at the latest transaction
+    or an explicit inclusive [start_date, end_date] range (dates or date strings).
+    compare_previous adds the same-length window immediately before it.
+    mode is 'rollup' (default; daily prefix sums), 'scan' (raw transactions) or
+    'verify' (both, logging any difference).
+    """
+    if isinstance(datasets, AnalysisBackend):
+        return datasets.get_sales_summary(
+            merchant_id, time_period_str, start_date, end_date, compare_previous
+        )
+    function_name = "get_sales_summary"
+    log.debug(
+        "[%s] Analyzing for merchant: %s, period: %s",
+        function_name, merchant_id, time_period_str
+    )
+    try:
+        # --- Input Validation (done once, when the Dataset was built) ---
+        datasets, error = _dataset(datasets)
+        if error:
+            return error
+        trans_df = datasets.transactions
+        if mode not in SALES_SUMMARY_MODES:
+            return f"Error: Unknown sales summary mode '{mode}'."
+
+        return _summarize_sales(
+            function_name,
+            merchant_id,
+            datasets.latest_timestamp,
+            lambda start_ts, end_ts: _sales_totals(
+                datasets, trans_df, merchant_id, start_ts, end_ts, mode
+            ),
+            time_period_str,
+            start_date,
+            end_date,
+            compare_previous,
         )
-        return results
 
     except KeyError as e:
-        print(f"Analysis Error [{function_name}]: Missing column {e}")
+        log.error("[%s] Missing column %s", function_name, e)
         return f"Error: Analysis failed due to missing column ({e}). Check data files and column names in code."
     except Exception as e:
-        print(f"Analysis Error [{function_name}]: {e}")
-        traceback.print_exc()
+        log.exception("[%s] %s", function_name, e)
         return f"Error: An unexpected error occurred during {function_name}."
 
 
 # --- Regional Popular Cuisine Analysis ---
-def get_popular_cuisines_in_city(city_id, datasets, days=90):
-    """Analyzes popular cuisine tags based on unique order count across all merchants in a given city."""
-    function_name = "get_popular_cuisines_in_city"
-    print(
-        f"Analysis [{function_name}]: Analyzing for city ID: {city_id}, last {days} days."
+def _city_cuisines_scan(function_name, city_id, datasets, merchants_in_city, start_date, end_date):
+    """Unique orders per cuisine tag for the city's merchants, computed from the tables.
+
+    Returns:
+        pd.Series: cuisine_tag -> unique order count, most popular first.
+        None: If the city has no tagged items ordered in the window.
+    """
+    td_df = datasets.transactions
+    ti_df = datasets.transaction_items
+    i_df = datasets.menu_items
+    trans_id_col = "order_id"
+    item_id_col = "item_id"
+    cuisine_tag_col = "cuisine_tag"
+
+    # 2. Filter transactions for these merchants and date range
+    city_transactions = _merchants_transactions(
+        datasets, td_df, merchants_in_city, start_date, end_date
     )
-    try:
-        # --- Input Validation ---
-        required_tables = ["merchant", "transaction_data", "transaction_items", "items"]
-        if not datasets or not all(k in datasets for k in required_tables):
-            missing = (
-                [k for k in required_tables if k not in datasets]
-                if datasets
-                else required_tables
-            )
-            return f"Error: Missing required data tables: {missing}."
-
-        m_df = datasets["merchant"]
-        td_df = datasets["transaction_data"]
-        ti_df = datasets["transaction_items"]
-        i_df = datasets["items"]
-
-        merchant_id_col = "merchant_id"
-        city_id_col = "city_id"
-        trans_id_col = "order_id"
-        ts_col_dt = "order_time_dt"
-        item_id_col = "item_id"
-        cuisine_tag_col = "cuisine_tag"
-
-        # Check required columns
-        if city_id_col not in m_df.columns:
-            return f"Error: Missing '{city_id_col}' in merchant table."
-        if not all(
-            c in td_df.columns for c in [merchant_id_col, ts_col_dt, trans_id_col]
-        ):
-            return "Error: Missing required columns in transaction_data."
-        if not all(c in ti_df.columns for c in [trans_id_col, item_id_col]):
-            return "Error: Missing required columns in transaction_items."
-        if not all(c in i_df.columns for c in [item_id_col, cuisine_tag_col]):
-            return f"Error: Missing required columns ('{item_id_col}', '{cuisine_tag_col}') in items."
-
-        # Ensure types for comparison/merge (assuming loaded as strings)
-        if m_df[city_id_col].dtype != "object":
-            return f"Error: merchant.{city_id_col} is not string type."
-        if i_df[item_id_col].dtype != "object":
-            return f"Error: items.{item_id_col} is not string type."
-        if ti_df[item_id_col].dtype != "object":
-            return f"Error: transaction_items.{item_id_col} is not string type."
-        if ti_df[trans_id_col].dtype != "object":
-            return f"Error: transaction_items.{trans_id_col} is not string type."
-        if td_df[merchant_id_col].dtype != "object":
-            return f"Error: transaction_data.{merchant_id_col} is not string type."
-
-        # --- Date Range Calculation ---
-        latest_date = td_df[ts_col_dt].max()
-        if pd.isna(latest_date):
-            return "Error: Cannot determine date range."
-        start_date = (latest_date.normalize() - timedelta(days=days - 1)).replace(
-            tzinfo=latest_date.tzinfo
-        )
-        end_date = latest_date
-        print(
-            f"Analysis [{function_name}]: Date range: {start_date.strftime('%Y-%m-%d %H:%M:%S')} to {end_date.strftime('%Y-%m-%d %H:%M:%S')}"
+    if city_transactions.empty:
+        log.debug(
+            "[%s] No transactions found for city %s within the date range.",
+            function_name, city_id
         )
+        return None
+    city_order_ids = city_transactions[trans_id_col].unique()
+    log.debug(
+        "[%s] Found %d orders in city %s for the period.",
+        function_name, len(city_order_ids), city_id
+    )
 
-        # --- Data Filtering ---
-        # 1. Get merchants in the target city
-        merchants_in_city = m_df[m_df[city_id_col] == city_id][merchant_id_col].unique()
-        if len(merchants_in_city) == 0:
-            print(
-                f"Analysis [{function_name}]: No merchants found for city ID {city_id}."
-            )
-            return None
-        print(
-            f"Analysis [{function_name}]: Found {len(merchants_in_city)} merchants in city {city_id}."
+    # 3. Filter transaction items for these orders
+    city_trans_items = _items_for_orders(
+        datasets, ti_df, city_transactions[trans_id_col]
+    )
+    if city_trans_items.empty:
+        log.debug(
+            "[%s] No transaction items found for the orders in city %s.",
+            function_name, city_id
         )
+        return None
 
-        # 2. Filter transactions for these merchants and date range
-        city_transactions = td_df[
-            (td_df[merchant_id_col].isin(merchants_in_city))
-            & (td_df[ts_col_dt] >= start_date)
-            & (td_df[ts_col_dt] <= end_date)
-        ]
-        if city_transactions.empty:
-            print(
-                f"Analysis [{function_name}]: No transactions found for city {city_id} within the date range."
-            )
-            return None
-        city_order_ids = city_transactions[trans_id_col].unique()
-        print(
-            f"Analysis [{function_name}]: Found {len(city_order_ids)} orders in city {city_id} for the period."
+    # 4. Merge with items table to get non-empty cuisine tags
+    items_with_cuisine = i_df[[item_id_col, cuisine_tag_col]].dropna(
+        subset=[cuisine_tag_col]
+    )
+
+    city_items_with_cuisine = pd.merge(
+        city_trans_items[[trans_id_col, item_id_col]],
+        items_with_cuisine,
+        on=item_id_col,
+        how="inner",
+    )
+    if city_items_with_cuisine.empty:
+        log.debug(
+            "[%s] No items with valid cuisine tags found in the transactions for city %s.",
+            function_name, city_id
         )
+        return None
+    log.debug(
+        "[%s] Found %d items with cuisine tags in city orders.",
+        function_name, len(city_items_with_cuisine)
+    )
 
-        # 3. Filter transaction items for these orders
-        city_trans_items = ti_df[ti_df[trans_id_col].isin(city_order_ids)]
-        if city_trans_items.empty:
-            print(
-                f"Analysis [{function_name}]: No transaction items found for the orders in city {city_id}."
-            )
-            return None
+    # Count unique orders per cuisine tag
+    cuisine_order_counts = city_items_with_cuisine.groupby(cuisine_tag_col)[
+        trans_id_col
+    ].nunique()
+    # Stable sort keeps tied cuisines in tag order (groupby output is sorted)
+    return cuisine_order_counts.sort_values(ascending=False, kind="stable")
+
+
+def _top_cuisines(function_name, datasets, city_id, start_date, end_date):
+    """Top 5 cuisine tags of a city in the window: a list, None for no data, or an error string."""
+    m_df = datasets.merchants
+    td_df = datasets.transactions
+    ti_df = datasets.transaction_items
+    i_df = datasets.menu_items
+
+    # --- Data Filtering ---
+    # 1. Get merchants in the target city
+    merchants_in_city = datasets.merchants_in_city(city_id)
+    if len(merchants_in_city) == 0:
+        log.debug("[%s] No merchants found for city ID %s.", function_name, city_id)
+        return None
+    log.debug(
+        "[%s] Found %d merchants in city %s.",
+        function_name, len(merchants_in_city), city_id
+    )
 
-        # 4. Merge with items table to get non-empty cuisine tags
-        items_with_cuisine = i_df[[item_id_col, cuisine_tag_col]].dropna(
-            subset=[cuisine_tag_col]
+    # 2-4. Unique orders per cuisine tag, from the city/cuisine/day aggregate when it
+    #      matches the loaded tables, otherwise by filtering and joining the tables
+    if datasets.tagged_item_rows == 0:
+        return "Error: No items found with cuisine tags in the items table."
+    cube = _get_index(datasets, "city_cuisine")
+    if cube is not None and cube.covers(td_df, ti_df, m_df, i_df):
+        ranked = cube.rank(city_id, day_number(start_date), day_number(end_date), top_n=5)
+        cuisine_frequency = pd.Series(
+            [count for _, count in ranked], index=[tag for tag, _ in ranked], dtype="int64"
         )
-        if items_with_cuisine.empty:
-            return "Error: No items found with cuisine tags in the items table."
-
-        city_items_with_cuisine = pd.merge(
-            city_trans_items[[trans_id_col, item_id_col]],
-            items_with_cuisine,
-            on=item_id_col,
-            how="inner",
+    else:
+        cuisine_frequency = _city_cuisines_scan(
+            function_name, city_id, datasets, merchants_in_city, start_date, end_date
         )
-        if city_items_with_cuisine.empty:
-            print(
-                f"Analysis [{function_name}]: No items with valid cuisine tags found in the transactions for city {city_id}."
-            )
+        if cuisine_frequency is None:
             return None
-        print(
-            f"Analysis [{function_name}]: Found {len(city_items_with_cuisine)} items with cuisine tags in city orders."
+
+    # --- Result Formatting ---
+    top_cuisines = cuisine_frequency.head(5).index.tolist()
+
+    if not top_cuisines:
+        log.debug(
+            "[%s] Could not determine top cuisines for city %s.", function_name, city_id
         )
+        return None
 
-        # --- Calculation ---
-        # Count unique orders per cuisine tag
-        cuisine_order_counts = city_items_with_cuisine.groupby(cuisine_tag_col)[
-            trans_id_col
-        ].nunique()
-        cuisine_frequency = cuisine_order_counts.sort_values(ascending=False)
+    log.debug(
+        "[%s] Found top cuisines in city %s: %s", function_name, city_id, top_cuisines
+    )
+    return top_cuisines
 
-        # --- Result Formatting ---
-        top_cuisines = cuisine_frequency.head(5).index.tolist()
 
-        if not top_cuisines:
-            print(
-                f"Analysis [{function_name}]: Could not determine top cuisines for city {city_id}."
-            )
-            return None
+@memoize
+def get_popular_cuisines_in_city(city_id, datasets, days=90):
+    """Analyzes popular cuisine tags based on unique order count across all merchants in a given city."""
+    if isinstance(datasets, AnalysisBackend):
+        return datasets.get_popular_cuisines_in_city(city_id, days)
+    function_name = "get_popular_cuisines_in_city"
+    log.debug(
+        "[%s] Analyzing for city ID: %s, last %s days.", function_name, city_id, days
+    )
+    try:
+        # --- Input Validation (done once, when the Dataset was built) ---
+        datasets, error = _dataset(datasets)
+        if error:
+            return error
 
-        print(
-            f"Analysis [{function_name}]: Found top cuisines in city {city_id}: {top_cuisines}"
+        # --- Date Range Calculation ---
+        latest_date = datasets.latest_timestamp
+        if pd.isna(latest_date):
+            return "Error: Cannot determine date range."
+        start_date = (latest_date.normalize() - timedelta(days=days - 1)).replace(
+            tzinfo=latest_date.tzinfo
         )
-        return top_cuisines
+        end_date = latest_date
+        log.debug("[%s] Date range: %s to %s", function_name, start_date, end_date)
+
+        return _top_cuisines(function_name, datasets, city_id, start_date, end_date)
 
     except KeyError as e:
-        print(f"Analysis Error [{function_name}]: Missing column {e}")
+        log.error("[%s] Missing column %s", function_name, e)
         return f"Error: Analysis failed due to missing column ({e}). Check data files and column names in code."
     except Exception as e:
-        print(f"Analysis Error [{function_name}]: {e}")
-        traceback.print_exc()
+        log.exception("[%s] %s", function_name, e)
         return f"Error: An unexpected error occurred during {function_name}."
 
 
 # --- Low Performing Items Analysis (Using Unique Order Count) ---
+@memoize
 def get_low_performing_items(merchant_id, datasets, days=30, top_n=5):
     """Analyzes low-performing items by unique order count in the last N days for a SPECIFIC merchant."""
+    if isinstance(datasets, AnalysisBackend):
+        return datasets.get_low_performing_items(merchant_id, days, top_n)
     function_name = "get_low_performing_items"
-    print(
-        f"Analysis [{function_name}]: Analyzing for merchant: {merchant_id}, last {days} days, bottom {top_n}."
+    log.debug(
+        "[%s] Analyzing for merchant: %s, last %s days, bottom %s.",
+        function_name, merchant_id, days, top_n
     )
     try:
-        # --- Input Validation --- (Similar to popular items)
-        required_tables = ["transaction_data", "transaction_items", "items"]
-        if not datasets or not all(k in datasets for k in required_tables):
-            missing = (
-                [k for k in required_tables if k not in datasets]
-                if datasets
-                else required_tables
+        results = _rank_items(
+            function_name, merchant_id, datasets, days, top_n, ascending=True
+        )
+        if isinstance(results, list):
+            log.debug(
+                "[%s] Found low performing items for merchant %s: %s",
+                function_name, merchant_id, results
             )
-            return f"Error: Missing required data tables: {missing}."
+        return results
 
-        td_df = datasets["transaction_data"]
-        ti_df = datasets["transaction_items"]
-        i_df = datasets["items"]
+    except KeyError as e:
+        return f"Error: Missing expected column ({e}). Check analysis logic and data."
+    except Exception as e:
+        log.exception("[%s] %s", function_name, e)
+        return f"Error: An unexpected error occurred during {function_name}."
 
-        merchant_id_col = "merchant_id"
-        trans_id_col = "order_id"
-        ts_col_dt = "order_time_dt"
-        item_id_col = "item_id"
-        item_name_col = "item_name"
 
-        if not all(
-            c in td_df.columns for c in [merchant_id_col, ts_col_dt, trans_id_col]
-        ):
-            return "Error: Missing required columns in transaction_data."
-        if not all(
-            c in ti_df.columns for c in [trans_id_col, item_id_col, merchant_id_col]
-        ):
-            return "Error: Missing required columns in transaction_items."
-        if not all(c in i_df.columns for c in [item_id_col, item_name_col]):
-            return "Error: Missing required columns in items."
-        if i_df[item_id_col].dtype != "object":
-            return "Error: items.{item_id_col} is not string type."
-        if ti_df[item_id_col].dtype != "object":
-            return f"Error: transaction_items.{item_id_col} is not string type."
-        if ti_df[trans_id_col].dtype != "object":
-            return f"Error: transaction_items.{trans_id_col} is not string type."
-        if td_df[merchant_id_col].dtype != "object":
-            return f"Error: transaction_data.{merchant_id_col} is not string type."
-
-        # --- Date Range Calculation ---
-        latest_date = td_df[ts_col_dt].max()
+# --- Combined Merchant Context (several facts, one pass) ---
+CONTEXT_FACTS = ("sales_summary", "top_items", "bottom_items", "cuisines")
+
+
+@memoize
+def build_merchant_context(merchant_id, datasets, facts, days=30, top_n=5, city_id=None):
+    """Computes several facts about one merchant and window in a single pass.
+
+    facts is any collection of CONTEXT_FACTS (a tuple or frozenset can be
+    memoized). The window is the last `days` days, as for the single analyses.
+    The date range, the merchant's transaction slice and (without the
+    popularity cube) the item gather and per-item counts are computed once and
+    shared by every requested fact, so asking for several costs about as much
+    as asking for one. 'cuisines' are for city_id, defaulting to the merchant's
+    own city.
+
+    Returns:
+        dict: fact -> the value the matching single analysis returns
+            (get_sales_summary, get_popular_items_by_frequency,
+            get_low_performing_items, get_popular_cuisines_in_city).
+        str: An error message if the data or the requested facts are invalid.
+    """
+    if isinstance(datasets, AnalysisBackend):
+        return datasets.build_merchant_context(merchant_id, facts, days, top_n, city_id)
+    function_name = "build_merchant_context"
+    facts = set(facts)
+    log.debug(
+        "[%s] Building %s for merchant: %s, last %s days.",
+        function_name, sorted(facts), merchant_id, days
+    )
+    try:
+        unknown = facts.difference(CONTEXT_FACTS)
+        if unknown:
+            return f"Error: Unknown context facts: {sorted(unknown)}."
+        datasets, error = _dataset(datasets)
+        if error:
+            return error
+        td_df = datasets.transactions
+        ti_df = datasets.transaction_items
+        i_df = datasets.menu_items
+
+        # --- Shared: date range ---
+        latest_date = datasets.latest_timestamp
         if pd.isna(latest_date):
-            return "Error: Cannot determine latest date."
-        start_date = (latest_date.normalize() - timedelta(days=days - 1)).replace(
-            tzinfo=latest_date.tzinfo
-        )
-        end_date = latest_date
-        print(
-            f"Analysis [{function_name}]: Date range: {start_date.strftime('%Y-%m-%d %H:%M:%S')} to {end_date.strftime('%Y-%m-%d %H:%M:%S')}"
-        )
-
-        # --- Data Filtering --- (Identical to popular items)
-        recent_trans = td_df[
-            (td_df[merchant_id_col] == merchant_id)
-            & (td_df[ts_col_dt] >= start_date)
-            & (td_df[ts_col_dt] <= end_date)
-        ]
-        if recent_trans.empty:
-            print(
-                f"Analysis [{function_name}]: No recent transactions found for merchant {merchant_id}."
+            return "Error: Cannot determine date range."
+        period = f"last_{days}_days"
+        start_date, end_date = _resolve_sales_window(latest_date, period)
+        start_day, end_day = day_number(start_date), day_number(end_date)
+
+        # --- Shared: the merchant's transactions in the window ---
+        recent_trans = None
+        cube = _get_index(datasets, "item_popularity")
+        use_cube = cube is not None and cube.covers(td_df, ti_df)
+        if "sales_summary" in facts or (
+            not use_cube and facts & {"top_items", "bottom_items"}
+        ):
+            recent_trans = _merchant_transactions(
+                datasets, td_df, merchant_id, start_date, end_date
             )
-            return None
 
-        recent_trans_ids = recent_trans[trans_id_col].unique()
-        relevant_items_df = ti_df[ti_df[trans_id_col].isin(recent_trans_ids)]
-        # Optional filter: relevant_items_df = relevant_items_df[relevant_items_df[merchant_id_col] == merchant_id]
-        if relevant_items_df.empty:
-            print(f"Analysis [{function_name}]: No corresponding items found.")
-            return None
-
-        # --- MODIFIED Calculation: Count unique orders per item ---
-        item_order_counts = relevant_items_df.groupby(item_id_col)[
-            trans_id_col
-        ].nunique()
-        item_frequency = item_order_counts.reset_index()
-        item_frequency.columns = [item_id_col, "unique_order_count"]  # New column name
-        # --- End Modification ---
-
-        # --- KEY DIFFERENCE: Sort ascending and take head ---
-        bottom_items_freq = item_frequency.sort_values(
-            by="unique_order_count", ascending=True
-        ).head(top_n)
-
-        if bottom_items_freq.empty:
-            print(f"Analysis [{function_name}]: No items found after frequency count.")
-            return None
-
-        # --- Result Formatting ---
-        bottom_items_details = pd.merge(
-            bottom_items_freq,
-            i_df[[item_id_col, item_name_col]],
-            on=item_id_col,
-            how="left",
-        )
-        bottom_items_details[item_name_col] = bottom_items_details.apply(
-            lambda row: row[item_name_col]
-            if pd.notna(row[item_name_col])
-            else f"Unknown Item (ID: {row[item_id_col]})",
-            axis=1,
-        )
+        context = {}
+        if "sales_summary" in facts:
+            totals = _sales_totals(
+                datasets, td_df, merchant_id, start_date, end_date, "rollup", recent_trans
+            )
+            context["sales_summary"] = (
+                _sales_result(totals, start_date, end_date, period)
+                if totals["order_count"]
+                else None
+            )
 
-        results = bottom_items_details.to_dict("records")
-        for item in results:
-            item["unique_order_count"] = int(
-                item["unique_order_count"]
-            )  # Ensure int type
+        # --- Items: one cube window, or one item gather shared by top and bottom ---
+        item_counts = None
+        if not use_cube and facts & {"top_items", "bottom_items"}:
+            item_counts = _item_order_counts(datasets, ti_df, recent_trans)
+        for fact, ascending in (("top_items", False), ("bottom_items", True)):
+            if fact not in facts:
+                continue
+            if use_cube:
+                ranked = cube.rank(merchant_id, start_day, end_day, top_n, ascending)
+            else:
+                ranked = _rank_item_counts(item_counts, i_df, top_n, ascending)
+            context[fact] = _format_ranked_items(ranked) if ranked else None
+
+        if "cuisines" in facts:
+            city = city_id if city_id is not None else datasets.city_of(merchant_id)
+            context["cuisines"] = (
+                _top_cuisines(function_name, datasets, city, start_date, end_date)
+                if city is not None
+                else None
+            )
 
-        print(
-            f"Analysis [{function_name}]: Found low performing items for merchant {merchant_id}: {results}"
+        log.debug(
+            "[%s] Context for merchant %s: %s", function_name, merchant_id, context
         )
-        return results
+        return context
 
     except KeyError as e:
-        return f"Error: Missing expected column ({e}). Check analysis logic and data."
+        log.error("[%s] Missing column %s", function_name, e)
+        return f"Error: Analysis failed due to missing column ({e}). Check data files and column names in code."
     except Exception as e:
-        print(f"Analysis Error [{function_name}]: {e}")
-        traceback.print_exc()
+        log.exception("[%s] %s", function_name, e)
         return f"Error: An unexpected error occurred during {function_name}."
+
+
+# --- Backends (see analysis_backend.py) ---
+class PandasBackend(AnalysisBackend):
+    """The analyses above, over a Dataset in memory."""
+
+    name = "pandas"
+
+    def __init__(self, datasets):
+        self.datasets = datasets
+        self.latest_timestamp = datasets.latest_timestamp
+
+    def get_sales_summary(self, merchant_id, time_period_str="last_7_days", start_date=None, end_date=None, compare_previous=False):
+        return get_sales_summary(merchant_id, self.datasets, time_period_str, start_date, end_date, compare_previous)
+
+    def get_popular_items_by_frequency(self, merchant_id, days=30, top_n=5):
+        return get_popular_items_by_frequency(merchant_id, self.datasets, days, top_n)
+
+    def get_low_performing_items(self, merchant_id, days=30, top_n=5):
+        return get_low_performing_items(merchant_id, self.datasets, days, top_n)
+
+    def get_popular_cuisines_in_city(self, city_id, days=90):
+        return get_popular_cuisines_in_city(city_id, self.datasets, days)
+
+    def build_merchant_context(self, merchant_id, facts, days=30, top_n=5, city_id=None):
+        return build_merchant_context(merchant_id, self.datasets, facts, days, top_n, city_id)
+
+    def city_of(self, merchant_id):
+        return self.datasets.city_of(merchant_id)
+
+    def merchant_ids(self):
+        return list(self.datasets.merchant_ids)
+
+    def city_ids(self):
+        return list(self.datasets.city_ids)
@@ -0,0 +1,150 @@
+# analysis_backend.py
+"""Where the analyses in analysis.py run.
+
+  pandas  (default) the tables in memory: a Dataset from data_utils
+  sqlite  an indexed SQLite file built from the CSVs (analysis_sql.py), for
+          histories larger than memory; tables are never loaded whole
+
+MEX_ANALYSIS_BACKEND chooses one for app.py. get_sales_summary,
+get_popular_items_by_frequency, get_low_performing_items,
+get_popular_cuisines_in_city and build_merchant_context accept either a
+Dataset or an AnalysisBackend as their `datasets` argument, and a backend
+answers each of them with the same values.
+"""
+import os
+import math
+
+import numpy as np
+import pandas as pd
+
+BACKENDS = ("pandas", "sqlite")
+PARITY_WINDOWS = (7, 30, 90)
+
+
+def analysis_backend_name():
+    """MEX_ANALYSIS_BACKEND, 'pandas' unless set to another of BACKENDS."""
+    name = os.getenv('MEX_ANALYSIS_BACKEND', 'pandas').strip().lower()
+    if name not in BACKENDS:
+        print(f"Analysis Backend ⚠️: Unknown MEX_ANALYSIS_BACKEND '{name}'; using pandas.")
+        return 'pandas'
+    return name
+
+
+class AnalysisBackend:
+    """The analyses over one copy of the data.
+
+    Methods return what the functions of the same name in analysis.py do: the
+    result, None when there is no data for the request, or an "Error: ..."
+    string. latest_timestamp is the latest order time (the end of every
+    'last_N_days' window).
+    """
+
+    name = None
+    latest_timestamp = None
+
+    def get_sales_summary(self, merchant_id, time_period_str="last_7_days", start_date=None, end_date=None, compare_previous=False):
+        raise NotImplementedError
+
+    def get_popular_items_by_frequency(self, merchant_id, days=30, top_n=5):
+        raise NotImplementedError
+
+    def get_low_performing_items(self, merchant_id, days=30, top_n=5):
+        raise NotImplementedError
+
+    def get_popular_cuisines_in_city(self, city_id, days=90):
+        raise NotImplementedError
+
+    def city_of(self, merchant_id):
+        """city_id of a merchant, or None."""
+        raise NotImplementedError
+
+    def merchant_ids(self):
+        """Every merchant_id, sorted (for parity checks)."""
+        raise NotImplementedError
+
+    def city_ids(self):
+        """Every city_id, sorted (for parity checks)."""
+        raise NotImplementedError
+
+    def build_merchant_context(self, merchant_id, facts, days=30, top_n=5, city_id=None):
+        """As analysis.build_merchant_context, one analysis per fact."""
+        from analysis import CONTEXT_FACTS
+
+        facts = set(facts)
+        unknown = facts.difference(CONTEXT_FACTS)
+        if unknown:
+            return f"Error: Unknown context facts: {sorted(unknown)}."
+        answers = {
+            "sales_summary": lambda: self.get_sales_summary(merchant_id, f"last_{days}_days"),
+            "top_items": lambda: self.get_popular_items_by_frequency(merchant_id, days, top_n),
+            "bottom_items": lambda: self.get_low_performing_items(merchant_id, days, top_n),
+        }
+        context = {}
+        for fact in CONTEXT_FACTS:
+            if fact not in facts:
+                continue
+            if fact == "cuisines":
+                city = city_id if city_id is not None else self.city_of(merchant_id)
+                result = self.get_popular_cuisines_in_city(city, days) if city is not None else None
+            else:
+                result = answers[fact]()
+            if isinstance(result, str):
+                return result
+            context[fact] = result
+        return context
+
+
+def same_result(a, b):
+    """Equal analysis results; sales totals may differ by float summation order
+    (batch_report.verify_reports uses it too)."""
+    if isinstance(a, float) or isinstance(b, float):
+        return isinstance(a, (int, float)) and isinstance(b, (int, float)) and math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(same_result(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return isinstance(b, list) and len(a) == len(b) and all(same_result(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def verify_parity(reference, candidate, windows=PARITY_WINDOWS, sample=None, top_n=5):
+    """Runs every analysis on both backends and compares the answers.
+
+    Covers each merchant (or a seeded random sample of them) and each city for
+    every window (including the combined merchant context), plus explicit
+    date ranges and previous-period comparisons of the sales summary.
+
+    Returns:
+        list: (analysis, arguments, reference answer, candidate answer) for every difference.
+    """
+    from analysis import CONTEXT_FACTS
+
+    merchants = reference.merchant_ids()
+    if sample is not None and sample < len(merchants):
+        merchants = sorted(str(m) for m in np.random.default_rng(0).choice(merchants, size=sample, replace=False))
+    cases = []
+    for days in windows:
+        for merchant_id in merchants:
+            cases += [
+                ("get_sales_summary", (merchant_id, f"last_{days}_days")),
+                ("get_popular_items_by_frequency", (merchant_id, days, top_n)),
+                ("get_low_performing_items", (merchant_id, days, top_n)),
+                ("build_merchant_context", (merchant_id, CONTEXT_FACTS, days, top_n)),
+            ]
+        cases += [("get_popular_cuisines_in_city", (city_id, days)) for city_id in reference.city_ids()]
+    latest = reference.latest_timestamp
+    if not pd.isna(latest):
+        end = latest.strftime("%Y-%m-%d")
+        start = (latest - pd.Timedelta(days=max(windows) - 1)).strftime("%Y-%m-%d")
+        for merchant_id in merchants:
+            cases += [
+                ("get_sales_summary", (merchant_id, "last_30_days", start, end)),
+                ("get_sales_summary", (merchant_id, f"last_{min(windows)}_days", None, None, True)),
+            ]
+
+    differences = []
+    for analysis, args in cases:
+        expected = getattr(reference, analysis)(*args)
+        actual = getattr(candidate, analysis)(*args)
+        if not same_result(expected, actual):
+            differences.append((analysis, args, expected, actual))
+    return differences
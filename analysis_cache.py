@@ -0,0 +1,156 @@
+# analysis_cache.py
+import os
+import sys
+import copy
+import inspect
+import functools
+import threading
+from collections import OrderedDict
+
+from dataset import Dataset
+from env_flags import env_flag
+
+# Bounds for the shared cache; whichever is hit first triggers LRU eviction
+DEFAULT_MAX_ENTRIES = int(os.getenv('MEX_ANALYSIS_CACHE_ENTRIES', '1024'))
+DEFAULT_MAX_BYTES = int(float(os.getenv('MEX_ANALYSIS_CACHE_MB', '16')) * 1024 * 1024)
+
+
+def analysis_cache_enabled():
+    """Memoization is on by default; set MEX_ANALYSIS_CACHE=0 to always recompute."""
+    return env_flag('MEX_ANALYSIS_CACHE', True)
+
+
+def _result_size(value):
+    """Approximate bytes held by an analysis result (lists/dicts of scalars and strings)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_result_size(k) + _result_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_result_size(v) for v in value)
+    return size
+
+
+class ResultCache:
+    """Thread-safe LRU of analysis results, bounded by entry count and bytes.
+
+    Keys include the Dataset version, so a reload (which builds a new Dataset)
+    never sees results computed from the old data. Versions only increase:
+    entries of older versions are dropped as soon as a newer one is stored, and
+    results of requests still finishing on an older version are not stored.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (result, bytes)
+        self._lock = threading.Lock()
+        self._version = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[0])
+
+    def put(self, key, version, result):
+        size = _result_size(result)
+        with self._lock:
+            if self._version is not None and version < self._version:
+                return  # a request still running on data that has since been replaced
+            if version != self._version:
+                self._drop_all()
+                self._version = version
+            if size > self.max_bytes:
+                return
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (copy.deepcopy(result), size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def _drop_all(self):
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self.bytes = 0
+
+    def clear(self):
+        with self._lock:
+            self._drop_all()
+            self._version = None
+
+    def stats(self):
+        """Counters for logs and metrics."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'version': self._version,
+            }
+
+
+result_cache = ResultCache()
+
+
+def memoize(func=None, *, cache=None, dataset_arg='datasets'):
+    """Caches func's results per (function, arguments, dataset version).
+
+    Calls are normalised through the signature, so positional and keyword
+    spellings of the same call share an entry. Calls are not cached when the
+    data is not a Dataset (a plain dict has no version), when an argument is
+    unhashable, or when the result is an error string. Hits return a copy, so
+    callers may modify what they get back.
+    """
+    if func is None:
+        return functools.partial(memoize, cache=cache, dataset_arg=dataset_arg)
+    signature = inspect.signature(func)
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        store = cache or result_cache
+        if not analysis_cache_enabled():
+            return func(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        data = bound.arguments.get(dataset_arg)
+        if not isinstance(data, Dataset):
+            return func(*args, **kwargs)
+        key = (name, data.version) + tuple(
+            (arg, value) for arg, value in bound.arguments.items() if arg != dataset_arg
+        )
+        try:
+            hash(key)
+        except TypeError:
+            return func(*args, **kwargs)
+
+        missing = object()
+        result = store.get(key, missing)
+        if result is not missing:
+            return result
+        result = func(*args, **kwargs)
+        if not (isinstance(result, str) and result.startswith("Error")):
+            store.put(key, data.version, result)
+        return result
+
+    return wrapper
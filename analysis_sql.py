@@ -0,0 +1,398 @@
+# analysis_sql.py
+"""The analyses over an indexed SQLite file instead of DataFrames in memory.
+
+build_sql_store() copies the CSVs into one SQLite file, chunk by chunk with
+the same cleaning as data_ingest.py, so neither building it nor answering
+from it needs the tables to fit in memory; each analysis is one indexed
+query. The file is rebuilt when the CSVs change (fingerprinted as for the
+columnar cache, see data_cache.py).
+
+    python analysis_sql.py build            # (re)build data/.sqlite/analysis.sqlite
+    python analysis_sql.py verify --sample 50
+"""
+import os
+import copy
+import json
+import time
+import sqlite3
+import threading
+import traceback
+import pandas as pd
+
+from analysis import _format_ranked_items, _summarize_sales
+from analysis_backend import AnalysisBackend
+from app_logging import get_logger
+from data_cache import _sources_match, cache_lock, fingerprint_sources
+from data_ingest import CSV_CHUNK_ROWS, TABLE_SCHEMAS, _clean_chunk
+from dataset import REQUIRED_COLUMNS
+
+log = get_logger("analysis.sql")
+
+# Bump when the tables, indexes or cleaning change, so older files are rebuilt
+SQL_STORE_VERSION = 1
+SQL_DIR_NAME = '.sqlite'
+SQL_FILE_NAME = 'analysis.sqlite'
+
+SQL_TYPES = {'id': 'TEXT', 'text': 'TEXT', 'tag': 'TEXT', 'number': 'REAL', 'timestamp': 'INTEGER'}
+
+# Timestamps are stored as nanoseconds since the epoch (as in datetime64[ns])
+SQL_INDEXES = (
+    "CREATE INDEX transaction_data_merchant_time ON transaction_data (merchant_id, order_time)",
+    "CREATE INDEX transaction_items_order ON transaction_items (order_id)",
+    "CREATE INDEX items_item ON items (item_id)",
+    "CREATE INDEX merchant_city ON merchant (city_id)",
+)
+
+
+def default_sql_path(data_dir):
+    """The SQLite file lives next to the CSVs unless MEX_SQL_STORE overrides it."""
+    return os.getenv('MEX_SQL_STORE') or os.path.join(data_dir, SQL_DIR_NAME, SQL_FILE_NAME)
+
+
+# --- Building ---
+def _copy_table(conn, data_dir, table, file_name, chunk_rows):
+    """Copies one CSV into a table of the same name; returns the column names."""
+    path = os.path.join(data_dir, file_name)
+    schema = TABLE_SCHEMAS[table]['columns']
+    header = pd.read_csv(path, nrows=0).columns
+    missing = [c for c in REQUIRED_COLUMNS[table] if c.removesuffix('_dt') not in header]
+    if missing:
+        raise ValueError(f"{file_name} has no column(s) {missing}.")
+    usecols = [c for c in schema if c in header]
+    conn.execute(f"CREATE TABLE {table} ({', '.join(f'{c} {SQL_TYPES[schema[c]]}' for c in usecols)})")
+    stats = {}
+    reader = pd.read_csv(
+        path,
+        usecols=usecols,
+        dtype={c: str for c in usecols},
+        keep_default_na=False,
+        na_values=[''],
+        chunksize=chunk_rows or CSV_CHUNK_ROWS,
+    )
+    for chunk in reader:
+        chunk = _clean_chunk(chunk, schema, False, stats)
+        for col, kind in schema.items():
+            if kind == 'timestamp' and col + '_dt' in chunk.columns:
+                chunk[col] = chunk.pop(col + '_dt').to_numpy('datetime64[ns]').view('int64')
+        chunk[usecols].to_sql(table, conn, if_exists='append', index=False)
+    return usecols
+
+
+def build_sql_store(data_dir, path, table_files, chunk_rows=None):
+    """Builds the SQLite file for the CSVs in table_files, replacing any old one.
+
+    The file is written under a temporary name and moved into place, so readers
+    never see a half-built store.
+
+    Returns:
+        dict: The store's meta entries.
+    """
+    started = time.perf_counter()
+    source_paths = [os.path.join(data_dir, name) for name in table_files.values()]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            columns = {
+                table: _copy_table(conn, data_dir, table, file_name, chunk_rows)
+                for table, file_name in table_files.items()
+            }
+            for statement in SQL_INDEXES:
+                conn.execute(statement)
+            conn.execute("ANALYZE")
+            latest_ns, transaction_rows = conn.execute(
+                "SELECT MAX(order_time), COUNT(*) FROM transaction_data"
+            ).fetchone()
+            meta = {
+                'version': SQL_STORE_VERSION,
+                'sources': fingerprint_sources(source_paths),
+                'latest_ns': latest_ns,
+                'tagged_item_rows': conn.execute(
+                    "SELECT COUNT(*) FROM items WHERE cuisine_tag IS NOT NULL"
+                ).fetchone()[0],
+                'has_eater_id': 'eater_id' in columns['transaction_data'],
+                'transaction_rows': transaction_rows,
+                'seconds': time.perf_counter() - started,
+            }
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.executemany(
+                "INSERT INTO meta VALUES (?, ?)", [(k, json.dumps(v)) for k, v in meta.items()]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return meta
+
+
+def read_sql_meta(path):
+    """The meta entries of a SQLite store, or None if there is none (or it cannot be read)."""
+    if not os.path.exists(path):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return {k: json.loads(v) for k, v in conn.execute("SELECT key, value FROM meta")}
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Analysis SQL ⚠️: Could not read '{path}': {e}")
+        return None
+
+
+def _write_sql_meta(path, key, value):
+    """Replaces one meta entry of a SQLite store (hold cache_lock(path))."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("UPDATE meta SET value = ? WHERE key = ?", (json.dumps(value), key))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# --- Querying ---
+class SqliteBackend(AnalysisBackend):
+    """The analyses as queries against a store written by build_sql_store.
+
+    Each thread (and each forked worker) opens its own read-only connection.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, meta=None):
+        self.path = path
+        self.meta = meta if meta is not None else read_sql_meta(path)
+        if self.meta is None:
+            raise FileNotFoundError(f"No SQLite analysis store at '{path}'.")
+        latest_ns = self.meta['latest_ns']
+        self.latest_timestamp = pd.Timestamp(latest_ns) if latest_ns is not None else pd.NaT
+        self._local = threading.local()
+
+    def __repr__(self):
+        return f"<SqliteBackend '{self.path}': {self.meta['transaction_rows']:,} transactions>"
+
+    def _query(self, sql, params=()):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn.execute(sql, params).fetchall()
+
+    def _window(self, days):
+        """(start_ns, end_ns) of the last `days` days, inclusive, or None without data."""
+        latest = self.latest_timestamp
+        if pd.isna(latest):
+            return None
+        start = latest.normalize() - pd.Timedelta(days=days - 1)
+        return start.value, latest.value
+
+    # --- Sales ---
+    def _sales_totals(self, merchant_id, start_ts, end_ts):
+        total_sales, order_count, unique_customers = self._query(
+            "SELECT TOTAL(order_value), COUNT(DISTINCT order_id), "
+            + ("COUNT(DISTINCT eater_id)" if self.meta['has_eater_id'] else "NULL")
+            + " FROM transaction_data WHERE merchant_id = ? AND order_time BETWEEN ? AND ?",
+            (str(merchant_id), start_ts.value, end_ts.value),
+        )[0]
+        totals = {"total_sales": total_sales, "order_count": order_count}
+        if self.meta['has_eater_id']:
+            totals["unique_customers"] = unique_customers
+        return totals
+
+    def get_sales_summary(self, merchant_id, time_period_str="last_7_days", start_date=None, end_date=None, compare_previous=False):
+        function_name = "get_sales_summary"
+        log.debug("[%s] Analyzing for merchant: %s, period %s.", function_name, merchant_id, time_period_str)
+        try:
+            return _summarize_sales(
+                function_name,
+                merchant_id,
+                self.latest_timestamp,
+                lambda start_ts, end_ts: self._sales_totals(merchant_id, start_ts, end_ts),
+                time_period_str,
+                start_date,
+                end_date,
+                compare_previous,
+            )
+        except Exception as e:
+            log.exception("[%s] %s", function_name, e)
+            return f"Error: An unexpected error occurred during {function_name}."
+
+    # --- Items ---
+    def _rank_items(self, function_name, merchant_id, days, top_n, ascending):
+        log.debug("[%s] Analyzing for merchant: %s, last %s days.", function_name, merchant_id, days)
+        try:
+            window = self._window(days)
+            if window is None:
+                return "Error: Cannot determine latest date from data."
+            ranked = self._query(
+                f"""
+                SELECT ranked.item_id,
+                       (SELECT item_name FROM items WHERE items.item_id = ranked.item_id ORDER BY rowid LIMIT 1),
+                       ranked.orders
+                FROM (
+                    SELECT ti.item_id, COUNT(DISTINCT ti.order_id) AS orders
+                    FROM transaction_data t JOIN transaction_items ti ON ti.order_id = t.order_id
+                    WHERE t.merchant_id = ? AND t.order_time BETWEEN ? AND ? AND ti.item_id IS NOT NULL
+                    GROUP BY ti.item_id
+                    ORDER BY orders {'ASC' if ascending else 'DESC'}, ti.item_id
+                    LIMIT ?
+                ) AS ranked
+                ORDER BY ranked.orders {'ASC' if ascending else 'DESC'}, ranked.item_id
+                """,
+                (str(merchant_id), *window, top_n),
+            )
+            if not ranked:
+                log.debug("[%s] No items ordered for merchant %s in the period.", function_name, merchant_id)
+                return None
+            return _format_ranked_items(
+                [(item_id, name if name is not None else pd.NA, count) for item_id, name, count in ranked]
+            )
+        except Exception as e:
+            log.exception("[%s] %s", function_name, e)
+            return f"Error: An unexpected error occurred during {function_name}."
+
+    def get_popular_items_by_frequency(self, merchant_id, days=30, top_n=5):
+        return self._rank_items("get_popular_items_by_frequency", merchant_id, days, top_n, ascending=False)
+
+    def get_low_performing_items(self, merchant_id, days=30, top_n=5):
+        return self._rank_items("get_low_performing_items", merchant_id, days, top_n, ascending=True)
+
+    # --- Cuisines ---
+    def get_popular_cuisines_in_city(self, city_id, days=90):
+        function_name = "get_popular_cuisines_in_city"
+        log.debug("[%s] Analyzing for city ID: %s, last %s days.", function_name, city_id, days)
+        try:
+            window = self._window(days)
+            if window is None:
+                return "Error: Cannot determine date range."
+            in_city = "SELECT merchant_id FROM merchant WHERE city_id = ? AND merchant_id IS NOT NULL"
+            if not self._query(in_city + " LIMIT 1", (str(city_id),)):
+                log.debug("[%s] No merchants found for city ID %s.", function_name, city_id)
+                return None
+            if self.meta['tagged_item_rows'] == 0:
+                return "Error: No items found with cuisine tags in the items table."
+            top_cuisines = [
+                tag
+                for tag, _ in self._query(
+                    f"""
+                    SELECT i.cuisine_tag, COUNT(DISTINCT ti.order_id) AS orders
+                    FROM transaction_data t
+                    JOIN transaction_items ti ON ti.order_id = t.order_id
+                    JOIN items i ON i.item_id = ti.item_id
+                    WHERE t.merchant_id IN ({in_city})
+                      AND t.order_time BETWEEN ? AND ? AND i.cuisine_tag IS NOT NULL
+                    GROUP BY i.cuisine_tag
+                    ORDER BY orders DESC, i.cuisine_tag
+                    LIMIT 5
+                    """,
+                    (str(city_id), *window),
+                )
+            ]
+            if not top_cuisines:
+                log.debug("[%s] Could not determine top cuisines for city %s.", function_name, city_id)
+                return None
+            log.debug("[%s] Found top cuisines in city %s: %s", function_name, city_id, top_cuisines)
+            return top_cuisines
+        except Exception as e:
+            log.exception("[%s] %s", function_name, e)
+            return f"Error: An unexpected error occurred during {function_name}."
+
+    # --- Lookups ---
+    def city_of(self, merchant_id):
+        rows = self._query(
+            "SELECT city_id FROM merchant WHERE merchant_id = ? AND city_id IS NOT NULL ORDER BY rowid LIMIT 1",
+            (str(merchant_id),),
+        )
+        return rows[0][0] if rows else None
+
+    def merchant_ids(self):
+        return [m for m, in self._query("SELECT DISTINCT merchant_id FROM merchant WHERE merchant_id IS NOT NULL ORDER BY merchant_id")]
+
+    def city_ids(self):
+        return [c for c, in self._query("SELECT DISTINCT city_id FROM merchant WHERE city_id IS NOT NULL ORDER BY city_id")]
+
+
+def load_sql_backend(data_dir=None, path=None):
+    """Opens the SQLite backend, first (re)building the file if the CSVs changed.
+
+    Returns:
+        SqliteBackend, or None if the store could not be built.
+    """
+    from data_utils import DATA_DIR, TABLE_FILES
+
+    data_dir = data_dir or DATA_DIR
+    path = path or default_sql_path(data_dir)
+    source_paths = [os.path.join(data_dir, name) for name in TABLE_FILES.values()]
+    try:
+        with cache_lock(path):
+            meta = read_sql_meta(path)
+            sources = copy.deepcopy(meta.get('sources', {})) if meta is not None else {}
+            if meta is not None and meta.get('version') == SQL_STORE_VERSION and _sources_match(sources, source_paths):
+                if sources != meta['sources']:
+                    # Touched but unchanged CSVs: keep their new mtimes so the next start does not hash them
+                    _write_sql_meta(path, 'sources', sources)
+                    meta['sources'] = sources
+                print(f"Analysis SQL ✅: Using SQLite store '{path}'.")
+            else:
+                print(f"Analysis SQL: Building SQLite store '{path}' from '{data_dir}'...")
+                meta = build_sql_store(data_dir, path, TABLE_FILES)
+                print(f"Analysis SQL ✅: Built '{path}' ({meta['transaction_rows']:,} transactions) in {meta['seconds']:.2f}s.")
+        return SqliteBackend(path, meta)
+    except FileNotFoundError as e:
+        print(f"Analysis SQL ❌: Data file not found: {e}. Ensure files are in '{data_dir}'.")
+        return None
+    except Exception as e:
+        print(f"Analysis SQL ❌: Could not build the SQLite store '{path}': {e}")
+        traceback.print_exc()
+        return None
+
+
+# --- CLI: build the store, or check it against the pandas analyses ---
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+    from analysis import PandasBackend
+    from analysis_backend import PARITY_WINDOWS, verify_parity
+    from data_utils import DATA_DIR, TABLE_FILES, load_provided_data
+
+    parser = argparse.ArgumentParser(description="Build the SQLite analysis store, or check it against the pandas analyses.")
+    parser.add_argument('command', choices=('build', 'verify'))
+    parser.add_argument('--path', default=None, help=f"SQLite file (default {default_sql_path(DATA_DIR)}).")
+    parser.add_argument('--days', type=int, nargs='+', default=list(PARITY_WINDOWS), help="Window lengths to verify.")
+    parser.add_argument('--top-n', type=int, default=5)
+    parser.add_argument('--sample', type=int, default=None, metavar='N', help="Verify N random merchants instead of all.")
+    args = parser.parse_args()
+
+    path = args.path or default_sql_path(DATA_DIR)
+    if args.command == 'build':
+        try:
+            with cache_lock(path):
+                meta = build_sql_store(DATA_DIR, path, TABLE_FILES)
+        except Exception as e:
+            traceback.print_exc()
+            raise SystemExit(f"Analysis SQL ❌: {e}")
+        print(f"Analysis SQL ✅: {meta['transaction_rows']:,} transactions in {meta['seconds']:.2f}s; wrote '{path}'.")
+    else:
+        backend = load_sql_backend(DATA_DIR, path)
+        dataset = load_provided_data()
+        if backend is None or dataset is None:
+            raise SystemExit("Analysis SQL ❌: Data loading failed.")
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            mismatches = verify_parity(PandasBackend(dataset), backend, args.days, args.sample, args.top_n)
+        for mismatch in mismatches[:10]:
+            print(f"Analysis SQL ⚠️: mismatch {mismatch}")
+        print(
+            f"Analysis SQL: verified {min(args.sample or len(dataset.merchant_ids), len(dataset.merchant_ids))} merchant(s) for windows {args.days} "
+            f"in {time.perf_counter() - started:.2f}s, {len(mismatches)} mismatch(es)."
+        )
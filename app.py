@@ -9,40 +9,160 @@ from flask import (
     render_template,
     request,
     jsonify,
+    Response,
+    g,
 )
 
 import traceback
 import re
+import json
+import functools
+import hmac
+import time
+import threading
 
 
 # Import functions from our modules
-from data_utils import load_provided_data
+from data_utils import DATA_DIR, load_provided_data, shared_data_enabled
+from env_flags import env_flag
+from data_append import append_rows, persist_delta, read_delta
+from analysis_backend import AnalysisBackend, analysis_backend_name
+from analysis_sql import load_sql_backend
 from analysis import (
-    get_popular_items_by_frequency,
-    get_sales_summary,
+    build_merchant_context,
     get_popular_cuisines_in_city,
 )
+from batch_report import ReportStore, default_report_dir
+from completion_cache import cache_requested, completion_key, load_completion_cache
+from history_compaction import compact_history, count_tokens
+from session_store import load_session_store, new_conversation_id
+from intent_router import intent_router
+from metrics import (
+    end_trace,
+    metrics_enabled,
+    record_cache_lookup,
+    record_error,
+    record_tokens,
+    registry,
+    server_timing_enabled,
+    set_label,
+    span,
+    start_trace,
+)
+from profiling import PROFILE_HEADER, label_profile, request_profile
+from app_logging import configure_logging, get_logger
 
 # --- Load Environment Variables ---
 load_dotenv()
 
-# --- Initialize Data ---
+# --- Logging (app_logging.py; MEX_LOG_LEVEL and MEX_LOG_SAMPLE may come from .env) ---
+configure_logging()
+log = get_logger("app")
+context_log = get_logger("app.context")
+
+# --- Initialize Data (on a background thread, so the server starts at once) ---
+# Until it is done, /readyz answers 503 and so do the routes that need the data,
+# with a Retry-After header. MEX_DATA_BACKGROUND=0 loads before serving instead
+# (gunicorn.conf.py does, so the preloaded master loads once for all workers).
+# With MEX_ANALYSIS_BACKEND=sqlite, `datasets` is a SqliteBackend (analysis_sql.py)
+# instead of a Dataset: the analyses run as queries and the tables stay on disk.
 datasets = None
 data_loaded_successfully = False
-try:
-    print("App: Attempting to load data via data_utils...")
-    datasets = load_provided_data()
-    if datasets:
+data_ready = threading.Event()  # set once loading has finished, successfully or not
+data_load_seconds = None
+DATA_RETRY_AFTER = int(os.getenv("MEX_DATA_RETRY_AFTER", "5"))
+report_store = None  # precomputed answers, written by `python batch_report.py`
+
+
+def background_load_enabled():
+    """Data loads in the background by default; MEX_DATA_BACKGROUND=0 loads it before serving."""
+    return env_flag("MEX_DATA_BACKGROUND", True)
+
+
+def load_data():
+    """Loads the dataset and the precomputed report store (or opens the SQLite
+    backend), then sets data_ready."""
+    global datasets, data_loaded_successfully, data_load_seconds, report_store
+    started = time.perf_counter()
+    try:
+        if analysis_backend_name() == "sqlite":
+            print("App: Opening the SQLite analysis backend...")
+            loaded = load_sql_backend(DATA_DIR)
+            if loaded is None:
+                print("App ❌: Data loading failed.")
+                return
+            datasets = loaded
+            data_loaded_successfully = True
+            print(f"App ✅: Analyses run on {loaded!r} ({time.perf_counter() - started:.1f}s).")
+            return
+        print("App: Attempting to load data via data_utils...")
+        loaded = load_provided_data()
+        if not loaded:
+            print("App ❌: Data loading failed.")
+            return
+        store = ReportStore.load(default_report_dir(DATA_DIR))
+        if store is None:
+            print("App ℹ️: No precomputed report store found; answers are computed per request.")
+        elif not store.covers(loaded, min(store.windows)):
+            print("App ⚠️: Precomputed report store is from different data; ignoring it.")
+            store = None
+        else:
+            print(f"App ✅: Using precomputed answers for windows {sorted(store.windows)} days.")
+        datasets, report_store = loaded, store
         data_loaded_successfully = True
-        print("App ✅: Data loaded successfully via data_utils.")
-    else:
-        data_loaded_successfully = False
-        print("App ❌: Data loading failed.")
-except Exception as e:
-    print(f"App ❌: Critical error during initial data load call: {e}")
-    traceback.print_exc()
-    data_loaded_successfully = False
-    datasets = None
+        print(f"App ✅: Data loaded successfully via data_utils in {time.perf_counter() - started:.1f}s.")
+    except Exception as e:
+        print(f"App ❌: Critical error during initial data load call: {e}")
+        traceback.print_exc()
+    finally:
+        data_load_seconds = time.perf_counter() - started
+        data_ready.set()
+
+
+def wait_for_data(timeout=None):
+    """Blocks until loading has finished (or timeout seconds); True if the data is usable."""
+    data_ready.wait(timeout)
+    return data_loaded_successfully
+
+
+def data_unavailable():
+    """Response for a request that needs the data when it is not usable: 503 with
+    Retry-After while it is still loading, 500 if loading failed. Returns (JSON
+    body, status, headers), so the async routes (asgi.py) can send it too."""
+    if not data_ready.is_set():
+        return {"error": "Server data is still loading; please retry shortly."}, 503, {"Retry-After": str(DATA_RETRY_AFTER)}
+    return {"error": "Server data is not available."}, 500, {}
+
+
+if background_load_enabled():
+    threading.Thread(target=load_data, name="mex-data-loader", daemon=True).start()
+else:
+    load_data()
+
+# --- LLM Completion Cache (repeat questions skip the OpenAI call) ---
+completion_cache = load_completion_cache()
+if completion_cache is None:
+    print("App ℹ️: LLM completion cache is disabled (MEX_LLM_CACHE=0).")
+else:
+    persisted = f", persisted to '{completion_cache.path}'" if completion_cache.path else ""
+    print(
+        f"App ✅: LLM completion cache on ({completion_cache.max_entries} entries, "
+        f"TTL {completion_cache.ttl:.0f}s{persisted})."
+    )
+
+# --- Conversation Sessions (clients send only the new message) ---
+session_store = load_session_store()
+if session_store is None:
+    print("App ℹ️: Session mode is disabled (MEX_SESSIONS=0); clients send the full history.")
+else:
+    print(f"App ✅: Session mode available ({session_store.kind} store, up to {session_store.max_sessions} conversations).")
+
+# --- Live Appends (POST /api/data/append) ---
+# Disabled unless an admin token is configured. Appends are serialised; each
+# builds a new Dataset and rebinds `datasets`, so a request that already read
+# the old one finishes on it.
+admin_token = os.getenv("MEX_ADMIN_TOKEN")
+append_lock = threading.Lock()
 
 # --- Flask App Setup ---
 app = Flask(__name__)
@@ -77,33 +197,33 @@ except Exception as e:
     openai_configured = False
 
 
-# --- Helper Function ---
-def parse_time_period(user_message_lower):
-    """Parses user message to determine the desired time period (in English)."""
-    if re.search(r"last 3 months|past 90 days", user_message_lower):
-        return "last_90_days"
-    if re.search(r"last month|past 30 days", user_message_lower):
-        return "last_30_days"
-    if re.search(r"last week|past 7 days", user_message_lower):
-        return "last_7_days"
-    # Default to 90 days for analysis/recommendation, 30 for simple queries if unspecified
-    if any(
-        k in user_message_lower
-        for k in [
-            "recommend",
-            "suggestion",
-            "what to sell",
-            "startup",
-            "new merchant",
-            "regional",
-            "area",
-            "profit",
-            "earnings",
-            "cuisine",
-        ]
-    ):
-        return "last_90_days"  # Longer period for recommendations
-    return "last_30_days"  # Default for general sales/popular items
+# --- Helper Functions ---
+def merchant_facts(merchant_id, dataset, facts, days):
+    """Facts for one merchant and window (see analysis.build_merchant_context).
+
+    Served from the precomputed report store when it covers the window (and
+    the data has not been appended to since), otherwise computed now. Returns
+    a dict of fact -> result, or an error string.
+    """
+    precomputed = report_store is not None and report_store.covers(dataset, days)
+    with span("analysis", analysis="+".join(sorted(facts)), source="precomputed" if precomputed else "computed"):
+        if precomputed:
+            return report_store.merchant_context(merchant_id, facts, days, dataset)
+        return build_merchant_context(merchant_id, dataset, tuple(facts), days=days)
+
+
+def city_cuisines(city_id, dataset, days):
+    """Top cuisines in a city, precomputed when available (see get_popular_cuisines_in_city)."""
+    precomputed = report_store is not None and report_store.covers(dataset, days)
+    with span("analysis", analysis="cuisines", source="precomputed" if precomputed else "computed"):
+        if precomputed:
+            return report_store.cuisines(city_id, days)
+        return get_popular_cuisines_in_city(city_id, dataset, days=days)
+
+
+def fact_result(facts_result, fact):
+    """One fact out of a merchant_facts result (an error string applies to every fact)."""
+    return facts_result[fact] if isinstance(facts_result, dict) else facts_result
 
 
 # --- Page Routes ---
@@ -121,300 +241,425 @@ def chat_page():
 # --- /api/clear-history route no longer needed ---
 # highlight-end
 
-# --- API Route for LLM Interaction (Stateless Backend) ---
-print("--- Flask is attempting to define the /api/interact-llm route NOW ---")
+# --- LLM Request Helpers (shared by the JSON and streaming routes) ---
+LLM_MODEL = "gpt-4-turbo"
+LLM_TEMPERATURE = 0.6  # Adjusted temperature parameter slightly
+# Keep Chinese error message for user-facing errors if preferred
+LLM_ERROR_REPLY = "抱歉，我在尝试从 AI 获取回应时遇到问题。这可能是暂时性的，请稍后再试。如果问题持续存在，请联系技术支持。"
 
 
-@app.route("/api/interact-llm", methods=["POST"])
-def handle_llm_interaction():
-    global datasets, data_loaded_successfully, openai_configured
+def read_client_history(req_data):
+    """Validates an /api/interact-llm body: {"history": [...]}, ending with the user's message.
 
-    # Check prerequisites
-    if not openai_configured:
-        return jsonify({"error": "OpenAI API Key not configured."}), 500
-    if not data_loaded_successfully or datasets is None:
-        return jsonify({"error": "Server data is not available."}), 500
-
-    try:
-        req_data = request.get_json()
-        # highlight-start
-        # Expecting {"history": [...]} from frontend
-        if (
-            not req_data
-            or "history" not in req_data
-            or not isinstance(req_data["history"], list)
-            or not req_data["history"]
-        ):
-            return jsonify({"error": "Missing or invalid history in request body"}), 400
-
-        client_history = req_data["history"]
-
-        # Get the latest user message from history for intent recognition
-        if not client_history or client_history[-1].get("role") != "user":
-            return (
-                jsonify({"error": "History is empty or last message not from user"}),
-                400,
-            )
-        user_message = client_history[-1].get("content", "")
-        user_message_lower = user_message.lower()
-        print(f"\nApp [{request.remote_addr}]: Received latest message: {user_message}")
-        print(f"App: Full history received has {len(client_history)} messages.")
-        # highlight-end
+    Returns (history, None), or (None, error message) for a 400 response.
+    """
+    if (
+        not req_data
+        or "history" not in req_data
+        or not isinstance(req_data["history"], list)
+        or not req_data["history"]
+    ):
+        return None, "Missing or invalid history in request body"
+    client_history = req_data["history"]
+    if not isinstance(client_history[-1], dict) or client_history[-1].get("role") != "user":
+        return None, "History is empty or last message not from user"
+    return client_history, None
+
+
+CONVERSATION_ID = re.compile(r"[A-Za-z0-9_-]{8,64}")
+
+
+def resolve_client_history(req_data):
+    """The conversation to answer: (history, conversation_id, None), or
+    (None, None, (error message, status)).
+
+    {"history": [...]} works as it always has (conversation_id is None). In
+    session mode the server keeps the conversation (session_store.py):
+    {"session": true, "history": [...]} starts one, {"conversation_id": id,
+    "message": text} continues it with only the new message, and
+    {"conversation_id": id, "history": [...]} re-sends it in full. An unknown or
+    expired conversation is a 409, answered by the client with the full history.
+    """
+    req_data = req_data if isinstance(req_data, dict) else {}
+    conversation_id = req_data.get("conversation_id")
+    if conversation_id is not None and not (
+        isinstance(conversation_id, str) and CONVERSATION_ID.fullmatch(conversation_id)
+    ):
+        return None, None, ("Invalid conversation_id", 400)
+
+    if "message" in req_data and "history" not in req_data:
+        if session_store is None:
+            return None, None, ("Session mode is disabled; send the full history.", 400)
+        message = req_data["message"]
+        if conversation_id is None:
+            return None, None, ("Missing conversation_id for a session message", 400)
+        if not isinstance(message, str) or not message.strip():
+            return None, None, ("Missing or empty message", 400)
+        stored = session_store.get(conversation_id)
+        if stored is None:
+            return None, None, ("Unknown or expired conversation; send the full history.", 409)
+        return stored + [{"role": "user", "content": message}], conversation_id, None
+
+    client_history, history_error = read_client_history(req_data)
+    if history_error:
+        return None, None, (history_error, 400)
+    if session_store is not None and (conversation_id or req_data.get("session") is True):
+        return client_history, conversation_id or new_conversation_id(), None
+    return client_history, None, None
+
+
+def remember_turn(conversation_id, client_history, reply):
+    """Stores the conversation with its new reply (session mode only)."""
+    if conversation_id and session_store is not None and reply:
+        session_store.put(conversation_id, client_history + [{"role": "assistant", "content": reply}])
+
+
+def build_llm_messages(client_history, dataset, client_addr=None):
+    """Recognises the intent of the latest user message, gathers its data context
+    and returns (OpenAI message list, compaction report): the system prompt plus
+    the client history, compacted to the prompt token budget (history_compaction.py).
+
+    Needs no Flask request context, so the async entry point (asgi.py) can call it
+    from a worker thread; client_addr is only logged.
+    """
+    # Get the latest user message from history for intent recognition
+    user_message = client_history[-1].get("content", "")
+    user_message_lower = user_message.lower()
+    log.info("[%s] Received latest message: %s", client_addr, user_message)
+    log.debug("Full history received has %d messages.", len(client_history))
+
+    # --- Hardcoded IDs (keep for now) ---
+    merchant_id_to_query = "3e2b6"
+    city_id_to_query = "8"
+    city_name_map = {"8": "Subang Jaya"}
+    city_name_context = (
+        f"{city_name_map.get(city_id_to_query, f'City ID {city_id_to_query}')}"
+    )
 
-        # --- Hardcoded IDs (keep for now) ---
-        merchant_id_to_query = "3e2b6"
-        city_id_to_query = "8"
-        city_name_map = {"8": "Subang Jaya"}
-        city_name_context = (
-            f"{city_name_map.get(city_id_to_query, f'City ID {city_id_to_query}')}"
+    data_context = ""
+    intent_recognized = False
+
+    # --- Intent Recognition (intent_router.py: every keyword and the time window in one pass) ---
+    # Windows like "last 14 days" or "since March" end at the latest order, like the analyses
+    with span("route"):
+        route = intent_router.route(user_message_lower, reference_date=getattr(dataset, "latest_timestamp", None))
+    intent = route["intent"]
+    set_label(intent=intent or "general")
+    time_period_arg, days_to_query = route["period"], route["days"]
+    label_profile(intent=intent or "general", merchant=merchant_id_to_query, window=days_to_query)
+    log.debug("Router matched intents %s (keyword hits %s), window %s.", route["intents"], route["matches"], time_period_arg)
+
+    # Intent 1: Profit Improvement
+    if intent == "profit":
+        intent_recognized = True
+        log.info("Intent recognized: Profit improvement query for merchant %s", merchant_id_to_query)
+        log.debug("Fetching data for simplified profit analysis (last %s days)...", days_to_query)
+        # One pass over the merchant's window (or one store lookup) serves both facts
+        profit_context = merchant_facts(
+            merchant_id_to_query, dataset, ("sales_summary", "top_items"), days_to_query
         )
+        sales_summary = fact_result(profit_context, "sales_summary")
+        popular_items = fact_result(profit_context, "top_items")
 
-        data_context = ""
-        intent_recognized = False
-        response_data = {}
-
-        # --- Keywords (keep unchanged) ---
-        popular_item_keywords = ["popular", "hot selling", "best selling", "top items"]
-        sales_keywords = [
-            "sale",
-            "sales",
-            "revenue",
-            "performance",
-            "income",
-            "order value",
-            "summary",
-        ]
-        regional_rec_keywords = [
-            "recommend",
-            "suggestion",
-            "what to sell",
-            "suitable products",
-            "new merchant",
-            "startup",
-            "regional",
-            "area",
-            "city",
-            "location",
-            "cuisine",
-        ]
-        profit_keywords = [
-            "profit",
-            "increase profit",
-            "improve profit",
-            "earnings",
-            "make money",
-            "bottom line",
-            "profitability",
-        ]
-
-        # --- Intent Recognition Logic (based on the latest user_message) ---
-        # (The if/elif/else logic here uses the extracted user_message and user_message_lower)
-        # Intent 1: Profit Improvement
-        if any(p in user_message_lower for p in profit_keywords):
-            intent_recognized = True
-            print(
-                f"App: Intent recognized: Profit improvement query for merchant {merchant_id_to_query}"
-            )
-            time_period_arg = parse_time_period(user_message_lower)
-            days_map = {"last_7_days": 7, "last_30_days": 30, "last_90_days": 90}
-            days_to_query = days_map.get(time_period_arg, 90)
-
-            print(
-                f"App: Fetching data for simplified profit analysis (last {days_to_query} days)..."
-            )
-            sales_summary = get_sales_summary(
-                merchant_id_to_query, datasets, time_period_str=time_period_arg
-            )
-            popular_items = get_popular_items_by_frequency(
-                merchant_id_to_query, datasets, days=days_to_query
-            )
+        context_parts = []
+        context_parts.append(
+            "User wants advice on increasing profit (note: cost data is unavailable)."
+        )
+        context_parts.append(
+            f"Analysis based on data for merchant {merchant_id_to_query} over the last {days_to_query} days."
+        )
 
-            context_parts = []
-            context_parts.append(
-                "User wants advice on increasing profit (note: cost data is unavailable)."
-            )
+        context_parts.append("\n--- Sales Summary ---")
+        if isinstance(sales_summary, dict):
             context_parts.append(
-                f"Analysis based on data for merchant {merchant_id_to_query} over the last {days_to_query} days."
-            )
-
-            context_parts.append("\n--- Sales Summary ---")
-            if isinstance(sales_summary, dict):
-                context_parts.append(
-                    f"Period: {sales_summary['start_date']} to {sales_summary['end_date']}. Total Sales: RM{sales_summary['total_sales']:,.2f}. Orders: {sales_summary['order_count']}."
-                )  # Use RM currency symbol
-            elif isinstance(sales_summary, str):
-                context_parts.append(f"Could not get sales summary: {sales_summary}.")
-            else:
-                context_parts.append("No recent sales data found.")
+                f"Period: {sales_summary['start_date']} to {sales_summary['end_date']}. Total Sales: RM{sales_summary['total_sales']:,.2f}. Orders: {sales_summary['order_count']}."
+            )  # Use RM currency symbol
+        elif isinstance(sales_summary, str):
+            context_parts.append(f"Could not get sales summary: {sales_summary}.")
+        else:
+            context_parts.append("No recent sales data found.")
 
-            context_parts.append(
-                f"\n--- Popular Items (Top {len(popular_items) if isinstance(popular_items, list) else 'N/A'}) ---"
-            )
-            if isinstance(popular_items, list) and popular_items:
-                items_text = "; ".join(
-                    [
-                        f"{item['item_name']} ({item['unique_order_count']} unique orders)"
-                        for item in popular_items
-                    ]
-                )
-                context_parts.append(f"{items_text}.")
-            elif isinstance(popular_items, str):
-                context_parts.append(f"Could not get popular items: {popular_items}.")
-            else:
-                context_parts.append("Could not determine popular items.")
-
-            data_context = "\n".join(context_parts)
-            print(f"App: Data Context (Profit Query - Simplified):\n{data_context}")
-
-        # Intent 2: Popular Items
-        elif any(p in user_message_lower for p in popular_item_keywords) and not any(
-            r in user_message_lower for r in regional_rec_keywords
-        ):
-            intent_recognized = True
-            print(
-                f"App: Intent recognized: Popular items query for merchant {merchant_id_to_query}"
-            )
-            time_period_arg = parse_time_period(user_message_lower)
-            days_map = {"last_7_days": 7, "last_30_days": 30, "last_90_days": 90}
-            days_to_query = days_map.get(time_period_arg, 30)
-            popular_items_result = get_popular_items_by_frequency(
-                merchant_id_to_query, datasets, days=days_to_query
+        context_parts.append(
+            f"\n--- Popular Items (Top {len(popular_items) if isinstance(popular_items, list) else 'N/A'}) ---"
+        )
+        if isinstance(popular_items, list) and popular_items:
+            items_text = "; ".join(
+                [
+                    f"{item['item_name']} ({item['unique_order_count']} unique orders)"
+                    for item in popular_items
+                ]
             )
+            context_parts.append(f"{items_text}.")
+        elif isinstance(popular_items, str):
+            context_parts.append(f"Could not get popular items: {popular_items}.")
+        else:
+            context_parts.append("Could not determine popular items.")
+
+        data_context = "\n".join(context_parts)
+        context_log.debug("Data Context (Profit Query - Simplified):\n%s", data_context)
+
+    # Intent 2: Popular Items
+    elif intent == "popular_items":
+        intent_recognized = True
+        log.info("Intent recognized: Popular items query for merchant %s", merchant_id_to_query)
+        popular_items_result = fact_result(
+            merchant_facts(merchant_id_to_query, dataset, ("top_items",), days_to_query),
+            "top_items",
+        )
 
-            if isinstance(popular_items_result, list) and popular_items_result:
-                items_text = ", ".join(
-                    [
-                        f"{item['item_name']} ({item['unique_order_count']} unique orders)"
-                        for item in popular_items_result
-                    ]
-                )
-                data_context = f"Data context for merchant {merchant_id_to_query} (popular items last {days_to_query} days by unique orders): Top {len(popular_items_result)} are: {items_text}. "
-            elif isinstance(popular_items_result, str):
-                data_context = f"Note on data context: Could not get popular items. Reason: {popular_items_result}. "
-            else:
-                data_context = f"Note on data context: No data for popular items (merchant {merchant_id_to_query}, last {days_to_query} days). "
-            print(f"App: Data Context (Popular Items): {data_context}")
-
-        # Intent 3: Sales Performance
-        elif any(s in user_message_lower for s in sales_keywords):
-            intent_recognized = True
-            print(
-                f"App: Intent recognized: Sales performance query for merchant {merchant_id_to_query}"
-            )
-            time_period_arg = parse_time_period(user_message_lower)
-            days_map = {"last_7_days": 7, "last_30_days": 30, "last_90_days": 90}
-            days_to_query = days_map.get(time_period_arg, 30)
-            sales_summary_result = get_sales_summary(
-                merchant_id_to_query, datasets, time_period_str=time_period_arg
+        if isinstance(popular_items_result, list) and popular_items_result:
+            items_text = ", ".join(
+                [
+                    f"{item['item_name']} ({item['unique_order_count']} unique orders)"
+                    for item in popular_items_result
+                ]
             )
+            data_context = f"Data context for merchant {merchant_id_to_query} (popular items last {days_to_query} days by unique orders): Top {len(popular_items_result)} are: {items_text}. "
+        elif isinstance(popular_items_result, str):
+            data_context = f"Note on data context: Could not get popular items. Reason: {popular_items_result}. "
+        else:
+            data_context = f"Note on data context: No data for popular items (merchant {merchant_id_to_query}, last {days_to_query} days). "
+        context_log.debug("Data Context (Popular Items): %s", data_context)
+
+    # Intent 3: Sales Performance
+    elif intent == "sales":
+        intent_recognized = True
+        log.info("Intent recognized: Sales performance query for merchant %s", merchant_id_to_query)
+        sales_summary_result = fact_result(
+            merchant_facts(merchant_id_to_query, dataset, ("sales_summary",), days_to_query),
+            "sales_summary",
+        )
 
-            if isinstance(sales_summary_result, dict):
-                start, end = (
-                    sales_summary_result["start_date"],
-                    sales_summary_result["end_date"],
-                )
-                sales, count = (
-                    sales_summary_result["total_sales"],
-                    sales_summary_result["order_count"],
-                )
-                data_context = f"Data context for merchant {merchant_id_to_query} (Sales Summary {start} to {end}): Total=RM{sales:,.2f}, Orders={count}. "  # Use RM
-            elif isinstance(sales_summary_result, str):
-                data_context = f"Note on data context: Could not get sales summary. Reason: {sales_summary_result}. "
-            else:
-                data_context = f"Note on data context: No sales data found (merchant {merchant_id_to_query}, period {time_period_arg}). "
-            print(f"App: Data Context (Sales Summary): {data_context}")
-
-        # Intent 4: Regional Cuisine Recommendation
-        elif any(r in user_message_lower for r in regional_rec_keywords) and (
-            "new merchant" in user_message_lower
-            or "what to sell" in user_message_lower
-            or "startup" in user_message_lower
-            or "recommend" in user_message_lower
-            or "suggestion" in user_message_lower
-        ):
-            intent_recognized = True
-            print(
-                f"App: Intent recognized: Regional cuisine recommendation for city {city_id_to_query} ({city_name_context})"
+        if isinstance(sales_summary_result, dict):
+            start, end = (
+                sales_summary_result["start_date"],
+                sales_summary_result["end_date"],
             )
-            time_period_arg = parse_time_period(user_message_lower)
-            days_map = {"last_7_days": 7, "last_30_days": 30, "last_90_days": 90}
-            days_to_query = days_map.get(time_period_arg, 90)
-            popular_cuisines_result = get_popular_cuisines_in_city(
-                city_id_to_query, datasets, days=days_to_query
+            sales, count = (
+                sales_summary_result["total_sales"],
+                sales_summary_result["order_count"],
             )
+            data_context = f"Data context for merchant {merchant_id_to_query} (Sales Summary {start} to {end}): Total=RM{sales:,.2f}, Orders={count}. "  # Use RM
+        elif isinstance(sales_summary_result, str):
+            data_context = f"Note on data context: Could not get sales summary. Reason: {sales_summary_result}. "
+        else:
+            data_context = f"Note on data context: No sales data found (merchant {merchant_id_to_query}, period {time_period_arg}). "
+        context_log.debug("Data Context (Sales Summary): %s", data_context)
+
+    # Intent 4: Regional Cuisine Recommendation
+    elif intent == "regional_cuisine":
+        intent_recognized = True
+        log.info(
+            "Intent recognized: Regional cuisine recommendation for city %s (%s)", city_id_to_query, city_name_context
+        )
+        popular_cuisines_result = city_cuisines(city_id_to_query, dataset, days_to_query)
 
-            if isinstance(popular_cuisines_result, list) and popular_cuisines_result:
-                cuisines_text = ", ".join(popular_cuisines_result)
-                data_context = f"Data context: User is asking for recommendations for a new merchant in {city_name_context}. Analysis of recent orders ({days_to_query} days) across merchants shows the top {len(popular_cuisines_result)} most frequent cuisine types are: {cuisines_text}. "
-            elif isinstance(popular_cuisines_result, str):
-                data_context = f"Note on data context: Could not get popular cuisines data for {city_name_context}. Reason: {popular_cuisines_result}. "
-            else:
-                data_context = f"Note on data context: Insufficient data for popular cuisine types in {city_name_context} (last {days_to_query} days). "
-            print(f"App: Data Context (Regional Cuisines): {data_context}")
-
-        # Fallback / General Query
+        if isinstance(popular_cuisines_result, list) and popular_cuisines_result:
+            cuisines_text = ", ".join(popular_cuisines_result)
+            data_context = f"Data context: User is asking for recommendations for a new merchant in {city_name_context}. Analysis of recent orders ({days_to_query} days) across merchants shows the top {len(popular_cuisines_result)} most frequent cuisine types are: {cuisines_text}. "
+        elif isinstance(popular_cuisines_result, str):
+            data_context = f"Note on data context: Could not get popular cuisines data for {city_name_context}. Reason: {popular_cuisines_result}. "
         else:
-            if not intent_recognized:  # Ensure execution if no intent matched
-                print("App: Intent: General query or not recognized (Fallback).")
-                data_context = ""
+            data_context = f"Note on data context: Insufficient data for popular cuisine types in {city_name_context} (last {days_to_query} days). "
+        context_log.debug("Data Context (Regional Cuisines): %s", data_context)
 
-        # --- System Prompt (informs LLM history is provided in the API call) ---
-        system_prompt = f"""
-        You are MEX Assistant, an AI business advisor speaking directly TO a Grab merchant. Your purpose is to help the merchant (you) succeed by turning your data into understandable insights and actionable suggestions. You are based in Malaysia, so use RM for currency when appropriate.
+    # Fallback / General Query
+    else:
+        if not intent_recognized:  # Ensure execution if no intent matched
+            log.info("Intent: General query or not recognized (Fallback).")
+            data_context = ""
 
-        VERY IMPORTANT: Always address the merchant directly using "you" and "your". Never refer to the merchant as 'the merchant' or by their ID in your response. Keep your tone professional, encouraging, and helpful.
+    # --- System Prompt (informs LLM history is provided in the API call) ---
+    system_prompt = f"""
+    You are MEX Assistant, an AI business advisor speaking directly TO a Grab merchant. Your purpose is to help the merchant (you) succeed by turning your data into understandable insights and actionable suggestions. You are based in Malaysia, so use RM for currency when appropriate.
 
-        Analyze the **provided conversation history** (included in the message list) and the specific **Data Context** (provided below, if any, relevant to the *last user message*) to formulate your response to the merchant's *most recent* question. Go beyond just stating the numbers or list; interpret what they imply for your business. Where appropriate, suggest potential actions you could consider based on the data.
+    VERY IMPORTANT: Always address the merchant directly using "you" and "your". Never refer to the merchant as 'the merchant' or by their ID in your response. Keep your tone professional, encouraging, and helpful.
 
-        --- Specific instructions for Profit Improvement query ---
-        If the user asks how to increase profit:
-        1. Start by clearly stating that direct profit calculation isn't possible due to missing cost data, so the advice focuses on improving potential profitability through revenue and efficiency.
-        2. Briefly summarize your recent sales performance using the figures from the 'Sales Summary' section in the context (use RM).
-        3. Discuss your popular items (using names and **unique order counts** from the 'Popular Items' section). Suggest specific ways you could leverage these (e.g., 'Consider promoting [Popular Item Name] which was in [N] **unique orders**...', potential bundling, ensuring stock).
-        4. Synthesize these points: Explain how focusing on popular items might boost revenue.
-        5. Conclude with general advice relevant to F&B in places like Malaysia: reviewing pricing (RM) against competitors, menu diversity, considering local tastes, operational efficiency (delivery times, packaging), and potentially exploring promotions on the Grab platform.
-        --- End of Profit Improvement instructions ---
+    Analyze the **provided conversation history** (included in the message list) and the specific **Data Context** (provided below, if any, relevant to the *last user message*) to formulate your response to the merchant's *most recent* question. Go beyond just stating the numbers or list; interpret what they imply for your business. Where appropriate, suggest potential actions you could consider based on the data.
 
-        If you identify as a new merchant asking for advice on what to sell in {city_name_context}, use the popular cuisine data (if provided in the 'Regional Cuisine' context section) to suggest focusing on those categories, while also advising you to conduct deeper local market research (competitors, target audience preferences, rental costs) and consider differentiation (unique selling points).
+    --- Specific instructions for Profit Improvement query ---
+    If the user asks how to increase profit:
+    1. Start by clearly stating that direct profit calculation isn't possible due to missing cost data, so the advice focuses on improving potential profitability through revenue and efficiency.
+    2. Briefly summarize your recent sales performance using the figures from the 'Sales Summary' section in the context (use RM).
+    3. Discuss your popular items (using names and **unique order counts** from the 'Popular Items' section). Suggest specific ways you could leverage these (e.g., 'Consider promoting [Popular Item Name] which was in [N] **unique orders**...', potential bundling, ensuring stock).
+    4. Synthesize these points: Explain how focusing on popular items might boost revenue.
+    5. Conclude with general advice relevant to F&B in places like Malaysia: reviewing pricing (RM) against competitors, menu diversity, considering local tastes, operational efficiency (delivery times, packaging), and potentially exploring promotions on the Grab platform.
+    --- End of Profit Improvement instructions ---
 
-        If no specific data context is available ('Data Context:' below is empty) or the context is just a note ('Note on data context: ...'), address the *last user question* directly based on the provided conversation history and general business knowledge relevant to Malaysian F&B merchants.
-        If the context notes an error or lack of data ('Note on data context: Could not get...'), clearly communicate this limitation to you first before attempting a general answer based on conversation history or general knowledge.
+    If you identify as a new merchant asking for advice on what to sell in {city_name_context}, use the popular cuisine data (if provided in the 'Regional Cuisine' context section) to suggest focusing on those categories, while also advising you to conduct deeper local market research (competitors, target audience preferences, rental costs) and consider differentiation (unique selling points).
 
-        Be clear, concise, and focus on providing practical value to the merchant (you). Respond in English. Use Markdown for formatting.
+    If no specific data context is available ('Data Context:' below is empty) or the context is just a note ('Note on data context: ...'), address the *last user question* directly based on the provided conversation history and general business knowledge relevant to Malaysian F&B merchants.
+    If the context notes an error or lack of data ('Note on data context: Could not get...'), clearly communicate this limitation to you first before attempting a general answer based on conversation history or general knowledge.
 
-        Data Context (relevant to the last user message):
-        {data_context}
-        """
-        # --- End of System Prompt ---
+    Be clear, concise, and focus on providing practical value to the merchant (you). Respond in English. Use Markdown for formatting.
 
-        # highlight-start
-        # Construct message list for OpenAI (System Prompt + History from frontend)
+    Data Context (relevant to the last user message):
+    {data_context}
+    """
+    # --- End of System Prompt ---
+
+    # highlight-start
+    # Construct message list for OpenAI (System Prompt + History from frontend)
+    with span("prompt"):
         messages = [{"role": "system", "content": system_prompt.strip()}]
         # Assuming client_history already includes the latest user message
         messages.extend(client_history)
+        # Older turns become a short summary; the latest stay verbatim, within the token budget
+        messages, compaction = compact_history(messages)
 
-        print(
-            f"App: --- Sending Messages to OpenAI (Using history from client, {len(client_history)} messages) ---"
-        )
+    log.info(
+        "Sending messages to OpenAI (history from client, %d messages; %s prompt tokens, %s saved by compaction)",
+        len(client_history), compaction["prompt_tokens"], compaction["tokens_saved"],
+    )
+    return messages, compaction
 
-        # --- Call OpenAI API ---
-        try:
-            completion = openai.chat.completions.create(
-                model="gpt-4-turbo",
+
+def completion_cache_key(req_data, cache_control, messages):
+    """Completion cache key for a request, or None when the cache is off or the request opted out."""
+    if completion_cache is None or not cache_requested(req_data, cache_control):
+        return None
+    return completion_key(LLM_MODEL, LLM_TEMPERATURE, messages)
+
+
+def cached_completion(cache_key):
+    """The cached reply for cache_key, or None (also without a key); timed and counted in metrics."""
+    if not cache_key:
+        return None
+    with span("cache"):
+        reply = completion_cache.get(cache_key)
+    record_cache_lookup(reply is not None)
+    return reply
+
+
+def record_completion_tokens(compaction, reply, usage=None):
+    """Token metrics for one reply: as reported by OpenAI, or estimated (streams, async client)."""
+    if usage is not None:
+        record_tokens(usage.prompt_tokens, usage.completion_tokens, "usage")
+    else:
+        record_tokens(compaction["prompt_tokens"], count_tokens(reply), "estimate")
+
+
+def sse_event(event, payload):
+    """One Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def stream_llm_reply(messages, cache_key=None, reply_fields=None, on_reply=None, trace=None):
+    """Yields the completion as SSE: a `delta` event per chunk of text, then
+    `done` with the full reply (plus reply_fields), or `error` if the OpenAI
+    call fails. on_reply(reply) is called before `done`.
+
+    With a cache_key, a cached reply is sent as one delta (and `done` says
+    "cached": true), and a new reply is cached once complete. The request's
+    trace (metrics.py) is finished when the stream ends.
+    """
+    try:
+        yield from _stream_llm_reply(messages, cache_key, reply_fields or {}, on_reply, trace.span if trace else span)
+    finally:
+        if trace is not None:
+            trace.finish(200)
+
+
+def _stream_llm_reply(messages, cache_key, reply_fields, on_reply, timed):
+    cached_reply = cached_completion(cache_key)
+    if cached_reply is not None:
+        log.info("LLM reply served from the completion cache.")
+        if on_reply:
+            on_reply(cached_reply)
+        yield sse_event("delta", {"text": cached_reply})
+        yield sse_event("done", {"reply": cached_reply, "cached": True, **reply_fields})
+        return
+    parts = []
+    stream = None
+    try:
+        with timed("openai"):
+            stream = openai.chat.completions.create(
+                model=LLM_MODEL,
                 messages=messages,
-                temperature=0.6,  # Adjusted temperature parameter slightly
+                temperature=LLM_TEMPERATURE,
+                stream=True,
             )
+            for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    parts.append(text)
+                    yield sse_event("delta", {"text": text})
+    except Exception as e:
+        log.exception("OpenAI streaming call failed: %s", e)
+        record_error("openai")
+        yield sse_event("error", {"error": LLM_ERROR_REPLY})
+        return
+    finally:
+        # Also runs when the client disconnects mid-stream (GeneratorExit)
+        if stream is not None:
+            stream.close()
+    log.info("LLM reply streamed successfully (%d chunks).", len(parts))
+    reply = "".join(parts).strip()
+    if "compaction" in reply_fields:
+        record_completion_tokens(reply_fields["compaction"], reply)
+    if cache_key and reply:
+        completion_cache.put(cache_key, reply)
+    if on_reply:
+        on_reply(reply)
+    yield sse_event("done", {"reply": reply, **reply_fields})
+
+
+# --- API Route for LLM Interaction (Stateless Backend) ---
+print("--- Flask is attempting to define the /api/interact-llm route NOW ---")
+
+
+@app.route("/api/interact-llm", methods=["POST"])
+def handle_llm_interaction():
+    global datasets, data_loaded_successfully, openai_configured
+
+    # Check prerequisites
+    if not openai_configured:
+        return jsonify({"error": "OpenAI API Key not configured."}), 500
+    # One snapshot for the whole request, even if an append swaps `datasets` meanwhile
+    dataset = datasets
+    if not data_loaded_successfully or dataset is None:
+        return data_unavailable()
+
+    try:
+        # Expecting {"history": [...]} (or a session message, see resolve_client_history)
+        # from frontend; {"cache": false} skips the completion cache
+        with span("parse"):
+            req_data = request.get_json()
+            client_history, conversation_id, history_error = resolve_client_history(req_data)
+        if history_error:
+            return jsonify({"error": history_error[0]}), history_error[1]
+        messages, compaction = build_llm_messages(client_history, dataset, request.remote_addr)
+        response_data = {"compaction": compaction}
+        if conversation_id:
+            response_data["conversation_id"] = conversation_id
+
+        cache_key = completion_cache_key(req_data, request.headers.get("Cache-Control"), messages)
+        cached_reply = cached_completion(cache_key)
+        if cached_reply is not None:
+            log.info("LLM Reply served from the completion cache.")
+            remember_turn(conversation_id, client_history, cached_reply)
+            return jsonify({"reply": cached_reply, "cached": True, **response_data})
+
+        # --- Call OpenAI API ---
+        try:
+            with span("openai"):
+                completion = openai.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=messages,
+                    temperature=LLM_TEMPERATURE,
+                )
             llm_reply = completion.choices[0].message.content.strip()
-            print("App: LLM Reply received successfully.")
+            log.info("LLM Reply received successfully.")
+            record_completion_tokens(compaction, llm_reply, getattr(completion, "usage", None))
             response_data["reply"] = llm_reply
+            if cache_key and llm_reply:
+                completion_cache.put(cache_key, llm_reply)
+            remember_turn(conversation_id, client_history, llm_reply)
 
         except Exception as e:
-            print(f"App ❌: OpenAI API call failed: {e}")
-            traceback.print_exc()
-            # Keep Chinese error message for user-facing errors if preferred
-            response_data["reply"] = (
-                "抱歉，我在尝试从 AI 获取回应时遇到问题。这可能是暂时性的，请稍后再试。如果问题持续存在，请联系技术支持。"
-            )
+            log.exception("OpenAI API call failed: %s", e)
+            record_error("openai")
+            response_data["reply"] = LLM_ERROR_REPLY
 
         # --- Return Response ---
         # Only return AI reply, frontend manages history state
@@ -422,17 +667,175 @@ def handle_llm_interaction():
 
     # --- Global Error Handling for the API Route ---
     except Exception as e:
-        print(f"App ❌: An unexpected error occurred in /api/interact-llm: {e}")
-        traceback.print_exc()
+        log.exception("An unexpected error occurred in /api/interact-llm: %s", e)
         # Keep Chinese error message for user-facing errors if preferred
         return jsonify({"error": "处理您的请求时服务器发生意外错误。"}), 500
 
 
+# --- Streaming Variant (Server-Sent Events) ---
+@app.route("/api/interact-llm/stream", methods=["POST"])
+def handle_llm_interaction_stream():
+    """Same request as /api/interact-llm, but the reply is streamed as it is generated.
+
+    The response is text/event-stream: `delta` events ({"text": ...}) as tokens
+    arrive, then one `done` ({"reply": full text}) or `error` ({"error": ...}).
+    Problems found before the stream starts are plain JSON errors, as above.
+    """
+    if not openai_configured:
+        return jsonify({"error": "OpenAI API Key not configured."}), 500
+    dataset = datasets
+    if not data_loaded_successfully or dataset is None:
+        return data_unavailable()
+
+    try:
+        with span("parse"):
+            req_data = request.get_json(silent=True)
+            client_history, conversation_id, history_error = resolve_client_history(req_data)
+        if history_error:
+            return jsonify({"error": history_error[0]}), history_error[1]
+        messages, compaction = build_llm_messages(client_history, dataset, request.remote_addr)
+        cache_key = completion_cache_key(req_data, request.headers.get("Cache-Control"), messages)
+    except Exception as e:
+        log.exception("An unexpected error occurred in /api/interact-llm/stream: %s", e)
+        return jsonify({"error": "处理您的请求时服务器发生意外错误。"}), 500
+
+    log.info("Streaming reply from OpenAI (%d messages of history)", len(client_history))
+    return Response(
+        stream_llm_reply(
+            messages,
+            cache_key,
+            reply_fields={"compaction": compaction, **({"conversation_id": conversation_id} if conversation_id else {})},
+            on_reply=functools.partial(remember_turn, conversation_id, client_history),
+            trace=g.get("trace"),
+        ),
+        mimetype="text/event-stream",
+        # No caching, and no buffering by a reverse proxy (nginx), so tokens arrive as sent
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# --- Metrics (GET /metrics, Prometheus text format; see metrics.py) ---
+CHAT_ROUTES = ("/api/interact-llm", "/api/interact-llm/stream")
+
+
+@app.before_request
+def start_request_trace():
+    if request.method == "POST" and request.path in CHAT_ROUTES:
+        g.trace = start_trace(request.path)
+        # Opt-in profile (profiling.py); a stream's is written when its response starts
+        g.profile = request_profile(request.path, request.headers.get(PROFILE_HEADER))
+        if g.profile is not None:
+            g.profile.start()
+
+
+@app.teardown_request
+def finish_request_profile(error=None):
+    profile = g.pop("profile", None)
+    if profile is not None:
+        profile.stop()
+
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.pop("trace", None)
+    if trace is not None:
+        if server_timing_enabled():
+            response.headers["Server-Timing"] = trace.server_timing()
+        if not response.is_streamed:
+            trace.finish(response.status_code)  # streams finish in stream_llm_reply
+        end_trace()
+    return response
+
+
+def app_gauges():
+    """Gauges read when /metrics is scraped."""
+    yield "mex_data_loaded", {}, int(bool(data_loaded_successfully and datasets is not None))
+    if completion_cache is not None:
+        cache_stats = completion_cache.stats()
+        yield "mex_completion_cache_entries", {}, cache_stats["entries"]
+        yield "mex_completion_cache_bytes", {}, cache_stats["bytes"]
+    if session_store is not None:
+        session_stats = session_store.stats()
+        yield "mex_sessions", {"store": session_stats["kind"]}, session_stats["sessions"]
+
+
+registry.add_collector(app_gauges)
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    if not metrics_enabled():
+        return jsonify({"error": "Metrics are disabled (MEX_METRICS=0)."}), 404
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+# --- Health Checks (for load balancers and orchestrators) ---
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process is up and serving, whether or not the data has loaded."""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: 200 once the data is loaded, 503 until then (with Retry-After while loading)."""
+    if data_loaded_successfully and datasets is not None:
+        return jsonify({"status": "ready", "load_seconds": round(data_load_seconds, 3), "openai_configured": openai_configured})
+    if not data_ready.is_set():
+        return jsonify({"status": "loading"}), 503, {"Retry-After": str(DATA_RETRY_AFTER)}
+    return jsonify({"status": "failed"}), 503
+
+
+# --- API Route for Appending New Transactions ---
+@app.route("/api/data/append", methods=["POST"])
+def handle_data_append():
+    """Appends delta CSVs (paths on this server) to the live data.
+
+    Body: {"transactions": path, "items": path, "persist": bool}; requires
+    "Authorization: Bearer <MEX_ADMIN_TOKEN>". With persist, the rows are also
+    appended to the source CSVs and the data cache is rewritten.
+    """
+    global datasets
+
+    if not admin_token:
+        return jsonify({"error": "Data appends are disabled (MEX_ADMIN_TOKEN not set)."}), 403
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode("utf-8"), admin_token.encode("utf-8")):
+        return jsonify({"error": "Invalid admin token."}), 401
+    if not data_loaded_successfully or datasets is None:
+        return data_unavailable()
+    if shared_data_enabled():
+        # Each worker would only update its own copy
+        return jsonify({"error": "Live appends are unavailable in shared mode; use `python data_append.py --persist` and restart the workers."}), 409
+    if isinstance(datasets, AnalysisBackend):
+        return jsonify({"error": f"Live appends are unavailable with the {datasets.name} backend; use `python data_append.py --persist` and restart."}), 409
+
+    req_data = request.get_json(silent=True) or {}
+    transactions_path, items_path = req_data.get("transactions"), req_data.get("items")
+    if not transactions_path and not items_path:
+        return jsonify({"error": "Give a 'transactions' and/or 'items' CSV path."}), 400
+
+    with append_lock:
+        try:
+            new_datasets, append_report = append_rows(datasets, read_delta(transactions_path, items_path))
+        except (OSError, ValueError) as e:
+            print(f"App ❌: Data append failed: {e}")
+            return jsonify({"error": f"Could not append data: {e}"}), 400
+        datasets = new_datasets  # requests that already read the old Dataset keep using it
+        print(
+            f"App ✅: Appended {append_report['transaction_data']:,} transaction(s) and "
+            f"{append_report['transaction_items']:,} item row(s) in {append_report['seconds']:.3f}s: {new_datasets!r}."
+        )
+        if req_data.get("persist"):
+            append_report["persisted"] = persist_delta(new_datasets, transactions_path, items_path)
+    return jsonify(append_report)
+
+
 # --- Flask run ---
 if __name__ == "__main__":
     print("\n--- Starting Application ---")
-    # Perform checks before starting the server
-    if not data_loaded_successfully:
+    # Perform checks before starting the server (data still loading in the background is fine)
+    if data_ready.is_set() and not data_loaded_successfully:
         # Log message in English
         print("App ❌: Cannot start Flask server because initial data loading failed.")
     elif not openai_configured:
@@ -443,7 +846,10 @@ if __name__ == "__main__":
     # No longer enforcing secret_key check as startup condition (as it's not used for chat history)
     else:
         # Log message in English
-        print("App ✅: Pre-flight checks passed (Data and OpenAI configured).")
+        if data_ready.is_set():
+            print("App ✅: Pre-flight checks passed (Data and OpenAI configured).")
+        else:
+            print("App ✅: Pre-flight checks passed (OpenAI configured; data is loading in the background, see /readyz).")
         # highlight-start
         # Log message in English
         print("App ℹ️: Conversation history is managed by frontend (stateless backend).")
@@ -5,32 +5,13 @@ import openai
 from dotenv import load_dotenv
 from flask import Flask, render_template, request, jsonify
 import traceback
-import re
 
-# Import functions (might be unused, keep for structure)
-from data_utils import load_provided_data
+# The demo replies are scripted, so it loads no data and starts at once
+from intent_router import parse_time_period  # shared with app.py
 
 # --- Load Environment Variables ---
 load_dotenv()
 
-# --- Initialize Data (Keep for structure) ---
-datasets = None
-data_loaded_successfully = False
-try:
-    print("App_Demo: Attempting to load data via data_utils...")
-    datasets = load_provided_data()
-    if datasets:
-        data_loaded_successfully = True
-        print("App_Demo ✅: Data loaded successfully via data_utils.")
-    else:
-        data_loaded_successfully = False
-        print("App_Demo ❌: Data loading failed.")
-except Exception as e:
-    print(f"App_Demo ❌: Critical error during initial data load call: {e}")
-    traceback.print_exc()
-    data_loaded_successfully = False
-    datasets = None
-
 # --- Flask App Setup ---
 app = Flask(__name__)
 
@@ -60,33 +41,6 @@ except Exception as e:
     openai_configured = False
 
 
-# --- Helper Function (Keep for structure) ---
-def parse_time_period(user_message_lower):
-    if re.search(r"last 3 months|past 90 days", user_message_lower):
-        return "last_90_days"
-    if re.search(r"last month|past 30 days", user_message_lower):
-        return "last_30_days"
-    if re.search(r"last week|past 7 days", user_message_lower):
-        return "last_7_days"
-    if any(
-        k in user_message_lower
-        for k in [
-            "recommend",
-            "suggestion",
-            "what to sell",
-            "startup",
-            "new merchant",
-            "regional",
-            "area",
-            "profit",
-            "earnings",
-            "cuisine",
-        ]
-    ):
-        return "last_90_days"
-    return "last_30_days"
-
-
 # --- Page Routes (Keep) ---
 @app.route("/")
 def home():
@@ -98,6 +52,17 @@ def chat_page():
     return render_template("chat.html", request=request)
 
 
+# --- Health Checks (same endpoints as app.py; the demo has no data to wait for) ---
+@app.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    return jsonify({"status": "ready", "openai_configured": openai_configured})
+
+
 # --- API Route for LLM Interaction (DEMO VERSION - Sequential Responses - CORRECTED) ---
 print(
     "--- Flask (Demo Version - Sequential Corrected) is attempting to define the /api/interact-llm route NOW ---"
@@ -107,11 +72,9 @@ print(
 @app.route("/api/interact-llm", methods=["POST"])
 def handle_llm_interaction():
     # Keep prerequisite checks
-    global datasets, data_loaded_successfully, openai_configured
+    global openai_configured
     if not openai_configured:
         return jsonify({"error": "OpenAI API Key not configured."}), 500
-    if not data_loaded_successfully or datasets is None:
-        return jsonify({"error": "Server data is not available."}), 500
 
     try:
         req_data = request.get_json()
@@ -245,8 +208,6 @@ if __name__ == "__main__":
     print(
         "\n--- Starting SEQUENTIAL DEMO Application (app_demo.py - Corrected Logic) ---"
     )  # Indicate corrected logic
-    if not data_loaded_successfully:
-        print("App_Demo ⚠️: Data loading failed, proceeding.")
     if not openai_configured:
         print("App_Demo ⚠️: OpenAI Key not configured, proceeding.")
 
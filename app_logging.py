@@ -0,0 +1,162 @@
+# app_logging.py
+"""Leveled, sampled logging that writes off the request thread.
+
+    from app_logging import get_logger
+    log = get_logger("analysis")
+    log.debug("[%s] Found %d items: %s", name, len(items), items)
+
+Messages are %-style with arguments, so nothing is formatted when the level
+is disabled. Enabled records go onto an in-process queue; one listener
+thread per process formats them (including the arguments) and writes one
+line each to stdout, tagged with the process id, so workers do not
+interleave mid-line. Do not log objects you mutate afterwards.
+
+Settings:
+  MEX_LOG_LEVEL    DEBUG, INFO (default), WARNING or ERROR; a
+                   comma-separated "category=LEVEL" list sets single
+                   categories, e.g. "INFO,analysis=DEBUG"
+  MEX_LOG_SAMPLE   fraction of DEBUG/INFO records kept per category, e.g.
+                   "analysis=0.01,app.context=0.1"; warnings and errors are
+                   always kept
+  MEX_LOG_FORMAT   "text" (default) or "json" (one object per line)
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+
+ROOT = "mex"
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s [%(category)s] pid=%(process)d %(message)s"
+
+_handler = None
+_listener = None
+
+
+def _parse_setting(value, convert):
+    """(default, {category: value}) from "default,category=value,..."."""
+    default, per_category = None, {}
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "=" in part:
+            category, _, setting = part.partition("=")
+            per_category[category.strip()] = convert(setting.strip())
+        else:
+            default = convert(part)
+    return default, per_category
+
+
+def _level(name):
+    level = logging.getLevelName(name.upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {name}")
+    return level
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of a category's DEBUG/INFO records (the longest matching category prefix wins)."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = dict(rates)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        category = record.name[len(ROOT) + 1:]
+        while True:
+            rate = self.rates.get(category)
+            if rate is not None:
+                return rate >= 1 or random.random() < rate
+            if "." not in category:
+                return True
+            category = category.rsplit(".", 1)[0]
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """Queues the record as it is: the message is formatted by the listener, not the caller."""
+
+    def prepare(self, record):
+        return record
+
+
+class _CategoryFormatter(logging.Formatter):
+    def format(self, record):
+        record.category = record.name[len(ROOT) + 1:] or ROOT
+        return super().format(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, category, pid, message (and the exception)."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "category": record.name[len(ROOT) + 1:] or ROOT,
+            "pid": record.process,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _start_listener():
+    """A new queue and listener thread for this process (also after a fork, which loses threads)."""
+    global _listener
+    stream = logging.StreamHandler(sys.stdout)
+    if os.getenv("MEX_LOG_FORMAT", "text").strip().lower() == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(_CategoryFormatter(TEXT_FORMAT))
+    _handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(_handler.queue, stream)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()  # writes what is still queued
+
+
+def configure_logging():
+    """Sets up the "mex" loggers from the environment. Later calls only re-read
+    the levels and sampling rates (app.py calls it again once .env is loaded)."""
+    global _handler
+    root = logging.getLogger(ROOT)
+    try:
+        default_level, levels = _parse_setting(os.getenv("MEX_LOG_LEVEL", "INFO"), _level)
+        _, rates = _parse_setting(os.getenv("MEX_LOG_SAMPLE", ""), float)
+    except ValueError as e:
+        print(f"Logging ⚠️: Ignoring invalid MEX_LOG_LEVEL/MEX_LOG_SAMPLE ({e}).")
+        default_level, levels, rates = logging.INFO, {}, {}
+    root.setLevel(default_level or logging.INFO)
+    for category, level in levels.items():
+        logging.getLogger(f"{ROOT}.{category}").setLevel(level)
+    if _handler is not None:
+        for log_filter in _handler.filters:
+            if isinstance(log_filter, SamplingFilter):
+                log_filter.rates = dict(rates)
+        return
+
+    root.propagate = False
+    _handler = _LazyQueueHandler(queue.SimpleQueue())
+    _handler.addFilter(SamplingFilter(rates))
+    root.addHandler(_handler)
+    _start_listener()
+    atexit.register(_stop_listener)
+    # gunicorn forks its workers after app.py is imported; each needs its own listener thread
+    os.register_at_fork(after_in_child=_start_listener)
+
+
+def get_logger(category):
+    """The logger for a category ("analysis", "app", "app.context", ...)."""
+    if _handler is None:
+        configure_logging()
+    return logging.getLogger(f"{ROOT}.{category}")
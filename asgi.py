@@ -0,0 +1,209 @@
+# asgi.py
+"""Async serving mode: `uvicorn asgi:app` (see README, "Running the Live Version").
+
+The two chat routes are served natively on the event loop with an AsyncOpenAI
+client, so a request waiting on OpenAI holds no thread and one process can keep
+hundreds of chats in flight. Everything else (pages, static files, data
+appends) is passed to the Flask app in app.py through a WSGI thread pool.
+"""
+import json
+import asyncio
+import functools
+
+from uvicorn.middleware.wsgi import WSGIMiddleware
+
+import app as live
+from app_logging import get_logger
+from llm_client import acomplete, astream, make_async_client
+from metrics import record_error, server_timing_enabled, span, start_trace
+from profiling import PROFILE_HEADER, request_profile, run_profiled
+
+CHAT_ROUTES = ("/api/interact-llm", "/api/interact-llm/stream")
+JSON_HEADERS = [(b"content-type", b"application/json")]
+SSE_HEADERS = [
+    (b"content-type", b"text/event-stream; charset=utf-8"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+]
+log = get_logger("asgi")
+
+
+async def read_body(receive):
+    """The whole request body, or None if the client disconnected first."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def send_json(send, payload, status=200, headers=None):
+    extra = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in (headers or {}).items()]
+    await send({"type": "http.response.start", "status": status, "headers": JSON_HEADERS + extra})
+    await send({"type": "http.response.body", "body": json.dumps(payload, ensure_ascii=False).encode("utf-8")})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+class AsyncChatApp:
+    """ASGI app: chat routes on the event loop, the rest through Flask."""
+
+    def __init__(self, flask_app):
+        self.fallback = WSGIMiddleware(flask_app)
+        self.client = None  # created on first use, inside the server's event loop
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in CHAT_ROUTES:
+            await self.chat(scope, receive, send)
+        else:
+            await self.fallback(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.client is not None:
+                    await self.client.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def chat(self, scope, receive, send):
+        """Serves a chat route, traced like the Flask ones (metrics.py): the
+        trace ends with the response, and Server-Timing is added to its headers."""
+        trace = start_trace(scope["path"])
+        status = 500
+
+        async def traced_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if server_timing_enabled():
+                    timing = (b"server-timing", trace.server_timing().encode("latin-1"))
+                    message = {**message, "headers": [*message["headers"], timing]}
+            await send(message)
+
+        try:
+            await self.answer(scope, receive, traced_send)
+        finally:
+            trace.finish(status)
+
+    async def answer(self, scope, receive, send):
+        # Same checks and responses as the Flask routes in app.py
+        if not live.openai_configured:
+            return await send_json(send, {"error": "OpenAI API Key not configured."}, 500)
+        dataset = live.datasets
+        if not live.data_loaded_successfully or dataset is None:
+            return await send_json(send, *live.data_unavailable())
+
+        body = await read_body(receive)
+        if body is None:
+            return
+        with span("parse"):
+            try:
+                req_data = json.loads(body) if body else None
+            except ValueError:
+                req_data = None
+            # The session store may be a SQLite file (reads also touch the row); keep it off the event loop
+            client_history, conversation_id, history_error = await asyncio.to_thread(live.resolve_client_history, req_data)
+        if history_error:
+            return await send_json(send, {"error": history_error[0]}, history_error[1])
+        client_addr = (scope.get("client") or ("?",))[0]
+        # Opt-in profile (profiling.py) of the CPU work below; the OpenAI call is only awaited here
+        profile_header = dict(scope["headers"]).get(PROFILE_HEADER.lower().encode("latin-1"), b"").decode("latin-1")
+        profile = request_profile(scope["path"], profile_header)
+        try:
+            # Intent matching and analyses are CPU work; keep them off the event loop
+            messages, compaction = await asyncio.to_thread(
+                run_profiled, profile, live.build_llm_messages, client_history, dataset, client_addr
+            )
+        except Exception as e:
+            log.exception("An unexpected error occurred in %s: %s", scope["path"], e)
+            return await send_json(send, {"error": "处理您的请求时服务器发生意外错误。"}, 500)
+
+        # Fields every successful reply carries; on_reply stores the session turn (run it off the loop)
+        reply_fields = {"compaction": compaction}
+        if conversation_id:
+            reply_fields["conversation_id"] = conversation_id
+        on_reply = functools.partial(live.remember_turn, conversation_id, client_history)
+
+        cache_control = dict(scope["headers"]).get(b"cache-control", b"").decode("latin-1")
+        cache_key = live.completion_cache_key(req_data, cache_control, messages)
+        # A persisted completion cache (MEX_LLM_CACHE_PATH) reads and writes a SQLite file; keep it off the loop
+        cached_reply = await asyncio.to_thread(live.cached_completion, cache_key)
+        if cached_reply is not None:
+            log.info("LLM Reply served from the completion cache.")
+            await asyncio.to_thread(on_reply, cached_reply)
+            return await self.cached_reply(scope, cached_reply, reply_fields, send)
+
+        if self.client is None:
+            self.client = make_async_client()
+        if scope["path"].endswith("/stream"):
+            await self.stream_reply(messages, cache_key, reply_fields, on_reply, receive, send)
+        else:
+            await self.json_reply(messages, cache_key, reply_fields, on_reply, send)
+
+    async def cached_reply(self, scope, reply, reply_fields, send):
+        if not scope["path"].endswith("/stream"):
+            return await send_json(send, {"reply": reply, "cached": True, **reply_fields})
+        await send({"type": "http.response.start", "status": 200, "headers": SSE_HEADERS})
+        done = {"reply": reply, "cached": True, **reply_fields}
+        events = live.sse_event("delta", {"text": reply}) + live.sse_event("done", done)
+        await send({"type": "http.response.body", "body": events.encode("utf-8")})
+
+    async def json_reply(self, messages, cache_key, reply_fields, on_reply, send):
+        try:
+            with span("openai"):
+                reply = await acomplete(self.client, messages, live.LLM_MODEL, live.LLM_TEMPERATURE)
+            log.info("LLM Reply received successfully.")
+            live.record_completion_tokens(reply_fields["compaction"], reply)
+            if cache_key and reply:
+                await asyncio.to_thread(live.completion_cache.put, cache_key, reply)
+            await asyncio.to_thread(on_reply, reply)
+        except Exception as e:
+            log.error("OpenAI API call failed: %s", e)
+            record_error("openai")
+            reply = live.LLM_ERROR_REPLY
+        await send_json(send, {"reply": reply, **reply_fields})
+
+    async def stream_reply(self, messages, cache_key, reply_fields, on_reply, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": SSE_HEADERS})
+
+        async def forward():
+            parts = []
+            try:
+                with span("openai"):
+                    async for text in astream(self.client, messages, live.LLM_MODEL, live.LLM_TEMPERATURE):
+                        parts.append(text)
+                        await send({"type": "http.response.body", "body": live.sse_event("delta", {"text": text}).encode("utf-8"), "more_body": True})
+            except Exception as e:
+                log.error("OpenAI streaming call failed: %s", e)
+                record_error("openai")
+                final = live.sse_event("error", {"error": live.LLM_ERROR_REPLY})
+            else:
+                reply = "".join(parts).strip()
+                live.record_completion_tokens(reply_fields["compaction"], reply)
+                if cache_key and reply:
+                    await asyncio.to_thread(live.completion_cache.put, cache_key, reply)
+                await asyncio.to_thread(on_reply, reply)
+                final = live.sse_event("done", {"reply": reply, **reply_fields})
+            await send({"type": "http.response.body", "body": final.encode("utf-8")})
+
+        # Stop reading from OpenAI as soon as the browser goes away
+        forwarding = asyncio.ensure_future(forward())
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        await asyncio.wait({forwarding, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        for task in (forwarding, disconnected):
+            task.cancel()
+
+
+app = AsyncChatApp(live.app)
@@ -0,0 +1,368 @@
+# batch_report.py
+import os
+import copy
+import time
+import traceback
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from analysis_backend import same_result
+from data_cache import read_store_manifest, read_store_tables, write_store
+from data_index import (
+    OrderItemsIndex,
+    city_cuisine_orders,
+    day_number,
+    day_numbers,
+    merchant_keys,
+    order_item_pairs,
+)
+from dataset import REQUIRED_COLUMNS, Dataset, as_dataset
+
+# Bump when the layout of the report tables changes
+REPORT_STORE_VERSION = 1
+REPORT_DIR_NAME = '.reports'
+DEFAULT_WINDOWS = (7, 30, 90)
+DEFAULT_TOP_N = 5
+TOP_CUISINES = 5
+
+# Inputs with at least this many transactions are split across a process pool
+SHARD_MIN_ROWS = int(os.getenv('MEX_BATCH_SHARD_ROWS', '1000000'))
+
+
+def default_report_dir(data_dir):
+    """Reports live next to the CSVs unless MEX_REPORT_STORE overrides it."""
+    return os.getenv('MEX_REPORT_STORE') or os.path.join(data_dir, REPORT_DIR_NAME)
+
+
+def _id_codes(series):
+    """Integer code per row as float64, NaN for missing (so nunique skips it)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+    else:
+        codes, _ = pd.factorize(series, sort=False)
+    return np.where(codes < 0, np.nan, codes.astype(np.float64))
+
+
+# --- Vectorised Engine ---
+def _merchant_reports(sales_rows, pairs, windows, top_n):
+    """Sales and top/bottom item rankings of every merchant in one shard.
+
+    Args:
+        sales_rows (DataFrame): integer 'merchant', 'day', float 'value', 'order'
+            [and 'customer'] per transaction.
+        pairs (DataFrame): order_item_pairs output for the same merchants.
+        windows (dict): window length in days -> first day number of the window.
+    Returns:
+        tuple: (sales DataFrame, items DataFrame), keyed by integer merchant/item.
+    """
+    sales_frames, item_frames = [], []
+    for days, start_day in windows.items():
+        rows = sales_rows[sales_rows['day'] >= start_day]
+        aggregations = {'total_sales': ('value', 'sum'), 'order_count': ('order', 'nunique')}
+        if 'customer' in rows.columns:
+            aggregations['unique_customers'] = ('customer', 'nunique')
+        sales = rows.groupby('merchant', sort=True).agg(**aggregations).reset_index()
+        sales['days'] = days
+        sales_frames.append(sales)
+
+        counts = (
+            pairs[pairs['day'] >= start_day]
+            .groupby(['merchant', 'item'], sort=True)
+            .size()
+            .reset_index(name='unique_order_count')
+        )
+        for direction, ascending in (('top', False), ('bottom', True)):
+            # Item keys are in ID order, so the last sort key breaks ties like the live analyses
+            ranked = counts.sort_values(
+                ['merchant', 'unique_order_count', 'item'], ascending=[True, ascending, True], kind='stable'
+            )
+            ranked = ranked.groupby('merchant', sort=False).head(top_n).copy()
+            ranked['rank'] = ranked.groupby('merchant', sort=False).cumcount() + 1
+            ranked['direction'] = direction
+            ranked['days'] = days
+            item_frames.append(ranked)
+    return pd.concat(sales_frames, ignore_index=True), pd.concat(item_frames, ignore_index=True)
+
+
+def _sharded_merchant_reports(sales_rows, pairs, windows, top_n, workers):
+    """Runs _merchant_reports per merchant shard in a process pool."""
+    shards = [
+        (sales_rows[sales_rows['merchant'] % workers == shard], pairs[pairs['merchant'] % workers == shard])
+        for shard in range(workers)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_merchant_reports, s, p, windows, top_n) for s, p in shards]
+        results = [future.result() for future in futures]
+    return (
+        pd.concat([sales for sales, _ in results], ignore_index=True),
+        pd.concat([items for _, items in results], ignore_index=True),
+    )
+
+
+def _city_reports(orders, windows):
+    """Top cuisines per city and window from city_cuisine_orders output."""
+    frames = []
+    for days, start_day in windows.items():
+        counts = (
+            orders[orders['day'] >= start_day]
+            .groupby(['city', 'cuisine'], sort=True)
+            .size()
+            .reset_index(name='unique_order_count')
+        )
+        ranked = counts.sort_values(
+            ['city', 'unique_order_count', 'cuisine'], ascending=[True, False, True], kind='stable'
+        )
+        ranked = ranked.groupby('city', sort=False).head(TOP_CUISINES).copy()
+        ranked['rank'] = ranked.groupby('city', sort=False).cumcount() + 1
+        ranked['days'] = days
+        frames.append(ranked)
+    return pd.concat(frames, ignore_index=True)
+
+
+def compute_reports(datasets, windows=DEFAULT_WINDOWS, top_n=DEFAULT_TOP_N, workers=None):
+    """Computes the chat answers for every merchant and city in one pass per window.
+
+    Sales summaries, top/bottom items and city cuisine rankings come from a few
+    groupbys over the whole tables instead of one filter per merchant. Inputs of
+    SHARD_MIN_ROWS transactions or more are split by merchant across a process
+    pool (workers, default os.cpu_count()).
+
+    Returns:
+        tuple: (dict of report DataFrames 'sales', 'items', 'cuisines', metadata dict)
+    """
+    datasets = as_dataset(datasets)
+    started = time.perf_counter()
+    td_df = datasets.transactions
+    ti_df = datasets.transaction_items
+    latest = datasets.latest_timestamp
+    if pd.isna(latest):
+        raise ValueError("transaction_data has no timestamps; nothing to report.")
+    last_day = day_number(latest)
+    window_starts = {int(days): last_day - (int(days) - 1) for days in windows}
+
+    # Integer-keyed inputs shared by every window
+    row_merchants, merchant_labels = merchant_keys(td_df['merchant_id'])
+    sales_rows = pd.DataFrame({
+        'merchant': row_merchants,
+        'day': day_numbers(td_df['order_time_dt']),
+        'value': td_df['order_value'].to_numpy(),
+        'order': _id_codes(td_df['order_id']),
+    })
+    if 'eater_id' in td_df.columns:
+        sales_rows['customer'] = _id_codes(td_df['eater_id'])
+    sales_rows = sales_rows[sales_rows['merchant'] >= 0]
+    order_items = datasets.index('order_items')
+    if order_items is None or not order_items.covers(ti_df):
+        order_items = OrderItemsIndex(ti_df)
+    pairs, item_labels, pair_merchant_labels = order_item_pairs(td_df, ti_df, order_items)
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(td_df) >= SHARD_MIN_ROWS:
+        sales, items = _sharded_merchant_reports(sales_rows, pairs, window_starts, top_n, workers)
+    else:
+        workers = 1
+        sales, items = _merchant_reports(sales_rows, pairs, window_starts, top_n)
+    orders, city_labels, cuisine_labels = city_cuisine_orders(
+        pairs, item_labels, pair_merchant_labels, datasets.merchants, datasets.menu_items
+    )
+    cuisines = _city_reports(orders, window_starts)
+
+    # Integer keys -> ID strings (and item names) for the store
+    names = (
+        datasets.menu_items[['item_id', 'item_name']]
+        .dropna(subset=['item_id'])
+        .drop_duplicates(subset=['item_id'])
+    )
+    names = dict(zip(names['item_id'].astype(str), names['item_name']))
+    merchant_ids = np.asarray(merchant_labels, dtype=object).astype(str)
+    item_ids = np.asarray(item_labels, dtype=object).astype(str)
+    sales.insert(0, 'merchant_id', merchant_ids[sales.pop('merchant').to_numpy()])
+    sales['order_count'] = sales['order_count'].astype(np.int64)
+    items.insert(0, 'merchant_id', merchant_ids[items.pop('merchant').to_numpy()])
+    items.insert(1, 'item_id', item_ids[items.pop('item').to_numpy()])
+    items['item_name'] = pd.Series([names.get(i, np.nan) for i in items['item_id']], index=items.index, dtype=object)
+    cuisines.insert(0, 'city_id', np.asarray(city_labels, dtype=object)[cuisines.pop('city').to_numpy()])
+    cuisines.insert(1, 'cuisine_tag', np.asarray(cuisine_labels, dtype=object)[cuisines.pop('cuisine').to_numpy()])
+    for frame in (sales, items, cuisines):
+        frame.reset_index(drop=True, inplace=True)
+
+    meta = {
+        'report_version': REPORT_STORE_VERSION,
+        'dataset': {
+            'row_counts': dict(datasets.row_counts),
+            'latest_timestamp': str(latest),
+        },
+        'windows': {
+            str(days): {
+                'start_date': (latest.normalize() - pd.Timedelta(days=days - 1)).strftime('%Y-%m-%d'),
+                'end_date': latest.strftime('%Y-%m-%d'),
+            }
+            for days in window_starts
+        },
+        'top_n': int(top_n),
+        'workers': workers,
+        'seconds': time.perf_counter() - started,
+    }
+    return {'sales': sales, 'items': items, 'cuisines': cuisines}, meta
+
+
+def write_reports(store_dir, reports, meta):
+    """Writes the report tables as a columnar store (see data_cache.write_store)."""
+    write_store(store_dir, reports, meta)
+
+
+# --- Reading Precomputed Answers ---
+class ReportStore:
+    """Precomputed answers loaded from a report store, looked up by ID and window.
+
+    Lookups return the same values as the live analyses (fresh copies), so the
+    chat endpoint can use either interchangeably. Check covers() first: a
+    store only answers for the dataset and windows it was computed from.
+    """
+
+    def __init__(self, tables, meta):
+        self.meta = meta
+        self.windows = {int(days): bounds for days, bounds in meta['windows'].items()}
+        self.top_n = meta['top_n']
+
+        self._sales = {}
+        sales = tables['sales']
+        has_customers = 'unique_customers' in sales.columns
+        for row in sales.itertuples(index=False):
+            bounds = self.windows[row.days]
+            result = {
+                'total_sales': float(row.total_sales),
+                'order_count': int(row.order_count),
+                'start_date': bounds['start_date'],
+                'end_date': bounds['end_date'],
+                'period_analyzed': f"last_{row.days}_days",
+            }
+            if has_customers:
+                result['unique_customers'] = int(row.unique_customers)
+            self._sales[(row.merchant_id, int(row.days))] = result
+
+        self._items = {}
+        for row in tables['items'].sort_values('rank', kind='stable').itertuples(index=False):
+            self._items.setdefault((row.merchant_id, int(row.days), row.direction), []).append({
+                'item_id': row.item_id,
+                'unique_order_count': int(row.unique_order_count),
+                'item_name': row.item_name if pd.notna(row.item_name) else f"Unknown Item (ID: {row.item_id})",
+            })
+
+        self._cuisines = {}
+        for row in tables['cuisines'].sort_values('rank', kind='stable').itertuples(index=False):
+            self._cuisines.setdefault((row.city_id, int(row.days)), []).append(row.cuisine_tag)
+
+    @classmethod
+    def load(cls, store_dir):
+        """Loads a report store, or returns None if there is none (or it is unreadable)."""
+        try:
+            manifest = read_store_manifest(store_dir)
+            if manifest is None or manifest.get('report_version') != REPORT_STORE_VERSION:
+                return None
+            return cls(read_store_tables(store_dir, manifest), manifest)
+        except Exception as e:
+            print(f"Batch Report ⚠️: Could not read report store at '{store_dir}': {e}")
+            return None
+
+    def covers(self, datasets, days, top_n=DEFAULT_TOP_N):
+        """True if the store was computed from this dataset, for this window and top N."""
+        if not isinstance(datasets, Dataset) or days not in self.windows or top_n > self.top_n:
+            return False
+        source = self.meta['dataset']
+        # Only the tables the answers come from (stores written before keywords.csv
+        # became lazily loaded also count its rows)
+        counts = lambda row_counts: {t: n for t, n in row_counts.items() if t in REQUIRED_COLUMNS}
+        return (
+            counts(source['row_counts']) == counts(datasets.row_counts)
+            and source['latest_timestamp'] == str(datasets.latest_timestamp)
+        )
+
+    def sales_summary(self, merchant_id, days):
+        """As get_sales_summary(merchant_id, datasets, f"last_{days}_days")."""
+        return copy.deepcopy(self._sales.get((str(merchant_id), days)))
+
+    def ranked_items(self, merchant_id, days, top_n=DEFAULT_TOP_N, ascending=False):
+        """As get_popular_items_by_frequency / get_low_performing_items (ascending)."""
+        ranked = self._items.get((str(merchant_id), days, 'bottom' if ascending else 'top'))
+        return copy.deepcopy(ranked[:top_n]) if ranked else None
+
+    def cuisines(self, city_id, days):
+        """As get_popular_cuisines_in_city(city_id, datasets, days)."""
+        ranked = self._cuisines.get((str(city_id), days))
+        return list(ranked) if ranked else None
+
+    def merchant_context(self, merchant_id, facts, days, datasets, top_n=DEFAULT_TOP_N, city_id=None):
+        """As analysis.build_merchant_context, answered from the store."""
+        context = {}
+        if 'sales_summary' in facts:
+            context['sales_summary'] = self.sales_summary(merchant_id, days)
+        if 'top_items' in facts:
+            context['top_items'] = self.ranked_items(merchant_id, days, top_n)
+        if 'bottom_items' in facts:
+            context['bottom_items'] = self.ranked_items(merchant_id, days, top_n, ascending=True)
+        if 'cuisines' in facts:
+            city = city_id if city_id is not None else datasets.city_of(merchant_id)
+            context['cuisines'] = self.cuisines(city, days) if city is not None else None
+        return context
+
+
+def verify_reports(store, datasets, sample=None):
+    """Compares stored answers with the live analyses for (a sample of) merchants.
+
+    Returns:
+        list: (merchant_id, days, fact, stored, live) for every difference.
+    """
+    from analysis import CONTEXT_FACTS, build_merchant_context
+
+    merchants = list(datasets.merchant_ids)
+    if sample is not None and sample < len(merchants):
+        merchants = list(np.random.default_rng(0).choice(merchants, size=sample, replace=False))
+    differences = []
+    for days in sorted(store.windows):
+        for merchant_id in merchants:
+            stored = store.merchant_context(merchant_id, CONTEXT_FACTS, days, datasets, store.top_n)
+            live = build_merchant_context(merchant_id, datasets, frozenset(CONTEXT_FACTS), days=days, top_n=store.top_n)
+            for fact in CONTEXT_FACTS:
+                if not same_result(stored[fact], live[fact]):
+                    differences.append((merchant_id, days, fact, stored[fact], live[fact]))
+    return differences
+
+
+# --- CLI: precompute answers for all merchants ---
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+    from data_utils import DATA_DIR, load_provided_data
+
+    parser = argparse.ArgumentParser(description="Precompute sales, item and cuisine answers for every merchant.")
+    parser.add_argument('--out', default=None, help=f"Store directory (default {default_report_dir(DATA_DIR)}).")
+    parser.add_argument('--days', type=int, nargs='+', default=list(DEFAULT_WINDOWS), help="Window lengths in days.")
+    parser.add_argument('--top-n', type=int, default=DEFAULT_TOP_N)
+    parser.add_argument('--workers', type=int, default=None, help="Process pool size for large inputs.")
+    parser.add_argument('--verify', type=int, default=0, metavar='N', help="Check N random merchants against the live analyses.")
+    args = parser.parse_args()
+
+    dataset = load_provided_data()
+    if dataset is None:
+        raise SystemExit("Batch Report ❌: Data loading failed.")
+    out_dir = args.out or default_report_dir(DATA_DIR)
+    try:
+        report_tables, report_meta = compute_reports(dataset, args.days, args.top_n, args.workers)
+        write_reports(out_dir, report_tables, report_meta)
+    except Exception as e:
+        traceback.print_exc()
+        raise SystemExit(f"Batch Report ❌: {e}")
+    print(
+        f"Batch Report ✅: {len(report_tables['sales']):,} sales rows, {len(report_tables['items']):,} item rows, "
+        f"{len(report_tables['cuisines']):,} cuisine rows for windows {sorted(report_meta['windows'], key=int)} "
+        f"in {report_meta['seconds']:.2f}s ({report_meta['workers']} worker(s)); wrote '{out_dir}'."
+    )
+    if args.verify:
+        with contextlib.redirect_stdout(io.StringIO()):
+            mismatches = verify_reports(ReportStore.load(out_dir), dataset, sample=args.verify)
+        for mismatch in mismatches[:10]:
+            print(f"Batch Report ⚠️: mismatch {mismatch}")
+        print(f"Batch Report: verified {args.verify} merchant(s) per window, {len(mismatches)} mismatch(es).")
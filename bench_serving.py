@@ -0,0 +1,214 @@
+# bench_serving.py
+"""Benchmarks concurrent chats against the threaded Flask server and asgi.py, offline.
+
+Both servers are pointed (via OPENAI_BASE_URL) at a fake OpenAI-compatible
+completion server started by this script, which answers after a fixed delay,
+so the numbers measure how each serving mode copes with slow LLM calls.
+
+    python bench_serving.py --concurrency 50 200 --requests 400
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import subprocess
+
+import httpx
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+QUESTION = "How were my sales last week?"
+FAKE_REPLY_WORDS = ("Your sales " * 10).split()
+
+TARGETS = {
+    # The current development path: `app.run(debug=True)` (threaded), minus the reloader
+    'flask': [sys.executable, '-c', "import app; app.app.run(port={port}, debug=True, use_reloader=False)"],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--app-dir', HERE, '--port', '{port}', '--log-level', 'warning'],
+}
+
+
+# --- Fake completion server (an ASGI app run by uvicorn) ---
+def fake_llm_app(first_token_delay, token_delay):
+    async def app(scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        request = json.loads(body or b'{}')
+        base = {'id': 'chatcmpl-bench', 'created': int(time.time()), 'model': request.get('model', 'fake')}
+        await asyncio.sleep(first_token_delay)
+        if request.get('stream'):
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'text/event-stream')]})
+            for word in FAKE_REPLY_WORDS:
+                chunk = dict(base, object='chat.completion.chunk', choices=[{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None}])
+                await send({'type': 'http.response.body', 'body': f"data: {json.dumps(chunk)}\n\n".encode(), 'more_body': True})
+                await asyncio.sleep(token_delay)
+            await send({'type': 'http.response.body', 'body': b"data: [DONE]\n\n"})
+        else:
+            await asyncio.sleep(token_delay * len(FAKE_REPLY_WORDS))
+            completion = dict(base, object='chat.completion', choices=[{
+                'index': 0, 'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': ' '.join(FAKE_REPLY_WORDS)},
+            }])
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/json')]})
+            await send({'type': 'http.response.body', 'body': json.dumps(completion).encode()})
+    return app
+
+
+def serve_fake_llm(port, first_token_delay, token_delay):
+    import uvicorn
+    uvicorn.run(fake_llm_app(first_token_delay, token_delay), port=port, log_level='warning', backlog=4096)
+
+
+# --- Load generator ---
+# A bare asyncio HTTP/1.1 client (one connection per chat): an HTTP library's
+# per-request overhead would cost more CPU than the servers under test.
+async def one_chat(host, port, path, stream):
+    """(seconds to first byte of the reply body, total seconds), or None on failure."""
+    body = json.dumps({'history': [{'role': 'user', 'content': QUESTION}]}).encode('utf-8')
+    head = (
+        f"POST {path} HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Type: application/json\r\n"
+        f"Accept: {'text/event-stream' if stream else 'application/json'}\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+    ).encode('ascii')
+    started = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(head + body)
+        await writer.drain()
+        status = (await reader.readline()).split()
+        while (await reader.readline()) not in (b'\r\n', b''):
+            pass
+        chunk = await reader.read(65536)
+        first = time.perf_counter() - started
+        while chunk:
+            chunk = await reader.read(65536)
+        writer.close()
+    except OSError:
+        return None
+    if len(status) < 2 or status[1] != b'200':
+        return None
+    return first, time.perf_counter() - started
+
+
+def thread_count(pid):
+    """Threads of a process (Linux only; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            return next(int(line.split()[1]) for line in status if line.startswith('Threads:'))
+    except (OSError, StopIteration):
+        return None
+
+
+async def run_load(host, port, concurrency, requests, stream, server_pid=None):
+    """`concurrency` chats in flight at a time, `requests` in total.
+
+    Returns (wall seconds, per-chat results, failures, peak server threads).
+    """
+    path = '/api/interact-llm/stream' if stream else '/api/interact-llm'
+    pending = iter(range(requests))
+    peak_threads = 0
+
+    async def user():
+        return [await one_chat(host, port, path, stream) for _ in pending]
+
+    async def watch_threads():
+        nonlocal peak_threads
+        while True:
+            peak_threads = max(peak_threads, thread_count(server_pid) or 0)
+            await asyncio.sleep(0.2)
+
+    watcher = asyncio.ensure_future(watch_threads())
+    started = time.perf_counter()
+    results = [r for batch in await asyncio.gather(*(user() for _ in range(concurrency))) for r in batch]
+    wall = time.perf_counter() - started
+    watcher.cancel()
+    done = [r for r in results if r is not None]
+    return wall, done, len(results) - len(done), peak_threads
+
+
+def wait_until_up(base_url, process, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Bench ❌: server exited with code {process.returncode}.")
+        try:
+            # Ready once the data is loaded (the server answers 503 on /readyz until then)
+            if httpx.get(base_url + '/readyz', timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"Bench ❌: server at {base_url} did not come up in {timeout}s.")
+
+
+def summarize(target, concurrency, wall, done, errors, peak_threads, stream):
+    totals = np.array([total for _, total in done]) if done else np.zeros(1)
+    firsts = np.array([first for first, _ in done]) if done else np.zeros(1)
+    line = (
+        f"{target:>5} c={concurrency:<4} ok={len(done):<5} err={errors:<4} {len(done) / wall:7.1f} req/s  "
+        f"latency p50={np.percentile(totals, 50):6.2f}s p95={np.percentile(totals, 95):6.2f}s max={totals.max():6.2f}s  "
+        f"threads={peak_threads or '?'}"
+    )
+    if stream:
+        line += f"  first byte p50={np.percentile(firsts, 50):5.2f}s p95={np.percentile(firsts, 95):5.2f}s"
+    print(line)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the Flask and ASGI serving modes against a fake LLM.")
+    parser.add_argument('--targets', nargs='+', default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 300])
+    parser.add_argument('--requests', type=int, default=None, help="Chats per run (default 2x the concurrency).")
+    parser.add_argument('--stream', action='store_true', help="Use the SSE route and also report time to first byte.")
+    parser.add_argument('--first-token-delay', type=float, default=1.0, help="Fake LLM delay before the first token (s).")
+    parser.add_argument('--token-delay', type=float, default=0.02, help="Fake LLM delay per token (s).")
+    parser.add_argument('--port', type=int, default=5100, help="Server port; the fake LLM uses port + 1.")
+    parser.add_argument('--serve-fake-llm', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_fake_llm:
+        serve_fake_llm(args.port, args.first_token_delay, args.token_delay)
+        raise SystemExit(0)
+
+    llm_port = args.port + 1
+    fake_llm = subprocess.Popen([
+        sys.executable, os.path.abspath(__file__), '--serve-fake-llm', '--port', str(llm_port),
+        '--first-token-delay', str(args.first_token_delay), '--token-delay', str(args.token_delay),
+    ])
+    # Servers run in the current directory, so they load the data from ./data as usual.
+    # Every chat asks the same QUESTION, so the completion cache is off: each one
+    # must wait for the (fake) model, or this would measure cache hits.
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [HERE, os.getenv('PYTHONPATH')])),
+        OPENAI_BASE_URL=f"http://127.0.0.1:{llm_port}/v1",
+        OPENAI_API_KEY='sk-bench',
+        MEX_LLM_CACHE='0',
+    )
+    try:
+        for target in args.targets:
+            command = [part.format(port=args.port) for part in TARGETS[target]]
+            server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                base_url = f"http://127.0.0.1:{args.port}"
+                wait_until_up(base_url, server)
+                asyncio.run(run_load('127.0.0.1', args.port, 1, 1, args.stream))  # warm up
+                for concurrency in args.concurrency:
+                    wall, done, errors, peak_threads = asyncio.run(run_load(
+                        '127.0.0.1', args.port, concurrency, args.requests or 2 * concurrency, args.stream, server.pid,
+                    ))
+                    summarize(target, concurrency, wall, done, errors, peak_threads, args.stream)
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        fake_llm.terminate()
+        fake_llm.wait()
@@ -0,0 +1,204 @@
+# completion_cache.py
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from env_flags import env_flag
+
+# Bounds for the in-memory cache; whichever is hit first triggers LRU eviction
+DEFAULT_MAX_ENTRIES = int(os.getenv('MEX_LLM_CACHE_ENTRIES', '2048'))
+DEFAULT_MAX_BYTES = int(float(os.getenv('MEX_LLM_CACHE_MB', '32')) * 1024 * 1024)
+DEFAULT_TTL = float(os.getenv('MEX_LLM_CACHE_TTL', str(24 * 3600)))
+# Only the latest messages of the conversation are part of the key
+DEFAULT_KEY_MESSAGES = int(os.getenv('MEX_LLM_CACHE_HISTORY', '6'))
+# The disk table is trimmed back to max_entries every this many writes
+PRUNE_EVERY = 256
+
+_whitespace = re.compile(r"\s+")
+
+
+def completion_cache_enabled():
+    """Completion caching is on by default; set MEX_LLM_CACHE=0 to always call the model."""
+    return env_flag('MEX_LLM_CACHE', True)
+
+
+def cache_requested(req_data, cache_control=None):
+    """Per-request opt-out: {"cache": false} in the body, or a no-cache/no-store Cache-Control header value."""
+    if isinstance(req_data, dict) and req_data.get('cache') is False:
+        return False
+    cache_control = (cache_control or '').lower()
+    return 'no-cache' not in cache_control and 'no-store' not in cache_control
+
+
+def _normalize(text):
+    return _whitespace.sub(' ', str(text or '')).strip()
+
+
+def completion_key(model, temperature, messages, key_messages=DEFAULT_KEY_MESSAGES):
+    """Hex digest identifying a completion request.
+
+    The system prompt (which embeds the data context, so new data gives new
+    keys) and the last `key_messages` conversation messages are compared with
+    whitespace collapsed. Leading assistant messages of that tail are dropped,
+    so the chat page's greeting does not split otherwise equal opening questions.
+    """
+    system = [m for m in messages if m.get('role') == 'system']
+    history = [m for m in messages if m.get('role') != 'system'][-key_messages:] if key_messages else []
+    while history and history[0].get('role') == 'assistant':
+        history = history[1:]
+    normalized = {
+        'model': model,
+        'temperature': round(float(temperature), 3),
+        'system': [_normalize(m.get('content')) for m in system],
+        'history': [[m.get('role'), _normalize(m.get('content'))] for m in history],
+    }
+    return hashlib.sha256(json.dumps(normalized, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """Thread-safe LRU of model replies by completion_key, with a TTL.
+
+    Bounded by entry count and bytes. With a `path`, entries are also written to
+    a SQLite file, so they survive restarts and are shared by worker processes;
+    memory misses fall through to it. The file is opened (and trimmed) on first
+    use in each process, so a connection is never carried across fork().
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL, path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()  # key -> (reply, stored_at, bytes)
+        self._lock = threading.Lock()
+        self._db = None  # (connection, pid), opened by _connection()
+        self._writes = 0
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _connection(self):
+        """This process's connection to the SQLite file (None without a path); call with the lock held."""
+        if self.path is None:
+            return None
+        if self._db is None or self._db[1] != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, reply TEXT NOT NULL, stored_at REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS completions_stored_at ON completions (stored_at)")
+            self._db = (db, os.getpid())
+            self._prune_disk(time.time())
+        return self._db[0]
+
+    def get(self, key):
+        """The cached reply, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self.ttl:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            db = self._connection()
+            if db is not None:
+                row = db.execute(
+                    "SELECT reply, stored_at FROM completions WHERE key = ? AND stored_at >= ?", (key, now - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    self._insert(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, reply):
+        now = time.time()
+        with self._lock:
+            self._insert(key, reply, now)
+            db = self._connection()
+            if db is not None:
+                db.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?)", (key, reply, now))
+                self._writes += 1
+                if self._writes % PRUNE_EVERY == 0:
+                    self._prune_disk(now)
+
+    def _insert(self, key, reply, stored_at):
+        size = len(reply.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (reply, stored_at, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def _remove(self, key):
+        self.bytes -= self._entries.pop(key)[2]
+
+    def prune(self):
+        """Drops expired entries, and on disk keeps only the newest max_entries rows."""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (_, stored_at, _) in self._entries.items() if now - stored_at > self.ttl]:
+                self._remove(key)
+                self.expirations += 1
+            if self._connection() is not None:
+                self._prune_disk(now)
+
+    def _prune_disk(self, now):
+        db = self._db[0]
+        db.execute("DELETE FROM completions WHERE stored_at < ?", (now - self.ttl,))
+        db.execute(
+            "DELETE FROM completions WHERE key NOT IN "
+            "(SELECT key FROM completions ORDER BY stored_at DESC LIMIT ?)", (self.max_entries,)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM completions")
+
+    def stats(self):
+        """Counters for logs and metrics."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'path': self.path,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+def load_completion_cache():
+    """The process-wide cache: None when disabled, persisted when MEX_LLM_CACHE_PATH is set."""
+    if not completion_cache_enabled():
+        return None
+    return CompletionCache(path=os.getenv('MEX_LLM_CACHE_PATH') or None)
@@ -0,0 +1,317 @@
+# data_append.py
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from data_ingest import TABLE_SCHEMAS, read_table
+from data_index import (
+    MERCHANT_COL,
+    ORDER_COL,
+    TIME_COL,
+    build_indexes,
+    day_numbers,
+    sort_transaction_items,
+    sort_transactions,
+)
+from dataset import REQUIRED_COLUMNS, Dataset, DatasetError, as_dataset
+
+# Tables a delta may add rows to
+APPEND_TABLES = ('transaction_data', 'transaction_items')
+
+
+def read_delta(transactions_path=None, items_path=None):
+    """Reads delta CSVs (same columns as the source CSVs) with the loader's cleaning.
+
+    Returns:
+        dict: table name -> DataFrame of string-ID rows, for the files given.
+    """
+    delta = {}
+    for table, path in zip(APPEND_TABLES, (transactions_path, items_path)):
+        if path:
+            delta[table], _ = read_table(os.path.dirname(path) or '.', os.path.basename(path), TABLE_SCHEMAS[table])
+    return delta
+
+
+def _conform(delta_df, table, base_df):
+    """Delta rows with the base table's columns (missing optional columns are NA)."""
+    missing = [c for c in REQUIRED_COLUMNS[table] if c not in delta_df.columns]
+    if missing:
+        raise DatasetError(f"Delta for {table} is missing required columns: {missing}.")
+    delta_df = delta_df.reindex(columns=base_df.columns)
+    if delta_df.index.has_duplicates:
+        delta_df = delta_df.reset_index(drop=True)
+    return delta_df
+
+
+# --- Compact Mode: Growing the Shared Dictionaries ---
+def _extend_dictionary(dtype, values):
+    """Adds new IDs to a sorted categorical dictionary, keeping it sorted.
+
+    Returns:
+        tuple: (new dtype, old code -> new code array), or (dtype, None) when
+            every value is already in the dictionary.
+    """
+    categories = dtype.categories
+    values = pd.unique(np.asarray(values, dtype=object))
+    values = np.sort(values[pd.notna(values)].astype(str).astype(object))
+    found = categories.searchsorted(values)
+    known = found < len(categories)
+    known[known] = categories.to_numpy()[found[known]] == values[known]
+    new_values = values[~known]
+    if not len(new_values):
+        return dtype, None
+    inserts = found[~known]
+    merged = np.insert(categories.to_numpy(), inserts, new_values)
+    # Existing codes shift up by the number of new IDs sorting before them
+    remap = np.arange(len(categories)) + np.searchsorted(inserts, np.arange(len(categories)), side='right')
+    merged_index = pd.Index(merged, dtype=object)
+    merged_index.is_monotonic_increasing  # also settles is_unique without hashing every ID
+    return pd.CategoricalDtype(categories=merged_index), remap
+
+
+def _recode(series, dtype, remap):
+    """A categorical column re-expressed in an extended dictionary (integer work only)."""
+    codes = series.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, remap[np.maximum(codes, 0)], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=dtype), index=series.index, name=series.name)
+
+
+def _encode(series, dtype):
+    """String IDs as a categorical of dtype, whose sorted dictionary holds them all."""
+    values = np.asarray(series, dtype=object)
+    present = pd.notna(values)
+    codes = np.full(len(values), -1, dtype=np.int64)
+    codes[present] = dtype.categories.searchsorted(values[present].astype(str).astype(object))
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=dtype), index=series.index, name=series.name)
+
+
+def _compact_delta(tables, delta):
+    """Encodes delta ID columns with the tables' shared dictionaries, growing them as needed.
+
+    Every table column sharing a grown dictionary is recoded (see
+    data_utils.compact_id_columns), so the dictionaries stay shared and sorted.
+
+    Returns:
+        tuple: (tables, delta), both new dicts; unchanged DataFrames are shared.
+    """
+    tables, delta = dict(tables), dict(delta)
+    dtypes = {}
+    for df in tables.values():
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                dtypes.setdefault(col, df[col].dtype)
+    for col, dtype in dtypes.items():
+        values = [df[col] for df in delta.values() if col in df.columns]
+        if not values:
+            continue
+        if isinstance(dtype.categories, pd.RangeIndex):
+            raise DatasetError(f"'{col}' was loaded without its ID dictionary (shared mode); cannot append to it.")
+        new_dtype, remap = _extend_dictionary(dtype, np.concatenate([np.asarray(v, dtype=object) for v in values]))
+        if remap is not None:
+            for table, df in tables.items():
+                if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+                    tables[table] = df.assign(**{col: _recode(df[col], new_dtype, remap)})
+        for table, df in delta.items():
+            if col in df.columns:
+                delta[table] = df.assign(**{col: _encode(df[col], new_dtype)})
+    return tables, delta
+
+
+# --- Appending ---
+def _insert_rows(df, delta_df, positions):
+    """df with delta_df's rows inserted before the given positions (np.insert semantics)."""
+    indexer = np.insert(np.arange(len(df)), positions, np.arange(len(df), len(df) + len(delta_df)))
+    return pd.concat([df, delta_df], ignore_index=True).take(indexer).reset_index(drop=True)
+
+
+def _merge_windows(windows, merchants, days):
+    """Widens merchant_id -> (first day, last day) to cover the given (merchant, day) rows."""
+    spans = pd.DataFrame({'merchant': merchants, 'day': days}).dropna(subset=['merchant'])
+    for merchant, (day_lo, day_hi) in spans.groupby('merchant', sort=False)['day'].agg(['min', 'max']).iterrows():
+        lo, hi = windows.get(merchant, (day_lo, day_hi))
+        windows[merchant] = (int(min(lo, day_lo)), int(max(hi, day_hi)))
+    return windows
+
+
+def _full_rebuild(tables, delta):
+    """Fallback when the dataset has no indexes to extend: concatenate, sort and index everything."""
+    for table, df in delta.items():
+        tables[table] = pd.concat([tables[table], df], ignore_index=True)
+    tables['transaction_data'] = sort_transactions(tables['transaction_data'])
+    tables['transaction_items'] = sort_transaction_items(tables['transaction_items'])
+    return Dataset(tables, indexes=build_indexes(tables))
+
+
+def append_rows(datasets, delta):
+    """Builds a new Dataset version with delta rows appended to transaction_data/transaction_items.
+
+    The current Dataset is not modified, so requests still using it finish on
+    a consistent snapshot; swap the returned Dataset in when it is ready. Only
+    the delta is parsed, sorted and aggregated: new rows are merged into the
+    sorted tables at positions found with the existing indexes, and the
+    rollups/cubes recount just the (merchant, day) and (city, day) cells the
+    delta touches. Copying the tables into their new layout is the only step
+    proportional to the full data, and it is a plain memory copy.
+
+    Args:
+        datasets (Dataset): The current data.
+        delta (dict): 'transaction_data' and/or 'transaction_items' DataFrames
+            as returned by read_delta. The other tables cannot be appended to.
+    Returns:
+        tuple: (new Dataset, report dict with row counts and seconds)
+    Raises:
+        DatasetError: If the delta has unknown tables or lacks required columns.
+    """
+    started = time.perf_counter()
+    datasets = as_dataset(datasets)
+    unknown = [t for t in delta if t not in APPEND_TABLES]
+    if unknown:
+        raise DatasetError(f"Cannot append to tables {unknown}; only {list(APPEND_TABLES)}.")
+    tables = datasets.tables()
+    delta = {t: _conform(df, t, tables[t]) for t, df in delta.items() if df is not None}
+    td_delta = delta.setdefault('transaction_data', tables['transaction_data'].iloc[:0])
+    ti_delta = delta.setdefault('transaction_items', tables['transaction_items'].iloc[:0])
+    report = {'transaction_data': len(td_delta), 'transaction_items': len(ti_delta)}
+
+    order_dtype = tables['transaction_items'][ORDER_COL].dtype
+    if isinstance(order_dtype, pd.CategoricalDtype):
+        tables, delta = _compact_delta(tables, delta)
+        td_delta, ti_delta = delta['transaction_data'], delta['transaction_items']
+        order_dtype = tables['transaction_items'][ORDER_COL].dtype
+    else:
+        order_dtype = None
+
+    indexes = dict(datasets.indexes)
+    merchant_time, order_items = indexes.get('merchant_time'), indexes.get('order_items')
+    if merchant_time is None or order_items is None:
+        new_datasets = _full_rebuild(tables, delta)
+        report.update(version=new_datasets.version, incremental=False, seconds=time.perf_counter() - started)
+        return new_datasets, report
+
+    # transaction_data: each delta row goes after its merchant's rows up to its timestamp
+    # Where known merchants' rows, new merchants' blocks and rows without a
+    # merchant_id meet at the same position, they must go in that order
+    td_delta = sort_transactions(td_delta)
+    delta_merchants = np.asarray(td_delta[MERCHANT_COL], dtype=object)
+    missing = pd.isna(delta_merchants)
+    known = pd.Series(delta_merchants).isin(merchant_time.offsets.keys()).to_numpy()
+    order = np.argsort(np.where(missing, 2, np.where(known, 0, 1)), kind='stable')
+    td_delta, delta_merchants = td_delta.iloc[order], delta_merchants[order]
+    positions = merchant_time.insert_positions(delta_merchants, td_delta[TIME_COL].array.asi8)
+    td_df = _insert_rows(tables['transaction_data'], td_delta, positions)
+    # New rows per merchant; merchants new to the table in the order their blocks were appended
+    named = pd.Series(delta_merchants[pd.notna(delta_merchants)], dtype=object).astype(str)
+    added = named.groupby(named, sort=False).size().to_dict()
+    indexes['merchant_time'] = merchant_time = merchant_time.appended(td_df, added)
+
+    # transaction_items: each delta row goes at the end of its order's run
+    ti_delta, codes, positions, new_ids = order_items.plan_append(ti_delta, order_dtype)
+    ti_df = _insert_rows(tables['transaction_items'], ti_delta, positions)
+    indexes['order_items'] = order_items = order_items.appended(ti_df, codes, new_ids, order_dtype)
+
+    # Cells to recount: the days of new orders, plus the days of existing
+    # orders that received new items
+    sales_windows = _merge_windows({}, named.to_numpy(), day_numbers(td_delta[TIME_COL])[pd.notna(delta_merchants)])
+    item_windows = dict(sales_windows)
+    late_orders = ti_delta[ORDER_COL][~ti_delta[ORDER_COL].isin(td_delta[ORDER_COL])].dropna().unique()
+    if len(late_orders):
+        late = td_df[td_df[ORDER_COL].isin(late_orders)]
+        late_merchants = np.asarray(late[MERCHANT_COL], dtype=object)
+        present = pd.notna(late_merchants)
+        _merge_windows(item_windows, late_merchants[present].astype(str), day_numbers(late[TIME_COL])[present])
+
+    if 'daily_sales' in indexes:
+        indexes['daily_sales'] = indexes['daily_sales'].appended(td_df, merchant_time, sales_windows)
+    for name in ('item_popularity', 'city_cuisine'):
+        if name in indexes:
+            indexes[name] = indexes[name].appended(td_df, ti_df, merchant_time, order_items, item_windows)
+
+    tables['transaction_data'], tables['transaction_items'] = td_df, ti_df
+    new_datasets = Dataset(tables, indexes=indexes)
+    report.update(version=new_datasets.version, incremental=True, seconds=time.perf_counter() - started)
+    return new_datasets, report
+
+
+# --- Persisting ---
+def _append_csv(source_path, delta_path):
+    """Appends the rows of delta_path to source_path, in source_path's column order."""
+    header = pd.read_csv(source_path, nrows=0).columns
+    rows = pd.read_csv(delta_path, dtype=str, keep_default_na=False).reindex(columns=header, fill_value='')
+    with open(source_path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+    rows.to_csv(source_path, mode='a', header=False, index=False)
+
+
+def persist_delta(datasets, transactions_path=None, items_path=None):
+    """Makes an append survive a restart: adds the delta rows to the source CSVs
+    and rewrites the data cache from datasets (the appended Dataset), so the
+    next start loads the cache instead of re-parsing the CSVs.
+
+    Returns:
+        bool: True if the cache was rewritten (False if it is disabled or failed).
+    """
+    from data_cache import cache_enabled, default_cache_dir, save_cached_datasets
+    from data_utils import DATA_DIR, TABLE_FILES, source_paths
+
+    for table, path in zip(APPEND_TABLES, (transactions_path, items_path)):
+        if path:
+            _append_csv(os.path.join(DATA_DIR, TABLE_FILES[table]), path)
+    if not cache_enabled():
+        return False
+    compact = isinstance(datasets.transaction_items[ORDER_COL].dtype, pd.CategoricalDtype)
+    return save_cached_datasets(
+        default_cache_dir(DATA_DIR), source_paths(), datasets.tables(), options={'compact_ids': compact}
+    )
+
+
+# --- CLI: append a delta, locally or to a running server ---
+if __name__ == "__main__":
+    import argparse
+    import json
+    import urllib.request
+
+    parser = argparse.ArgumentParser(description="Append new transaction_data/transaction_items rows.")
+    parser.add_argument('--transactions', default=None, help="CSV of new transaction_data rows.")
+    parser.add_argument('--items', default=None, help="CSV of new transaction_items rows.")
+    parser.add_argument('--persist', action='store_true', help="Also append to the source CSVs and rewrite the cache.")
+    parser.add_argument('--server', default=None, help="Base URL of a running app to append to (e.g. http://127.0.0.1:5000).")
+    parser.add_argument('--token', default=os.getenv('MEX_ADMIN_TOKEN'), help="Admin token of the server (default $MEX_ADMIN_TOKEN).")
+    args = parser.parse_args()
+    if not args.transactions and not args.items:
+        parser.error("give --transactions and/or --items")
+
+    if args.server:
+        # The server reads the files itself, so send absolute paths
+        body = {
+            'transactions': os.path.abspath(args.transactions) if args.transactions else None,
+            'items': os.path.abspath(args.items) if args.items else None,
+            'persist': args.persist,
+        }
+        req = urllib.request.Request(
+            args.server.rstrip('/') + '/api/data/append',
+            data=json.dumps(body).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {args.token or ""}'},
+        )
+        try:
+            with urllib.request.urlopen(req) as response:
+                print(f"Data Append ✅: {response.read().decode('utf-8')}")
+        except urllib.error.HTTPError as e:
+            raise SystemExit(f"Data Append ❌: {e.code} {e.read().decode('utf-8')}")
+    else:
+        from data_utils import load_provided_data
+
+        dataset = load_provided_data()
+        if dataset is None:
+            raise SystemExit("Data Append ❌: Data loading failed.")
+        new_dataset, append_report = append_rows(dataset, read_delta(args.transactions, args.items))
+        print(
+            f"Data Append ✅: {append_report['transaction_data']:,} transaction(s) and "
+            f"{append_report['transaction_items']:,} item row(s) appended in {append_report['seconds']:.3f}s: {new_dataset!r}."
+        )
+        if args.persist:
+            persist_delta(new_dataset, args.transactions, args.items)
@@ -0,0 +1,350 @@
+# data_cache.py
+import os
+import copy
+import json
+import shutil
+import hashlib
+import threading
+import traceback
+import contextlib
+import numpy as np
+import pandas as pd
+
+from env_flags import env_flag
+
+try:
+    import fcntl  # Unix only; elsewhere concurrent cache builds are not serialised
+except ImportError:
+    fcntl = None
+
+# Bump when the on-disk layout or the preprocessing in data_utils changes,
+# so stale caches written by an older version are rebuilt instead of loaded.
+CACHE_FORMAT_VERSION = 5
+CACHE_DIR_NAME = '.cache'
+MANIFEST_FILE = 'manifest.json'
+INDEX_FILE = '__index__'
+DICTIONARY_DIR = '_dictionaries'
+
+
+def default_cache_dir(data_dir):
+    """Cache lives next to the CSVs unless MEX_DATA_CACHE_DIR overrides it."""
+    return os.getenv('MEX_DATA_CACHE_DIR') or os.path.join(data_dir, CACHE_DIR_NAME)
+
+
+def cache_enabled():
+    """The cache is on by default; set MEX_DATA_CACHE=0 to always parse the CSVs."""
+    return env_flag('MEX_DATA_CACHE', True)
+
+
+# --- Source Fingerprints ---
+def _file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _source_stat(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def fingerprint_sources(source_paths):
+    """Returns {file name: {size, mtime_ns, sha256}} for the given CSV files."""
+    fingerprints = {}
+    for path in source_paths:
+        entry = _source_stat(path)
+        entry['sha256'] = _file_sha256(path)
+        fingerprints[os.path.basename(path)] = entry
+    return fingerprints
+
+
+def _sources_match(manifest_sources, source_paths):
+    """Checks the cached fingerprints against the CSVs currently on disk.
+
+    Size and mtime are compared first; the (slower) content hash is only computed
+    for files whose stat changed, so touching a CSV without editing it does not
+    force a rebuild. When the hash still matches, the file's new mtime_ns is
+    written into manifest_sources, so a caller that saves them does not hash the
+    file again on the next start.
+    """
+    if set(manifest_sources) != {os.path.basename(p) for p in source_paths}:
+        return False
+    for path in source_paths:
+        cached = manifest_sources[os.path.basename(path)]
+        current = _source_stat(path)
+        if current['size'] != cached.get('size'):
+            return False
+        if current['mtime_ns'] != cached.get('mtime_ns'):
+            if _file_sha256(path) != cached.get('sha256'):
+                return False
+            cached['mtime_ns'] = current['mtime_ns']
+    return True
+
+
+# --- Column Encoding ---
+def _save_text(path, series):
+    """Saves text as fixed-width unicode, returning the missing-value mask."""
+    na_mask = series.isna().to_numpy()
+    text = np.where(na_mask, '', series.astype(str).to_numpy()).astype(str)
+    np.save(path, text, allow_pickle=False)
+    return na_mask
+
+
+def _save_column(table_dir, name, series, dictionaries=None):
+    """Writes one column as .npy file(s) and returns its manifest entry.
+
+    Categorical columns are written as their integer codes; the categories go
+    into a dictionary shared by every column with the same name, so shared
+    dictionaries stay shared after a round trip through the cache.
+    """
+    entry = {'name': name}
+    values = series.to_numpy()
+    if isinstance(series.dtype, pd.CategoricalDtype) and dictionaries is not None:
+        entry['kind'] = 'category'
+        categories = series.cat.categories
+        key = name
+        if key in dictionaries and not dictionaries[key].equals(categories):
+            key = f"{name}@{os.path.basename(table_dir)}"
+        if key not in dictionaries:
+            dictionaries[key] = categories
+        entry['dictionary'] = key
+        np.save(os.path.join(table_dir, f'{name}.npy'), series.cat.codes.to_numpy(), allow_pickle=False)
+    elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+        entry['kind'] = 'datetime'
+        if getattr(series.dtype, 'tz', None) is not None:
+            entry['tz'] = str(series.dtype.tz)
+            values = series.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy()
+        np.save(os.path.join(table_dir, f'{name}.npy'), values, allow_pickle=False)
+    elif pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+        entry['kind'] = 'numeric'
+        np.save(os.path.join(table_dir, f'{name}.npy'), values, allow_pickle=False)
+    else:
+        # Text columns are stored as fixed-width unicode plus a missing-value mask,
+        # which keeps the cache pickle-free.
+        entry['kind'] = 'string'
+        na_mask = _save_text(os.path.join(table_dir, f'{name}.npy'), series)
+        if na_mask.any():
+            entry['has_na'] = True
+            np.save(os.path.join(table_dir, f'{name}.na.npy'), na_mask, allow_pickle=False)
+    return entry
+
+
+def _load_column(table_dir, entry, dictionaries=None, mmap=False):
+    """Reads one column; with mmap, fixed-width columns stay in the (shared) page cache.
+
+    Memory-mapped columns are read-only views of the file: categorical codes,
+    numbers and tz-naive timestamps are not copied. Text columns, dictionaries
+    and tz-aware timestamps are always materialized in this process.
+    """
+    kind = entry['kind']
+    mmap_mode = 'r' if mmap and kind != 'string' else None
+    values = np.load(os.path.join(table_dir, f"{entry['name']}.npy"), allow_pickle=False, mmap_mode=mmap_mode)
+    if kind == 'category':
+        return pd.Series(pd.Categorical.from_codes(values, dtype=dictionaries[entry['dictionary']]))
+    if kind == 'datetime':
+        series = pd.Series(values)
+        if entry.get('tz'):
+            series = series.dt.tz_localize('UTC').dt.tz_convert(entry['tz'])
+        return series
+    if kind == 'numeric':
+        return pd.Series(values)
+    values = values.astype(object)
+    if entry.get('has_na'):
+        na_mask = np.load(os.path.join(table_dir, f"{entry['name']}.na.npy"), allow_pickle=False)
+        values[na_mask] = np.nan
+    return pd.Series(values, dtype=object)
+
+
+def _save_table(table_dir, df, dictionaries):
+    os.makedirs(table_dir, exist_ok=True)
+    index_name = df.index.name
+    index_entry = _save_column(table_dir, INDEX_FILE, df.index.to_series())
+    index_entry['index_name'] = index_name
+    columns = [_save_column(table_dir, str(col), df[col], dictionaries) for col in df.columns]
+    return {'index': index_entry, 'columns': columns, 'rows': len(df)}
+
+
+def _save_dictionaries(cache_dir, dictionaries):
+    dictionary_dir = os.path.join(cache_dir, DICTIONARY_DIR)
+    os.makedirs(dictionary_dir, exist_ok=True)
+    for key, categories in dictionaries.items():
+        _save_text(os.path.join(dictionary_dir, f'{key}.npy'), categories.to_series())
+    return sorted(dictionaries)
+
+
+def _load_dictionaries(cache_dir, keys, opaque=()):
+    """Returns one CategoricalDtype per dictionary, reused by every column that references it.
+
+    Dictionaries of the columns named in opaque are not read: their categories
+    are the codes themselves (a RangeIndex), for IDs that are only compared and
+    grouped, never shown or looked up by value.
+    """
+    dictionary_dir = os.path.join(cache_dir, DICTIONARY_DIR)
+    dtypes = {}
+    for key in keys:
+        path = os.path.join(dictionary_dir, f'{key}.npy')
+        if key.split('@')[0] in opaque:
+            categories = pd.RangeIndex(np.load(path, mmap_mode='r', allow_pickle=False).shape[0])
+        else:
+            categories = pd.Index(np.load(path, allow_pickle=False).astype(object))
+        dtypes[key] = pd.CategoricalDtype(categories=categories)
+    return dtypes
+
+
+def _load_table(table_dir, table_meta, dictionaries, mmap=False):
+    data = {entry['name']: _load_column(table_dir, entry, dictionaries, mmap).array for entry in table_meta['columns']}
+    index_entry = table_meta['index']
+    index = pd.Index(_load_column(table_dir, index_entry, mmap=mmap), name=index_entry.get('index_name'), copy=False)
+    # copy=False also skips consolidating same-dtype columns into one (copied) block
+    return pd.DataFrame(data, index=index, columns=[entry['name'] for entry in table_meta['columns']], copy=False)
+
+
+# --- Columnar Store (shared by the data cache and other precomputed tables) ---
+def _write_manifest(store_dir, manifest):
+    """Writes a store's manifest, replacing the old one in a single rename."""
+    manifest_path = os.path.join(store_dir, MANIFEST_FILE)
+    tmp_path = f"{manifest_path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def read_store_manifest(store_dir):
+    """Returns the manifest dict of a columnar store, or None if there is none."""
+    manifest_path = os.path.join(store_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_store_tables(store_dir, manifest, mmap=False, opaque_ids=()):
+    """Loads every table listed in a store's manifest, as DataFrames keyed by name.
+
+    With mmap, fixed-width columns are read-only memory maps of the store's
+    files (see _load_column), so processes loading the same store share one
+    copy of them in the OS page cache. Categorical columns named in opaque_ids
+    keep their codes but not their string dictionary (see _load_dictionaries).
+    """
+    dictionaries = _load_dictionaries(store_dir, manifest.get('dictionaries', []), opaque_ids)
+    return {
+        table: _load_table(os.path.join(store_dir, table), meta, dictionaries, mmap)
+        for table, meta in manifest['tables'].items()
+    }
+
+
+def write_store(store_dir, tables, manifest):
+    """Writes DataFrames as a columnar store (one .npy file per column) plus a manifest.
+
+    The store is built in a sibling temp directory and swapped in with a rename,
+    so a concurrent reader never sees a half-written store. manifest holds any
+    extra metadata; 'tables' and 'dictionaries' are filled in here. Raises on
+    failure, after removing the temp directory.
+    """
+    tmp_dir = f"{store_dir}.tmp-{os.getpid()}"
+    try:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        manifest = dict(manifest, tables={})
+        dictionaries = {}
+        for table, df in tables.items():
+            manifest['tables'][table] = _save_table(os.path.join(tmp_dir, table), df, dictionaries)
+        manifest['dictionaries'] = _save_dictionaries(tmp_dir, dictionaries)
+        _write_manifest(tmp_dir, manifest)
+
+        old_dir = f"{store_dir}.old-{os.getpid()}"
+        if os.path.exists(store_dir):
+            os.replace(store_dir, old_dir)
+        os.replace(tmp_dir, store_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+# --- Public API ---
+_held_locks = threading.local()
+
+
+@contextlib.contextmanager
+def cache_lock(cache_dir):
+    """Exclusive lock (a sibling .lock file) held while checking or building a cache.
+
+    Lets several worker processes start at once: the first one builds the cache
+    and the others wait, then load what it wrote instead of parsing again. A
+    thread that already holds the lock may take it again (it is not re-locked).
+    """
+    held = _held_locks.__dict__.setdefault('paths', set())
+    key = os.path.abspath(cache_dir)
+    if fcntl is None or key in held:
+        yield
+        return
+    os.makedirs(os.path.dirname(key), exist_ok=True)
+    with open(f"{cache_dir}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        held.add(key)
+        try:
+            yield
+        finally:
+            held.discard(key)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_cached_datasets(cache_dir, source_paths, options=None, mmap=False, opaque_ids=()):
+    """Loads preprocessed tables from the cache if it matches the current CSVs.
+
+    Args:
+        mmap (bool): Memory-map fixed-width columns read-only instead of
+            reading them (see read_store_tables).
+        opaque_ids (tuple): Categorical ID columns to load without their
+            string dictionaries (see read_store_tables).
+    Returns:
+        dict: DataFrames keyed by table name when the cache is fresh.
+        None: If there is no cache, it is stale, or it cannot be read.
+    """
+    try:
+        manifest = read_store_manifest(cache_dir)
+        if manifest is None:
+            return None
+        if manifest.get('version') != CACHE_FORMAT_VERSION or manifest.get('options') != (options or {}):
+            print("Data Cache: Cache was written with a different format/options, ignoring it.")
+            return None
+        sources = copy.deepcopy(manifest.get('sources', {}))
+        if not _sources_match(sources, source_paths):
+            print("Data Cache: Source CSVs changed since the cache was built, ignoring it.")
+            return None
+        if sources != manifest.get('sources', {}):
+            # Touched but unchanged CSVs (a checkout, a deploy copy): record their new
+            # mtimes so later starts compare stats instead of hashing them again
+            with cache_lock(cache_dir):
+                if read_store_manifest(cache_dir) == manifest:
+                    manifest = dict(manifest, sources=sources)
+                    _write_manifest(cache_dir, manifest)
+                    print("Data Cache: Recorded new modification times of unchanged source CSVs.")
+        return read_store_tables(cache_dir, manifest, mmap=mmap, opaque_ids=opaque_ids)
+    except Exception as e:
+        print(f"Data Cache ⚠️: Could not read cache at '{cache_dir}': {e}")
+        return None
+
+
+def save_cached_datasets(cache_dir, source_paths, datasets, options=None):
+    """Writes preprocessed tables to the cache. Failures are logged, never raised.
+
+    The cache is written with write_store, so a concurrent reader never sees a
+    half-written cache.
+    """
+    try:
+        manifest = {
+            'version': CACHE_FORMAT_VERSION,
+            'options': options or {},
+            'sources': fingerprint_sources(source_paths),
+        }
+        write_store(cache_dir, datasets, manifest)
+        print(f"Data Cache ✅: Wrote columnar cache to '{cache_dir}'.")
+        return True
+    except Exception as e:
+        print(f"Data Cache ⚠️: Could not write cache to '{cache_dir}': {e}")
+        traceback.print_exc()
+        return False
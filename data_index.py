@@ -0,0 +1,894 @@
+# data_index.py
+import copy
+import numpy as np
+import pandas as pd
+
+MERCHANT_COL = 'merchant_id'
+TIME_COL = 'order_time_dt'
+ORDER_COL = 'order_id'
+ITEM_COL = 'item_id'
+ITEM_NAME_COL = 'item_name'
+CITY_COL = 'city_id'
+CUISINE_COL = 'cuisine_tag'
+VALUE_COL = 'order_value'
+NS_PER_DAY = 86_400 * 1_000_000_000
+
+
+def _timestamp_ns(ts):
+    """Nanoseconds since epoch (UTC for tz-aware), comparable with DatetimeArray.asi8."""
+    return pd.Timestamp(ts).value
+
+
+def day_number(ts):
+    """Calendar day of a timestamp (wall-clock for tz-aware) as days since 1970-01-01."""
+    ts = pd.Timestamp(ts)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return ts.value // NS_PER_DAY
+
+
+def day_numbers(times):
+    """Vectorised day_number for a datetime Series."""
+    if getattr(times.dtype, 'tz', None) is not None:
+        times = times.dt.tz_localize(None)
+    return times.array.asi8 // NS_PER_DAY
+
+
+def _day_start_ns(day, tz=None):
+    """Epoch nanoseconds (comparable with asi8) of midnight starting a day_number day."""
+    ts = pd.Timestamp(day * NS_PER_DAY)
+    if tz is not None:
+        ts = ts.tz_localize(tz, ambiguous=False, nonexistent='shift_forward')
+    return ts.value
+
+
+def _splice_days(first_day, cumulative, day_lo, day_hi, values):
+    """Replaces the per-day values of days [day_lo, day_hi] in a prefix-sum run.
+
+    Args:
+        cumulative: (days + 1, ...) prefix sums starting with a zero row, or
+            None to start a new run.
+        values: (day_hi - day_lo + 1, ...) per-day values for the replaced days.
+    Returns:
+        tuple: (first day, prefix sums) covering the union of both day ranges.
+            New arrays; the inputs are not modified.
+    """
+    if cumulative is None:
+        daily, first = values, day_lo
+    else:
+        old_daily = np.diff(cumulative, axis=0)
+        last = first_day + len(old_daily) - 1
+        first = min(first_day, day_lo)
+        daily = np.zeros((max(last, day_hi) - first + 1,) + old_daily.shape[1:], dtype=cumulative.dtype)
+        daily[first_day - first:first_day - first + len(old_daily)] = old_daily
+        daily[day_lo - first:day_hi - first + 1] = values
+    dtype = cumulative.dtype if cumulative is not None else values.dtype
+    out = np.zeros((len(daily) + 1,) + daily.shape[1:], dtype=dtype)
+    np.cumsum(daily, axis=0, out=out[1:])
+    return first, out
+
+
+def _union_columns(labels, cumulative, new_labels):
+    """Widens a (days + 1) x labels matrix to the sorted union of labels and new_labels."""
+    merged = np.union1d(np.asarray(labels, dtype=object), np.asarray(new_labels, dtype=object)).astype(object)
+    if len(merged) == len(labels):
+        return np.asarray(labels, dtype=object), cumulative
+    widened = np.zeros((cumulative.shape[0], len(merged)), dtype=cumulative.dtype)
+    widened[:, pd.Index(merged).get_indexer(labels)] = cumulative
+    return merged, widened
+
+
+def merchant_keys(merchants):
+    """Integer key per row plus the merchant_id label of each key (-1 = missing)."""
+    if isinstance(merchants.dtype, pd.CategoricalDtype):
+        return merchants.cat.codes.to_numpy(), merchants.cat.categories
+    return pd.factorize(merchants, sort=False)
+
+
+def sort_transactions(td_df):
+    """Returns transaction_data physically sorted by (merchant_id, order_time_dt).
+
+    Categorical merchant IDs sort by code; their dictionary is sorted, so the
+    order is the same as for plain strings.
+    """
+    return td_df.sort_values([MERCHANT_COL, TIME_COL], kind='stable')
+
+
+def sort_transaction_items(ti_df):
+    """Returns transaction_items physically sorted by order_id (the order->items CSR layout)."""
+    return ti_df.sort_values(ORDER_COL, kind='stable')
+
+
+# --- Merchant/Time Index ---
+class MerchantTimeIndex:
+    """Per-merchant row offsets into a (merchant_id, order_time_dt)-sorted transaction_data.
+
+    A merchant's rows are the contiguous block [start, end); within it the
+    timestamps are sorted, so any time window is two searchsorted calls and the
+    result is a positional slice of the table rather than a boolean-mask copy.
+    """
+
+    def __init__(self, td_df):
+        keys, labels = merchant_keys(td_df[MERCHANT_COL])
+        self.times = td_df[TIME_COL].array.asi8
+        self.tz = getattr(td_df[TIME_COL].dtype, 'tz', None)
+        self.rows = len(td_df)
+
+        boundaries = np.flatnonzero(keys[1:] != keys[:-1]) + 1 if self.rows else np.array([], dtype=np.int64)
+        starts = np.concatenate(([0], boundaries)) if self.rows else np.array([], dtype=np.int64)
+        ends = np.concatenate((boundaries, [self.rows])) if self.rows else np.array([], dtype=np.int64)
+        block_keys = keys[starts]
+        if len(np.unique(block_keys)) != len(block_keys):
+            raise ValueError("transaction_data is not sorted by merchant_id; call sort_transactions first.")
+        if np.any((np.diff(self.times) < 0) & (keys[1:] == keys[:-1])):
+            raise ValueError("transaction_data is not sorted by order_time_dt within merchant.")
+
+        # merchant_id -> (start, end): the per-merchant offset table.
+        # Key -1 marks a missing merchant_id; those rows are not addressable.
+        self.offsets = {
+            str(labels[key]): (int(start), int(end))
+            for key, start, end in zip(block_keys, starts, ends)
+            if key >= 0
+        }
+
+    def covers(self, td_df):
+        """True if this index was built for a table of this shape."""
+        return td_df is not None and len(td_df) == self.rows
+
+    def merchant_range(self, merchant_id):
+        """Row range [start, end) for a merchant, or None if it has no transactions."""
+        return self.offsets.get(str(merchant_id))
+
+    def window(self, merchant_id, start_date, end_date):
+        """Row range [lo, hi) for merchant rows with start_date <= order_time_dt <= end_date."""
+        block = self.merchant_range(merchant_id)
+        if block is None:
+            return 0, 0
+        start, end = block
+        times = self.times[start:end]
+        lo = start + int(np.searchsorted(times, _timestamp_ns(start_date), side='left'))
+        hi = start + int(np.searchsorted(times, _timestamp_ns(end_date), side='right'))
+        return lo, max(lo, hi)
+
+    def slice(self, td_df, merchant_id, start_date, end_date):
+        """The merchant's transactions in the window, as a positional slice of td_df."""
+        lo, hi = self.window(merchant_id, start_date, end_date)
+        return td_df.iloc[lo:hi]
+
+    def positions(self, merchant_ids, start_date, end_date):
+        """Row positions of all listed merchants' transactions in the window."""
+        ranges = [self.window(m, start_date, end_date) for m in merchant_ids]
+        ranges = [(lo, hi) for lo, hi in ranges if hi > lo]
+        if not ranges:
+            return np.array([], dtype=np.int64)
+        return np.concatenate([np.arange(lo, hi) for lo, hi in ranges])
+
+    def day_window(self, merchant_id, day_lo, day_hi):
+        """Row range [lo, hi) for merchant rows on days day_lo..day_hi (day_number), inclusive."""
+        block = self.merchant_range(merchant_id)
+        if block is None:
+            return 0, 0
+        start, end = block
+        times = self.times[start:end]
+        lo = start + int(np.searchsorted(times, _day_start_ns(day_lo, self.tz), side='left'))
+        hi = start + int(np.searchsorted(times, _day_start_ns(day_hi + 1, self.tz), side='left'))
+        return lo, max(lo, hi)
+
+    def day_positions(self, windows):
+        """Row positions of several (merchant_id, first day, last day) windows, plus the window of each row."""
+        ranges = np.array([self.day_window(m, lo, hi) for m, lo, hi in windows], dtype=np.int64).reshape(-1, 2)
+        lengths = ranges[:, 1] - ranges[:, 0]
+        total = int(lengths.sum())
+        owners = np.repeat(np.arange(len(ranges)), lengths)
+        run_offsets = np.cumsum(lengths) - lengths
+        return np.repeat(ranges[:, 0] - run_offsets, lengths) + np.arange(total), owners
+
+    def valid_rows(self):
+        """End of the last merchant block; rows after it have no merchant_id."""
+        return max((end for _, end in self.offsets.values()), default=0)
+
+    def insert_positions(self, merchant_ids, times_ns):
+        """Where new rows go in the table so every merchant block stays time-sorted.
+
+        Rows of known merchants go after that merchant's rows with the same or an
+        earlier timestamp; rows of new merchants go after the last block, and rows
+        without a merchant_id at the very end. Positions refer to the current
+        table (np.insert semantics).
+        """
+        positions = np.full(len(merchant_ids), self.rows, dtype=np.int64)
+        tail = self.valid_rows()
+        merchant_ids = pd.Series(np.asarray(merchant_ids, dtype=object))
+        for merchant, rows in merchant_ids.groupby(merchant_ids, sort=False).indices.items():
+            block = self.merchant_range(merchant)
+            if block is None:
+                positions[rows] = tail
+                continue
+            start, end = block
+            positions[rows] = start + np.searchsorted(self.times[start:end], times_ns[rows], side='right')
+        return positions
+
+    def appended(self, td_df, added):
+        """Index for td_df: this table with new rows inserted at insert_positions.
+
+        Args:
+            added (dict): merchant_id -> number of new rows; merchants without a
+                block yet in the order their blocks were appended.
+        Returns:
+            MerchantTimeIndex: A new index; this one is unchanged.
+        """
+        new = copy.copy(self)
+        offsets = {}
+        shift = 0
+        for merchant, (start, end) in self.offsets.items():  # in table order
+            extra = added.get(merchant, 0)
+            offsets[merchant] = (start + shift, end + shift + extra)
+            shift += extra
+        tail = self.valid_rows() + shift
+        for merchant, extra in added.items():
+            if merchant not in self.offsets:
+                offsets[merchant] = (tail, tail + extra)
+                tail += extra
+        new.offsets = offsets
+        new.times = td_df[TIME_COL].array.asi8
+        new.rows = len(td_df)
+        return new
+
+
+# --- Order -> Item Rows Index ---
+class OrderItemsIndex:
+    """CSR offsets from order to its rows in an order_id-grouped transaction_items.
+
+    Orders are numbered in a dense code space: the shared categorical codes in
+    compact mode, otherwise a factorization of transaction_items.order_id whose
+    hash table is built once here. The item rows of order code c are
+    [indptr[c], indptr[c + 1]), so gathering the items of k orders costs
+    O(k + result rows) instead of an isin() over the whole table.
+
+    Appending orders (see appended) numbers them after the existing ones and
+    adds a lookup segment for just the new IDs, so the hash table of the
+    existing IDs is never rebuilt; segments are merged once there are more
+    than MAX_LOOKUP_SEGMENTS.
+    """
+
+    MAX_LOOKUP_SEGMENTS = 8
+
+    def __init__(self, ti_df):
+        orders = ti_df[ORDER_COL]
+        if isinstance(orders.dtype, pd.CategoricalDtype):
+            codes = orders.cat.codes.to_numpy().astype(np.int64)
+            self.order_dtype = orders.dtype
+            self.lookups = []
+            size = len(orders.cat.categories)
+        else:
+            codes, uniques = pd.factorize(orders, sort=False)
+            self.order_dtype = None
+            lookup = pd.Index(uniques)
+            lookup.get_indexer(uniques[:1])  # build the hash table now, not on the first request
+            self.lookups = [(0, lookup)]  # (first code, order IDs)
+            size = len(uniques)
+        self.rows = len(ti_df)
+
+        valid = codes >= 0  # missing order_id rows sort last and are never returned
+        if np.any(np.diff(codes[valid]) < 0) or not np.all(valid[:valid.sum()]):
+            raise ValueError("transaction_items is not sorted by order_id; call sort_transaction_items first.")
+        counts = np.bincount(codes[valid], minlength=size)
+        self.indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    def covers(self, ti_df):
+        """True if this index was built for a table of this shape."""
+        return ti_df is not None and len(ti_df) == self.rows
+
+    def codes_for(self, order_ids):
+        """Dense code of each given order ID, aligned with the input (-1 = no items)."""
+        if self.order_dtype is not None:
+            # No-op recode when the IDs already use the shared dictionary
+            return pd.Categorical(order_ids, dtype=self.order_dtype).codes.astype(np.int64)
+        values = np.asarray(order_ids, dtype=object)
+        codes = np.full(len(values), -1, dtype=np.int64)
+        for first_code, lookup in self.lookups:
+            found = lookup.get_indexer(values)
+            hit = found >= 0
+            codes[hit] = first_code + found[hit]
+        return codes
+
+    def _base_counts(self, order_dtype=None):
+        """Item rows per order code of the current table, in the code space after an append.
+
+        In compact mode the extended dictionary is still sorted, so existing
+        codes move up (monotonically) to make room for the new IDs; otherwise
+        new orders are numbered after the existing ones.
+        """
+        counts = np.diff(self.indptr)
+        if self.order_dtype is None or order_dtype is None or order_dtype is self.order_dtype:
+            return counts
+        remapped = np.zeros(len(order_dtype.categories), dtype=np.int64)
+        remapped[order_dtype.categories.get_indexer(self.order_dtype.categories)] = counts
+        return remapped
+
+    def plan_append(self, ti_delta, order_dtype=None):
+        """Orders new transaction_items rows and finds where they go.
+
+        Rows go at the end of their order's run (an empty run for a new order),
+        and rows without an order_id at the very end, so the table stays grouped
+        by order code.
+
+        Args:
+            order_dtype: In compact mode, the order_id dtype extended with the
+                new IDs; ti_delta must already use it.
+        Returns:
+            tuple: (ti_delta reordered, order code per row (-1 = missing),
+                insert positions into the current table (np.insert semantics),
+                new order IDs in code order, or None in compact mode)
+        """
+        new_ids = None
+        if self.order_dtype is not None:
+            codes = ti_delta[ORDER_COL].cat.codes.to_numpy().astype(np.int64)
+        else:
+            codes = self.codes_for(ti_delta[ORDER_COL])
+            orders = np.asarray(ti_delta[ORDER_COL], dtype=object)
+            unknown = (codes < 0) & pd.notna(orders)
+            new_codes, uniques = pd.factorize(orders[unknown], sort=False)
+            codes[unknown] = len(self.indptr) - 1 + new_codes
+            new_ids = pd.Index(uniques)
+        # Missing order IDs last, otherwise by code (stable keeps each order's rows in file order)
+        order = np.argsort(np.where(codes < 0, np.iinfo(np.int64).max, codes), kind='stable')
+        codes = codes[order]
+        base = self._base_counts(order_dtype)
+        base_ends = np.cumsum(base)
+        valid_end = int(base_ends[-1]) if len(base_ends) else 0
+        known = (codes >= 0) & (codes < len(base))
+        positions = np.where(codes < 0, self.rows, valid_end)
+        positions[known] = base_ends[codes[known]]
+        return ti_delta.iloc[order], codes, positions.astype(np.int64), new_ids
+
+    def appended(self, ti_df, codes, new_ids=None, order_dtype=None):
+        """Index for ti_df: this table with the plan_append rows inserted.
+
+        Returns:
+            OrderItemsIndex: A new index; this one is unchanged.
+        """
+        new = copy.copy(self)
+        counts = self._base_counts(order_dtype)
+        if self.order_dtype is not None:
+            new.order_dtype = order_dtype or self.order_dtype
+        elif new_ids is not None and len(new_ids):
+            new_ids.get_indexer(new_ids[:1])
+            new.lookups = self.lookups + [(len(counts), new_ids)]
+            counts = np.concatenate((counts, np.zeros(len(new_ids), dtype=np.int64)))
+            if len(new.lookups) > self.MAX_LOOKUP_SEGMENTS:
+                merged = new.lookups[0][1].append([lookup for _, lookup in new.lookups[1:]])
+                merged.get_indexer(merged[:1])
+                new.lookups = [(0, merged)]
+        counts = counts + np.bincount(codes[codes >= 0], minlength=len(counts))
+        new.indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        new.rows = len(ti_df)
+        return new
+
+    def order_codes(self, order_ids):
+        """Dense codes for the given order IDs (unknown orders are dropped), deduplicated."""
+        codes = self.codes_for(order_ids)
+        return np.unique(codes[codes >= 0])
+
+    def row_codes(self):
+        """Order code of every transaction_items row (the CSR expanded; missing orders = -1)."""
+        counts = np.diff(self.indptr)
+        codes = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+        return np.concatenate((codes, np.full(self.rows - len(codes), -1, dtype=np.int64)))
+
+    def positions(self, order_ids):
+        """Row positions in transaction_items of all items belonging to the given orders."""
+        return self.rows_of(self.order_codes(order_ids))[0]
+
+    def rows_of(self, codes):
+        """Row positions of the items of each order code, plus the index into codes each row came from."""
+        starts = self.indptr[codes]
+        lengths = self.indptr[codes + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        # Expand the [start, start + length) runs without a Python loop
+        run_offsets = np.cumsum(lengths) - lengths
+        owners = np.repeat(np.arange(len(codes)), lengths)
+        return np.repeat(starts - run_offsets, lengths) + np.arange(total), owners
+
+
+# --- Daily Per-Merchant Sales Rollup ---
+class DailySalesRollup:
+    """Daily (merchant, day) sales totals with per-merchant prefix sums.
+
+    Each merchant owns a dense run of cells covering its first..last active day,
+    preceded by a zero cell, holding cumulative sales and distinct orders per
+    day. The totals for any inclusive day range are one subtraction:
+    cum[end + 1] - cum[start].
+
+    Distinct orders add up across days because every order has one timestamp.
+    Distinct customers do not (a customer can order on several days), so they
+    are not kept here; get_sales_summary counts them from the raw transactions.
+    """
+
+    def __init__(self, td_df):
+        keys, labels = merchant_keys(td_df[MERCHANT_COL])
+        daily = pd.DataFrame({
+            'merchant': keys,
+            'day': day_numbers(td_df[TIME_COL]),
+            'sales': td_df[VALUE_COL].to_numpy(),
+            'order': td_df[ORDER_COL].to_numpy(),
+        })
+        aggregations = {'sales': ('sales', 'sum'), 'orders': ('order', 'nunique')}
+        daily = daily[daily['merchant'] >= 0].groupby(['merchant', 'day'], sort=True).agg(**aggregations).reset_index()
+
+        merchant_codes = daily['merchant'].to_numpy()
+        days = daily['day'].to_numpy().astype(np.int64)
+        block_starts = np.flatnonzero(np.r_[True, merchant_codes[1:] != merchant_codes[:-1]]) if len(daily) else np.array([], dtype=np.int64)
+        block_ends = np.r_[block_starts[1:], len(daily)].astype(np.int64)
+
+        first_days = days[block_starts]
+        spans = days[block_ends - 1] - first_days + 1
+        bases = np.concatenate(([0], np.cumsum(spans + 1)[:-1])).astype(np.int64)
+        total_cells = int((spans + 1).sum())
+
+        # Scatter each (merchant, day) total into its dense cell, then prefix-sum per merchant
+        cell = np.repeat(bases - first_days + 1, block_ends - block_starts) + days
+        self.columns = ['sales', 'orders']
+        self.cumulative = {}
+        for column in self.columns:
+            # Extended precision keeps prefix-sum differences from drifting off the raw sum
+            dense = np.zeros(total_cells, dtype=np.longdouble if column == 'sales' else np.int64)
+            dense[cell] = daily[column].to_numpy()
+            for base, span in zip(bases, spans):
+                np.cumsum(dense[base:base + span + 1], out=dense[base:base + span + 1])
+            self.cumulative[column] = dense
+
+        # merchant_id -> (base cell, first day, number of days)
+        self.offsets = {
+            str(labels[code]): (int(base), int(first), int(span))
+            for code, base, first, span in zip(merchant_codes[block_starts], bases, first_days, spans)
+        }
+        self.rows = len(td_df)
+        self.first_day = int(days.min()) if len(days) else None
+        self.last_day = int(days.max()) if len(days) else None
+
+    def covers(self, td_df):
+        """True if this rollup was built for a table of this shape."""
+        return td_df is not None and len(td_df) == self.rows
+
+    def appended(self, td_df, merchant_time, affected):
+        """Rollup for td_df after an append, recomputing only the changed days.
+
+        Args:
+            merchant_time (MerchantTimeIndex): The index of td_df.
+            affected (dict): merchant_id -> (first day, last day) with new rows.
+        Returns:
+            DailySalesRollup: A new rollup; this one is unchanged.
+        """
+        merchants = list(affected)
+        positions, owners = merchant_time.day_positions([(m,) + tuple(affected[m]) for m in merchants])
+        rows = td_df.iloc[positions]
+        daily = pd.DataFrame({
+            'merchant': owners,
+            'day': day_numbers(rows[TIME_COL]),
+            'sales': rows[VALUE_COL].to_numpy(),
+            'order': rows[ORDER_COL].to_numpy(),
+        })
+        aggregations = {'sales': ('sales', 'sum'), 'orders': ('order', 'nunique')}
+        daily = daily.groupby(['merchant', 'day'], sort=True).agg(**aggregations).reset_index()
+        bounds = np.searchsorted(daily['merchant'].to_numpy(), np.arange(len(merchants) + 1))
+        days = daily['day'].to_numpy().astype(np.int64)
+        totals = {c: daily[c].to_numpy() for c in self.columns}
+
+        blocks = {
+            merchant: (first, {c: self.cumulative[c][base:base + span + 1] for c in self.columns})
+            for merchant, (base, first, span) in self.offsets.items()
+        }
+        for key, merchant in enumerate(merchants):
+            day_lo, day_hi = affected[merchant]
+            cells = days[bounds[key]:bounds[key + 1]] - day_lo
+            first, cumulative = blocks.get(merchant, (None, {}))
+            spliced = {}
+            for column in self.columns:
+                values = np.zeros(day_hi - day_lo + 1, dtype=self.cumulative[column].dtype)
+                values[cells] = totals[column][bounds[key]:bounds[key + 1]]
+                new_first, spliced[column] = _splice_days(first, cumulative.get(column), day_lo, day_hi, values)
+            blocks[merchant] = (new_first, spliced)
+
+        new = copy.copy(self)
+        new.offsets = {}
+        base = 0
+        for merchant, (first, cumulative) in blocks.items():
+            span = len(cumulative[self.columns[0]]) - 1
+            new.offsets[merchant] = (base, int(first), span)
+            base += span + 1
+        new.cumulative = {
+            c: np.concatenate([cumulative[c] for _, cumulative in blocks.values()])
+            if blocks else self.cumulative[c]
+            for c in self.columns
+        }
+        firsts = [first for _, first, _ in new.offsets.values()]
+        lasts = [first + span - 1 for _, first, span in new.offsets.values()]
+        new.first_day = min(firsts) if firsts else None
+        new.last_day = max(lasts) if lasts else None
+        new.rows = len(td_df)
+        return new
+
+    def window_totals(self, merchant_id, start_day, end_day):
+        """Totals for merchant over the inclusive day range, in O(1).
+
+        Returns:
+            dict: {'sales', 'orders'}; both zero if there were no orders.
+        """
+        totals = {'sales': 0.0, 'orders': 0}
+        entry = self.offsets.get(str(merchant_id))
+        if entry is None:
+            return totals
+        base, first, span = entry
+        lo = max(start_day, first) - first
+        hi = min(end_day, first + span - 1) - first
+        if hi < lo:
+            return totals
+        for column in self.columns:
+            cum = self.cumulative[column]
+            value = cum[base + hi + 1] - cum[base + lo]
+            totals[column] = np.float64(value) if column == 'sales' else int(value)
+        return totals
+
+
+def order_item_pairs(td_df, ti_df, order_items):
+    """Distinct (order, item) pairs of transaction_items, tagged with the order's merchant and day.
+
+    Returns:
+        tuple: (DataFrame of integer 'order', 'item', 'merchant', 'day' columns,
+            item_id label of each item key, merchant_id label of each merchant key)
+    """
+    # Merchant and day of every order code, taken from transaction_data
+    row_merchants, merchant_labels = merchant_keys(td_df[MERCHANT_COL])
+    td_codes = order_items.codes_for(td_df[ORDER_COL])
+    known = td_codes >= 0
+    size = len(order_items.indptr) - 1
+    order_merchant = np.full(size, -1, dtype=np.int64)
+    order_day = np.zeros(size, dtype=np.int64)
+    order_merchant[td_codes[known]] = row_merchants[known]
+    order_day[td_codes[known]] = day_numbers(td_df[TIME_COL])[known]
+
+    # One entry per distinct (order, item) pair of each transaction_items row
+    if isinstance(ti_df[ITEM_COL].dtype, pd.CategoricalDtype):
+        item_keys = ti_df[ITEM_COL].cat.codes.to_numpy().astype(np.int64)
+        item_labels = ti_df[ITEM_COL].cat.categories
+    else:
+        item_keys, item_labels = pd.factorize(ti_df[ITEM_COL], sort=True)
+    pairs = pd.DataFrame({'order': order_items.row_codes(), 'item': item_keys})
+    pairs = pairs[(pairs['order'] >= 0) & (pairs['item'] >= 0)].drop_duplicates()
+    pairs['merchant'] = order_merchant[pairs['order'].to_numpy()]
+    pairs['day'] = order_day[pairs['order'].to_numpy()]
+    return pairs[pairs['merchant'] >= 0], item_labels, merchant_labels
+
+
+def _window_pairs(td_rows, windows, ti_df, order_items):
+    """Distinct (window, order, item) of some transaction_data rows, with the order's day.
+
+    The incremental counterpart of order_item_pairs: only the items of the
+    given orders are gathered (through the order_items CSR), and items are
+    returned as item_id strings.
+
+    Args:
+        windows (ndarray): The window (any integer key) of each td_rows row.
+    Returns:
+        DataFrame: 'window', 'order' (code), 'day' and 'item' (item_id) columns.
+    """
+    codes = order_items.codes_for(td_rows[ORDER_COL])
+    known = np.flatnonzero(codes >= 0)
+    positions, owners = order_items.rows_of(codes[known])
+    rows = known[owners]
+    pairs = pd.DataFrame({
+        'window': windows[rows],
+        'order': codes[rows],
+        'day': day_numbers(td_rows[TIME_COL])[rows],
+        'item': np.asarray(ti_df[ITEM_COL].iloc[positions], dtype=object),
+    })
+    pairs = pairs[pairs['item'].notna()].drop_duplicates(['window', 'order', 'item'])
+    pairs['item'] = pairs['item'].astype(str)
+    return pairs
+
+
+def _window_counts(pairs, label_col, windows):
+    """Per-window (day, label) distinct-order counts of _window_pairs output.
+
+    Returns:
+        list: one (days, labels, counts) array triple per window key 0..windows-1.
+    """
+    counts = pairs.groupby(['window', 'day', label_col], sort=True).size().reset_index(name='orders')
+    bounds = np.searchsorted(counts['window'].to_numpy(), np.arange(windows + 1))
+    columns = [counts['day'].to_numpy().astype(np.int64), counts[label_col].to_numpy(), counts['orders'].to_numpy()]
+    return [tuple(c[bounds[w]:bounds[w + 1]] for c in columns) for w in range(windows)]
+
+
+def _splice_labels(entry_first, entry_labels, cumulative, day_lo, day_hi, counts):
+    """Splices recounted (day, label) counts over days [day_lo, day_hi] into a cube entry.
+
+    Returns:
+        tuple: (first day, labels, cumulative matrix), or None for a new entry
+            with nothing to count.
+    """
+    days, labels, values = counts
+    new_labels = np.unique(labels.astype(object))
+    if cumulative is None:
+        if not len(days):
+            return None
+        merged = new_labels
+    else:
+        merged, cumulative = _union_columns(entry_labels, cumulative, new_labels)
+    matrix = np.zeros((day_hi - day_lo + 1, len(merged)), dtype=np.int32)
+    matrix[days - day_lo, pd.Index(merged).get_indexer(labels)] = values
+    first_day, cumulative = _splice_days(entry_first, cumulative, day_lo, day_hi, matrix)
+    return first_day, merged, cumulative
+
+
+def _rank_positions(counts, top_n, ascending=False):
+    """Positions of the top (or bottom) N non-zero counts; ties go to the lower position."""
+    present = np.flatnonzero(counts > 0)
+    if len(present) == 0 or top_n <= 0:
+        return present[:0]
+    # One int64 key orders by count, then by position
+    signed = counts[present].astype(np.int64) if ascending else -counts[present].astype(np.int64)
+    keys = signed * (len(counts) + 1) + present
+    k = min(top_n, len(present))
+    chosen = np.argpartition(keys, k - 1)[:k] if k < len(present) else np.arange(len(present))
+    return present[chosen[np.argsort(keys[chosen])]]
+
+
+def city_cuisine_orders(pairs, item_labels, merchant_labels, merchant_df, items_df):
+    """Distinct (city, day, cuisine, order) rows for the order_item_pairs output.
+
+    An order belongs to the city of its merchant (merchant table) and to each
+    cuisine_tag carried by one of its items (items table).
+
+    Returns:
+        tuple: (DataFrame of integer 'city', 'day', 'cuisine', 'order' columns,
+            city_id label of each city key, cuisine_tag of each cuisine key;
+            both label sets are sorted)
+    """
+    # item key -> cuisine key, merchant key -> city key (many-to-many in principle)
+    tagged = items_df[[ITEM_COL, CUISINE_COL]].dropna().drop_duplicates()
+    cuisine_keys, cuisine_labels = pd.factorize(tagged[CUISINE_COL].astype(str), sort=True)
+    item_cuisines = pd.DataFrame({
+        'item': pd.Index(item_labels).get_indexer(tagged[ITEM_COL].astype(str).to_numpy()),
+        'cuisine': cuisine_keys,
+    })
+    located = merchant_df[[MERCHANT_COL, CITY_COL]].dropna().drop_duplicates()
+    city_keys, city_labels = pd.factorize(located[CITY_COL].astype(str), sort=True)
+    merchant_cities = pd.DataFrame({
+        'merchant': pd.Index(merchant_labels).get_indexer(located[MERCHANT_COL].astype(str).to_numpy()),
+        'city': city_keys,
+    })
+
+    orders = pairs.merge(item_cuisines[item_cuisines['item'] >= 0], on='item')
+    orders = orders.merge(merchant_cities[merchant_cities['merchant'] >= 0], on='merchant')
+    orders = orders[['city', 'day', 'cuisine', 'order']].drop_duplicates()
+    return orders, city_labels, cuisine_labels
+
+
+# --- Per-Merchant Item Popularity Cube ---
+class ItemPopularityCube:
+    """(merchant, day, item) -> distinct orders, with cumulative sums over days.
+
+    For each merchant the cube is a dense (days + 1) x items matrix of prefix
+    sums, restricted to the items that appear in that merchant's orders. A
+    window's per-item distinct-order counts are one row subtraction, and top /
+    bottom N come from an argpartition over that small vector. Counts add up
+    across days because every order has a single timestamp.
+
+    Items are attributed to the merchant of the *order* (as the scan-based
+    analyses do), and item names are joined once here.
+    """
+
+    def __init__(self, td_df, ti_df, items_df, order_items):
+        pairs, item_labels, merchant_labels = order_item_pairs(td_df, ti_df, order_items)
+        counts = pairs.groupby(['merchant', 'day', 'item'], sort=True).size().reset_index(name='orders')
+
+        names = {}
+        if items_df is not None and ITEM_COL in items_df.columns and ITEM_NAME_COL in items_df.columns:
+            first_names = items_df[[ITEM_COL, ITEM_NAME_COL]].dropna(subset=[ITEM_COL]).drop_duplicates(subset=[ITEM_COL])
+            names = dict(zip(first_names[ITEM_COL].astype(str), first_names[ITEM_NAME_COL]))
+
+        # merchant_id -> (first day, items, item names, cumulative matrix)
+        self.merchants = {}
+        for merchant_key, block in counts.groupby('merchant', sort=False):
+            days = block['day'].to_numpy()
+            item_codes, item_pos = np.unique(block['item'].to_numpy(), return_inverse=True)
+            first_day = int(days.min())
+            dense = np.zeros((int(days.max()) - first_day + 2, len(item_codes)), dtype=np.int32)
+            np.add.at(dense, (days - first_day + 1, item_pos), block['orders'].to_numpy())
+            np.cumsum(dense, axis=0, out=dense)
+            labels = np.array([str(item_labels[c]) for c in item_codes], dtype=object)
+            item_names = np.array([names.get(label, pd.NA) for label in labels], dtype=object)
+            self.merchants[str(merchant_labels[merchant_key])] = (first_day, labels, item_names, dense)
+        self.rows = (len(td_df), len(ti_df))
+        self._names = names  # item_id -> first item_name, for appended()
+
+    def covers(self, td_df, ti_df):
+        """True if this cube was built for tables of these shapes."""
+        return td_df is not None and ti_df is not None and (len(td_df), len(ti_df)) == self.rows
+
+    def appended(self, td_df, ti_df, merchant_time, order_items, affected):
+        """Cube for the tables after an append, recounting only the changed (merchant, day) cells.
+
+        Args:
+            merchant_time, order_items: The indexes of td_df and ti_df.
+            affected (dict): merchant_id -> (first day, last day) whose orders
+                or order items changed.
+        Returns:
+            ItemPopularityCube: A new cube; this one is unchanged.
+        """
+        merchants = list(affected)
+        positions, owners = merchant_time.day_positions([(m,) + tuple(affected[m]) for m in merchants])
+        pairs = _window_pairs(td_df.iloc[positions], owners, ti_df, order_items)
+
+        new = copy.copy(self)
+        new.merchants = dict(self.merchants)
+        for merchant, counts in zip(merchants, _window_counts(pairs, 'item', len(merchants))):
+            first_day, labels, _, cumulative = new.merchants.get(merchant, (None, None, None, None))
+            entry = _splice_labels(first_day, labels, cumulative, *affected[merchant], counts)
+            if entry is not None:
+                first_day, labels, cumulative = entry
+                item_names = np.array([self._names.get(label, pd.NA) for label in labels], dtype=object)
+                new.merchants[merchant] = (first_day, labels, item_names, cumulative)
+        new.rows = (len(td_df), len(ti_df))
+        return new
+
+    def window_counts(self, merchant_id, start_day, end_day):
+        """(item labels, item names, distinct-order counts) for the inclusive day range."""
+        entry = self.merchants.get(str(merchant_id))
+        if entry is None:
+            return None
+        first_day, labels, item_names, cumulative = entry
+        last_day = first_day + cumulative.shape[0] - 2
+        lo = max(start_day, first_day) - first_day
+        hi = min(end_day, last_day) - first_day
+        if hi < lo:
+            return None
+        return labels, item_names, cumulative[hi + 1] - cumulative[lo]
+
+    def rank(self, merchant_id, start_day, end_day, top_n=5, ascending=False):
+        """Top (or bottom, if ascending) N items by distinct orders in the window.
+
+        Only items ordered in the window are ranked. Ties are broken by item ID,
+        so results are deterministic.
+
+        Returns:
+            list: [(item_id, item_name or NA, count)], possibly empty.
+        """
+        window = self.window_counts(merchant_id, start_day, end_day)
+        if window is None or top_n <= 0:
+            return []
+        labels, item_names, counts = window
+        # Items are in ID order, so position breaks ties
+        return [(labels[i], item_names[i], int(counts[i])) for i in _rank_positions(counts, top_n, ascending)]
+
+# --- City/Cuisine/Day Aggregate ---
+class CityCuisineCube:
+    """(city, day, cuisine) -> distinct orders, with cumulative sums over days.
+
+    Orders belong to a city through their merchant (merchant table), and to a
+    cuisine through any of their items that carries that cuisine_tag (items
+    table), exactly as the scan in get_popular_cuisines_in_city joins them. An
+    order counts once per cuisine, however many of its items share the tag.
+    Per city the cube is a dense (days + 1) x cuisines prefix-sum matrix, so a
+    window's ranking is one row subtraction plus an argpartition.
+    """
+
+    def __init__(self, td_df, ti_df, merchant_df, items_df, order_items):
+        pairs, item_labels, merchant_labels = order_item_pairs(td_df, ti_df, order_items)
+        orders, city_labels, cuisine_labels = city_cuisine_orders(
+            pairs, item_labels, merchant_labels, merchant_df, items_df
+        )
+        counts = orders.groupby(['city', 'day', 'cuisine'], sort=True).size().reset_index(name='orders')
+
+        # city_id -> (first day, cuisines, cumulative matrix)
+        self.cuisines = np.asarray(cuisine_labels, dtype=object)
+        self.cities = {}
+        for city_key, block in counts.groupby('city', sort=False):
+            days = block['day'].to_numpy()
+            cuisine_codes, cuisine_pos = np.unique(block['cuisine'].to_numpy(), return_inverse=True)
+            first_day = int(days.min())
+            dense = np.zeros((int(days.max()) - first_day + 2, len(cuisine_codes)), dtype=np.int32)
+            np.add.at(dense, (days - first_day + 1, cuisine_pos), block['orders'].to_numpy())
+            np.cumsum(dense, axis=0, out=dense)
+            self.cities[str(city_labels[city_key])] = (first_day, self.cuisines[cuisine_codes], dense)
+        self.rows = (len(td_df), len(ti_df), len(merchant_df), len(items_df))
+
+        # merchant_id -> city_ids, city_id -> merchant_ids, item_id -> cuisine_tags, for appended()
+        located = merchant_df[[MERCHANT_COL, CITY_COL]].dropna().drop_duplicates().astype(str)
+        self._cities_of = located.groupby(MERCHANT_COL, sort=False)[CITY_COL].agg(list).to_dict()
+        self._merchants_in = located.groupby(CITY_COL, sort=False)[MERCHANT_COL].agg(list).to_dict()
+        tagged = items_df[[ITEM_COL, CUISINE_COL]].dropna().drop_duplicates().astype(str)
+        self._cuisines_of = tagged.groupby(ITEM_COL, sort=False)[CUISINE_COL].agg(list).to_dict()
+
+    def covers(self, td_df, ti_df, merchant_df, items_df):
+        """True if this cube was built for tables of these shapes."""
+        tables = (td_df, ti_df, merchant_df, items_df)
+        return all(t is not None for t in tables) and tuple(len(t) for t in tables) == self.rows
+
+    def appended(self, td_df, ti_df, merchant_time, order_items, affected):
+        """Cube for the tables after an append, recounting only the changed (city, day) cells.
+
+        The merchant and items tables must be unchanged; see
+        ItemPopularityCube.appended for the arguments.
+
+        Returns:
+            CityCuisineCube: A new cube; this one is unchanged.
+        """
+        windows = {}
+        for merchant, (day_lo, day_hi) in affected.items():
+            for city in self._cities_of.get(merchant, ()):
+                lo, hi = windows.get(city, (day_lo, day_hi))
+                windows[city] = (min(lo, day_lo), max(hi, day_hi))
+
+        # One window per (city, merchant in the city), keyed by the city
+        cities = list(windows)
+        merchant_windows, city_keys = [], []
+        for key, city in enumerate(cities):
+            for merchant in self._merchants_in[city]:
+                merchant_windows.append((merchant,) + windows[city])
+                city_keys.append(key)
+        positions, owners = merchant_time.day_positions(merchant_windows)
+        pairs = _window_pairs(td_df.iloc[positions], np.asarray(city_keys, dtype=np.int64)[owners], ti_df, order_items)
+        pairs['cuisine'] = pairs['item'].map(self._cuisines_of)
+        orders = pairs.explode('cuisine').dropna(subset=['cuisine']).drop_duplicates(['window', 'order', 'cuisine'])
+
+        new = copy.copy(self)
+        new.cities = dict(self.cities)
+        for city, counts in zip(cities, _window_counts(orders, 'cuisine', len(cities))):
+            first_day, cuisines, cumulative = new.cities.get(city, (None, None, None))
+            entry = _splice_labels(first_day, cuisines, cumulative, *windows[city], counts)
+            if entry is not None:
+                new.cities[city] = entry
+        new.rows = (len(td_df), len(ti_df)) + self.rows[2:]
+        return new
+
+    def rank(self, city_id, start_day, end_day, top_n=5):
+        """Top N cuisines by distinct orders in the inclusive day range.
+
+        Ties are broken by cuisine tag, so results are deterministic.
+
+        Returns:
+            list: [(cuisine_tag, count)], possibly empty.
+        """
+        entry = self.cities.get(str(city_id))
+        if entry is None:
+            return []
+        first_day, cuisines, cumulative = entry
+        last_day = first_day + cumulative.shape[0] - 2
+        lo = max(start_day, first_day) - first_day
+        hi = min(end_day, last_day) - first_day
+        if hi < lo:
+            return []
+        counts = cumulative[hi + 1] - cumulative[lo]
+        return [(cuisines[i], int(counts[i])) for i in _rank_positions(counts, top_n)]
+
+
+def build_indexes(local_datasets):
+    """Builds the lookup structures over the loaded tables.
+
+    Returns:
+        dict: index name -> index object (stored under datasets['indexes']).
+    """
+    indexes = {}
+    td_df = local_datasets.get('transaction_data')
+    if td_df is not None and MERCHANT_COL in td_df.columns and TIME_COL in td_df.columns:
+        indexes['merchant_time'] = MerchantTimeIndex(td_df)
+        if VALUE_COL in td_df.columns and ORDER_COL in td_df.columns:
+            indexes['daily_sales'] = DailySalesRollup(td_df)
+    ti_df = local_datasets.get('transaction_items')
+    if ti_df is not None and ORDER_COL in ti_df.columns:
+        indexes['order_items'] = OrderItemsIndex(ti_df)
+        if 'merchant_time' in indexes and ITEM_COL in ti_df.columns:
+            indexes['item_popularity'] = ItemPopularityCube(
+                td_df, ti_df, local_datasets.get('items'), indexes['order_items']
+            )
+        m_df, i_df = local_datasets.get('merchant'), local_datasets.get('items')
+        if (
+            'item_popularity' in indexes
+            and m_df is not None and CITY_COL in m_df.columns and MERCHANT_COL in m_df.columns
+            and i_df is not None and CUISINE_COL in i_df.columns and ITEM_COL in i_df.columns
+        ):
+            indexes['city_cuisine'] = CityCuisineCube(td_df, ti_df, m_df, i_df, indexes['order_items'])
+    return indexes
@@ -0,0 +1,230 @@
+# data_ingest.py
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from pandas.api.types import union_categoricals
+
+try:
+    import resource  # Unix only; peak RSS is reported as unknown elsewhere
+except ImportError:
+    resource = None
+
+# Rows per read_csv chunk. Bounds the transient memory of parsing + cleaning.
+CSV_CHUNK_ROWS = int(os.getenv('MEX_CSV_CHUNK_ROWS', '250000'))
+
+# order_time is written as e.g. '2023-06-07 12:39:00'. Parsing with an explicit
+# format is the fast path; only values that fail it fall back to inference.
+ORDER_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# --- Table Schemas ---
+# Only the columns the analyses use are parsed. Column kinds:
+#   'id'        - string identifier, whitespace stripped (categorical in compact mode)
+#   'text'      - free text, kept as-is
+#   'tag'       - short label, whitespace stripped, empty -> NA
+#   'number'    - coerced to float, non-numeric -> 0
+#   'timestamp' - parsed into '<name>_dt'; rows that fail are dropped, raw text is not kept
+# A schema with 'columns': None is read whole, without cleaning.
+TABLE_SCHEMAS = {
+    'merchant': {
+        'columns': {'merchant_id': 'id', 'city_id': 'id'},
+    },
+    'transaction_data': {
+        'columns': {
+            'order_id': 'id',
+            'order_time': 'timestamp',
+            'order_value': 'number',
+            'eater_id': 'id',
+            'merchant_id': 'id',
+        },
+    },
+    'transaction_items': {
+        'columns': {'order_id': 'id', 'item_id': 'id', 'merchant_id': 'id'},
+    },
+    'items': {
+        'columns': {'item_id': 'id', 'cuisine_tag': 'tag', 'item_name': 'text', 'merchant_id': 'id'},
+    },
+    'keywords': {
+        'columns': None,
+        'index_col': 0,
+    },
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# --- Chunk Cleaning ---
+def _parse_timestamps(raw):
+    parsed = pd.to_datetime(raw, format=ORDER_TIME_FORMAT, errors='coerce')
+    retry = parsed.isna() & raw.notna()
+    if retry.any():
+        # Cost is proportional to the number of odd rows, not the chunk
+        parsed[retry] = pd.to_datetime(raw[retry], format='mixed', errors='coerce')
+    return parsed
+
+
+def _clean_chunk(chunk, columns, compact_ids, stats):
+    valid = None
+    for col, kind in columns.items():
+        if col not in chunk.columns:
+            continue
+        if kind == 'id':
+            chunk[col] = chunk[col].str.strip()
+            if compact_ids:
+                chunk[col] = chunk[col].astype('category')
+        elif kind == 'tag':
+            chunk[col] = chunk[col].str.strip().replace('', np.nan)
+        elif kind == 'number':
+            values = pd.to_numeric(chunk[col], errors='coerce')
+            stats['coerced_' + col] = stats.get('coerced_' + col, 0) + int(values.isna().sum())
+            chunk[col] = values.fillna(0)
+        elif kind == 'timestamp':
+            parsed = _parse_timestamps(chunk[col])
+            ok = parsed.notna().to_numpy()
+            stats['dropped_' + col] = stats.get('dropped_' + col, 0) + int((~ok).sum())
+            valid = ok if valid is None else valid & ok
+            chunk[col + '_dt'] = parsed
+            chunk = chunk.drop(columns=[col])
+    # Rows are dropped once, after every column has been cleaned
+    if valid is not None and not valid.all():
+        chunk = chunk[valid]
+    return chunk
+
+
+def _concat_chunks(chunks):
+    """Concatenates cleaned chunks, keeping per-chunk categoricals categorical."""
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0]
+    for col in chunks[0].columns:
+        if isinstance(chunks[0][col].dtype, pd.CategoricalDtype):
+            merged = union_categoricals([c[col] for c in chunks]).categories
+            dtype = pd.CategoricalDtype(categories=merged)
+            for c in chunks:
+                c[col] = c[col].astype(dtype)
+    return pd.concat(chunks)
+
+
+# --- Table Readers ---
+def read_table(data_dir, file_name, schema, compact_ids=False, chunk_rows=None):
+    """Reads one CSV in chunks according to its schema.
+
+    Returns:
+        tuple: (DataFrame, stats dict with rows, seconds and cleaning counts)
+    """
+    path = os.path.join(data_dir, file_name)
+    columns = schema.get('columns')
+    stats = {'file': file_name}
+    started = time.perf_counter()
+
+    if columns is None:
+        df = pd.read_csv(path, index_col=schema.get('index_col'))
+        stats['rows_read'] = len(df)
+    else:
+        header = pd.read_csv(path, nrows=0).columns
+        missing = [c for c in columns if c not in header]
+        if missing:
+            # Reported as missing by the required-column check in data_utils
+            print(f"Data Ingest ⚠️: {file_name} has no column(s) {missing}.")
+        usecols = [c for c in columns if c in header]
+        chunks = []
+        rows_read = 0
+        reader = pd.read_csv(
+            path,
+            usecols=usecols,
+            dtype={c: str for c in usecols},
+            keep_default_na=False,
+            na_values=[''],
+            chunksize=chunk_rows or CSV_CHUNK_ROWS,
+        )
+        for chunk in reader:
+            rows_read += len(chunk)
+            chunks.append(_clean_chunk(chunk, columns, compact_ids, stats))
+        df = _concat_chunks(chunks)
+        if len(df) and not df.index.is_unique:
+            df = df.reset_index(drop=True)
+        stats['rows_read'] = rows_read
+
+    stats['rows'] = len(df)
+    stats['seconds'] = time.perf_counter() - started
+    stats['rows_per_sec'] = stats['rows_read'] / stats['seconds'] if stats['seconds'] > 0 else None
+    stats['memory_mb'] = df.memory_usage(index=True, deep=True).sum() / (1024 * 1024)
+    return df, stats
+
+
+def ingest_tables(data_dir, table_files, compact_ids=False, max_workers=None):
+    """Reads all tables concurrently (pandas' CSV parser releases the GIL).
+
+    Returns:
+        tuple: (dict of DataFrames, report dict). Exceptions from any table propagate.
+    """
+    started = time.perf_counter()
+    rss_before = peak_rss_mb()
+    local_datasets = {}
+    tables = {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(table_files)) as pool:
+        futures = {
+            table: pool.submit(read_table, data_dir, file_name, TABLE_SCHEMAS.get(table, {'columns': None}), compact_ids)
+            for table, file_name in table_files.items()
+        }
+        for table, future in futures.items():
+            local_datasets[table], tables[table] = future.result()
+
+    seconds = time.perf_counter() - started
+    total_rows = sum(s['rows_read'] for s in tables.values())
+    report = {
+        'tables': tables,
+        'seconds': seconds,
+        'rows_read': total_rows,
+        'rows_per_sec': total_rows / seconds if seconds > 0 else None,
+        'final_memory_mb': sum(s['memory_mb'] for s in tables.values()),
+        'peak_rss_mb_before': rss_before,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    return local_datasets, report
+
+
+def format_report(report):
+    """Human-readable ingestion summary for logs and host sizing."""
+    lines = ["Data Ingest: table               rows_read        rows   seconds     rows/s   memory MB"]
+    for table, s in report['tables'].items():
+        lines.append(
+            f"Data Ingest: {table:<18}{s['rows_read']:>11,}{s['rows']:>12,}{s['seconds']:>10.2f}"
+            f"{(s['rows_per_sec'] or 0):>11,.0f}{s['memory_mb']:>12.1f}"
+        )
+        for key, value in s.items():
+            if (key.startswith('coerced_') or key.startswith('dropped_')) and value:
+                lines.append(f"Data Ingest:     {key.replace('_', ' ', 1)}: {value:,} rows")
+    peak = report['peak_rss_mb']
+    lines.append(
+        f"Data Ingest: total {report['rows_read']:,} rows in {report['seconds']:.2f}s "
+        f"({(report['rows_per_sec'] or 0):,.0f} rows/s); final tables {report['final_memory_mb']:.1f} MB; "
+        f"peak RSS {'n/a' if peak is None else f'{peak:.1f} MB'}"
+    )
+    return "\n".join(lines)
+
+
+# --- CLI: measure ingestion for host sizing ---
+if __name__ == "__main__":
+    import argparse
+    from data_utils import DATA_DIR, TABLE_FILES
+
+    parser = argparse.ArgumentParser(description="Parse the CSVs (bypassing the cache) and report rows/sec and peak memory.")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--compact-ids', action='store_true', help="Store ID columns as categoricals.")
+    parser.add_argument('--chunk-rows', type=int, default=None, help=f"Rows per chunk (default {CSV_CHUNK_ROWS}).")
+    args = parser.parse_args()
+    if args.chunk_rows:
+        CSV_CHUNK_ROWS = args.chunk_rows
+    _, ingest_report = ingest_tables(args.data_dir, TABLE_FILES, compact_ids=args.compact_ids)
+    print(format_report(ingest_report))
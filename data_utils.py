@@ -1,78 +1,249 @@
 # data_utils.py
 import os
+import threading
 import pandas as pd
 import traceback
 
+from data_ingest import TABLE_SCHEMAS, ingest_tables, format_report, read_table
+from data_index import build_indexes, sort_transactions, sort_transaction_items
+from dataset import REQUIRED_COLUMNS, Dataset, DatasetError
+from env_flags import env_flag
+from data_cache import (
+    cache_enabled,
+    cache_lock,
+    default_cache_dir,
+    load_cached_datasets,
+    save_cached_datasets,
+)
+
 # Assume data folder is in the same directory as app.py or set path accordingly
 DATA_DIR = 'data'
 
-def load_provided_data():
+# Source CSV for each table the analyses read (used for loading and for cache fingerprints)
+TABLE_FILES = {
+    'merchant': 'merchant.csv',
+    'transaction_data': 'transaction_data.csv',
+    'transaction_items': 'transaction_items.csv',
+    'items': 'items.csv',
+}
+
+# Tables no analysis reads: parsed on first use (see load_lazy_table), not at startup
+LAZY_TABLE_FILES = {
+    'keywords': 'keywords.csv',
+}
+
+# ID columns per table. Columns sharing a name share one dictionary in compact mode.
+ID_COLUMNS = {
+    'merchant': ['merchant_id', 'city_id'],
+    'transaction_data': ['merchant_id', 'order_id', 'eater_id'],
+    'transaction_items': ['order_id', 'item_id', 'merchant_id'],
+    'items': ['item_id', 'merchant_id']
+}
+
+# Per-transaction IDs the analyses only compare and group, never show. In shared
+# mode they are loaded as bare codes, without a string dictionary per process.
+OPAQUE_ID_COLUMNS = ('order_id', 'eater_id')
+
+# Timings, row counts and peak memory of the most recent CSV ingestion
+last_ingest_report = None
+
+_lazy_tables = {}
+_lazy_lock = threading.Lock()
+
+def compact_ids_enabled():
+    """Compact (categorical) IDs are opt-in via MEX_COMPACT_IDS=1."""
+    return env_flag('MEX_COMPACT_IDS', False)
+
+def shared_data_enabled():
+    """Shared-memory mode (see _load_shared_tables) is opt-in via MEX_SHARED_DATA=1."""
+    return env_flag('MEX_SHARED_DATA', False)
+
+def source_paths():
+    """Paths of the source CSVs (the cache fingerprints these)."""
+    return [os.path.join(DATA_DIR, name) for name in TABLE_FILES.values()]
+
+def load_lazy_table(name):
+    """A LAZY_TABLE_FILES table, parsed on the first call and kept; None if its CSV cannot be read."""
+    with _lazy_lock:
+        if name not in _lazy_tables:
+            try:
+                _lazy_tables[name], _ = read_table(DATA_DIR, LAZY_TABLE_FILES[name], TABLE_SCHEMAS.get(name, {'columns': None}))
+            except (OSError, ValueError) as e:
+                print(f"Data Utils ⚠️: Could not load '{LAZY_TABLE_FILES[name]}': {e}")
+                return None
+            print(f"Data Utils ✅: Loaded '{name}' on first use ({len(_lazy_tables[name]):,} rows).")
+        return _lazy_tables[name]
+
+def load_provided_data(use_cache=None, compact_ids=None, shared=None):
+    """Loads the preprocessed datasets, preferring the on-disk columnar cache.
+
+    The cache (see data_cache.py) holds the tables *after* preprocessing and is
+    only used while the source CSVs are unchanged; otherwise the CSVs are parsed
+    again and the cache is rebuilt. Lookup indexes (see data_index.py) are built
+    after loading, and everything is wrapped in a validated, read-only Dataset
+    (see dataset.py).
+
+    Args:
+        use_cache (bool, optional): Overrides the MEX_DATA_CACHE env setting.
+        compact_ids (bool, optional): Store ID columns as categoricals with
+            dictionaries shared across tables (see compact_id_columns).
+            Overrides the MEX_COMPACT_IDS env setting.
+        shared (bool, optional): Memory-map the tables from the cache so that
+            every process serving the same data shares one copy (see
+            _load_shared_tables). Implies the cache and compact IDs.
+            Overrides the MEX_SHARED_DATA env setting.
+    Returns:
+        Dataset: The tables (also readable as dataset['table_name']) and their
+            lookup indexes, if successful.
+        None: If loading, validation or critical preprocessing fails.
+    """
+    if shared is None:
+        shared = shared_data_enabled()
+    local_datasets = _load_shared_tables() if shared else _load_tables(use_cache, compact_ids)
+    if local_datasets is None:
+        return None
+    try:
+        indexes = build_indexes(local_datasets)
+    except Exception as e:
+        print(f"Data Utils ❌ FATAL: Could not build lookup indexes: {e}")
+        traceback.print_exc()
+        return None
+    print(f"Data Utils ✅: Built lookup indexes: {sorted(indexes)}.")
+    try:
+        dataset = Dataset(local_datasets, indexes=indexes)
+    except DatasetError as e:
+        print(f"Data Utils ❌ FATAL: Loaded data failed validation: {e}")
+        return None
+    print(f"Data Utils ✅: {dataset!r}, orders from {dataset.earliest_timestamp} to {dataset.latest_timestamp}.")
+    return dataset
+
+def _load_tables(use_cache=None, compact_ids=None):
+    """Returns the preprocessed tables from the cache or the CSVs (no indexes)."""
+    if use_cache is None:
+        use_cache = cache_enabled()
+    if compact_ids is None:
+        compact_ids = compact_ids_enabled()
+    if not use_cache:
+        return _load_and_preprocess_csvs(compact_ids)
+
+    cache_dir = default_cache_dir(DATA_DIR)
+    cache_options = {'compact_ids': bool(compact_ids)}
+    try:
+        sources = source_paths()
+        cached = load_cached_datasets(cache_dir, sources, options=cache_options)
+    except FileNotFoundError as e:
+        print(f"Data Utils ❌ FATAL: Data file not found: {e}. Ensure files are in '{DATA_DIR}'.")
+        return None
+    if cached is not None:
+        print(f"Data Utils ✅: Loaded preprocessed datasets from cache '{cache_dir}'.")
+        return cached
+
+    local_datasets = _load_and_preprocess_csvs(compact_ids)
+    if local_datasets is not None:
+        save_cached_datasets(cache_dir, sources, local_datasets, options=cache_options)
+    return local_datasets
+
+def _load_shared_tables():
+    """Returns the preprocessed tables as read-only memory maps of the cache.
+
+    Categorical codes, numbers and timestamps are views of the cache files, so
+    N worker processes (or servers on one host) keep a single copy of them in
+    the OS page cache; put the cache on tmpfs (MEX_DATA_CACHE_DIR=/dev/shm/...)
+    to pin it in RAM. IDs are always compact here, and OPAQUE_ID_COLUMNS are
+    loaded as bare codes, so what each process still holds privately is the
+    merchant/city/item dictionaries, the small text columns of the items table
+    and the lookup indexes. The first process to start builds a missing or
+    stale cache while the others wait for it.
+    """
+    cache_dir = default_cache_dir(DATA_DIR)
+    cache_options = {'compact_ids': True}
+    try:
+        sources = source_paths()
+        with cache_lock(cache_dir):
+            tables = load_cached_datasets(cache_dir, sources, options=cache_options, mmap=True, opaque_ids=OPAQUE_ID_COLUMNS)
+            if tables is None:
+                parsed = _load_and_preprocess_csvs(compact_ids=True)
+                if parsed is None:
+                    return None
+                if not save_cached_datasets(cache_dir, sources, parsed, options=cache_options):
+                    print("Data Utils ⚠️: Could not write the cache; this process keeps a private copy of the data.")
+                    return parsed
+                tables = load_cached_datasets(cache_dir, sources, options=cache_options, mmap=True, opaque_ids=OPAQUE_ID_COLUMNS)
+    except FileNotFoundError as e:
+        print(f"Data Utils ❌ FATAL: Data file not found: {e}. Ensure files are in '{DATA_DIR}'.")
+        return None
+    if tables is not None:
+        print(f"Data Utils ✅: Memory-mapped preprocessed datasets from cache '{cache_dir}' (shared mode).")
+    return tables
+
+def compact_id_columns(local_datasets):
+    """Converts string ID columns to categoricals, in place.
+
+    Every column with the same name (e.g. 'order_id' in transaction_data and
+    transaction_items) gets the *same* CategoricalDtype, so equality, isin and
+    merges between tables compare integer codes instead of Python strings.
+    Values still read back as the original strings when results are formatted.
+    """
+    columns_by_name = {}
+    for table, cols in ID_COLUMNS.items():
+        if table in local_datasets:
+            for col in cols:
+                if col in local_datasets[table].columns:
+                    columns_by_name.setdefault(col, []).append(table)
+
+    for col, tables in columns_by_name.items():
+        values = [local_datasets[t][col] for t in tables]
+        if len(values) == 1 and isinstance(values[0].dtype, pd.CategoricalDtype):
+            continue
+        uniques = [
+            v.cat.categories if isinstance(v.dtype, pd.CategoricalDtype) else pd.Index(v.dropna().astype(str).unique())
+            for v in values
+        ]
+        categories = uniques[0].append(uniques[1:]).unique().sort_values()
+        shared_dtype = pd.CategoricalDtype(categories=categories)
+        for t in tables:
+            column = local_datasets[t][col]
+            if not isinstance(column.dtype, pd.CategoricalDtype):
+                column = column.where(column.isna(), column.astype(str))
+            # Categorical -> categorical recodes the integer codes; no strings are built
+            local_datasets[t][col] = column.astype(shared_dtype)
+        print(f"Data Utils: Compacted '{col}' in {tables} to a shared dictionary of {len(categories)} IDs.")
+    return local_datasets
+
+def _load_and_preprocess_csvs(compact_ids=False):
     """Loads and preprocesses all required CSV datasets.
+
+    Tables are read concurrently, in chunks, parsing only the columns declared in
+    data_ingest.TABLE_SCHEMAS; numeric coercion, ID normalisation and dropping
+    rows with bad timestamps all happen chunk by chunk (see data_ingest.py).
+
     Returns:
         dict: A dictionary containing pandas DataFrames for each dataset if successful.
         None: If loading or critical preprocessing fails.
     """
-    local_datasets = {} # Use a local dictionary to store loaded data
+    global last_ingest_report
     print(f"Data Utils: Attempting to load datasets from '{DATA_DIR}' directory...")
     try:
-        # --- Load data with correct index_col settings based on schema ---
-        local_datasets['merchant'] = pd.read_csv(os.path.join(DATA_DIR, 'merchant.csv'))
-        local_datasets['transaction_data'] = pd.read_csv(os.path.join(DATA_DIR, 'transaction_data.csv'), index_col=0)
-        local_datasets['transaction_items'] = pd.read_csv(os.path.join(DATA_DIR, 'transaction_items.csv'), index_col=0)
-        local_datasets['items'] = pd.read_csv(os.path.join(DATA_DIR, 'items.csv'))
-        local_datasets['keywords'] = pd.read_csv(os.path.join(DATA_DIR, 'keywords.csv'), index_col=0)
+        # --- Chunked load + per-chunk preprocessing (steps 1-3, 5) ---
+        local_datasets, report = ingest_tables(DATA_DIR, TABLE_FILES, compact_ids=compact_ids)
+        last_ingest_report = report
         print("Data Utils: Initial dataset load complete.")
+        print(format_report(report))
 
-        # --- Data Preprocessing ---
-        print("Data Utils: Starting data preprocessing...")
-
-        # 1. Convert order_value to numeric, handle errors
-        if 'transaction_data' in local_datasets and 'order_value' in local_datasets['transaction_data'].columns:
-            local_datasets['transaction_data']['order_value'] = pd.to_numeric(local_datasets['transaction_data']['order_value'], errors='coerce')
-            nan_count = local_datasets['transaction_data']['order_value'].isnull().sum()
-            if nan_count > 0:
-                print(f"Data Utils Warning: {nan_count} values in 'order_value' were non-numeric and have been set to 0.")
-                local_datasets['transaction_data']['order_value'].fillna(0, inplace=True) # Fill NaN with 0 for calculations
-
-        # 2. Convert ID columns to string type
-        id_cols_to_str = {
-            'merchant': ['merchant_id', 'city_id'],
-            'transaction_data': ['merchant_id', 'order_id', 'eater_id'],
-            'transaction_items': ['order_id', 'item_id', 'merchant_id'],
-            'items': ['item_id', 'merchant_id']
-        }
-        for table, cols in id_cols_to_str.items():
-            if table in local_datasets:
-                for col in cols:
-                    if col in local_datasets[table].columns:
-                        if local_datasets[table][col].dtype != 'object': # Check if not already string/object
-                            local_datasets[table][col] = local_datasets[table][col].astype(str).str.strip()
-                    # else: print(f"Data Utils Info: Column '{col}' not found in table '{table}' for ID conversion.") # Optional info
-
-        # 3. Convert transaction_data 'order_time' to datetime objects
-        ts_col = 'order_time'
-        if 'transaction_data' in local_datasets and ts_col in local_datasets['transaction_data'].columns:
-            local_datasets['transaction_data']['order_time_dt'] = pd.to_datetime(local_datasets['transaction_data'][ts_col], errors='coerce')
-            initial_rows = len(local_datasets['transaction_data'])
-            # Drop rows where date conversion failed, as they are unusable for time series analysis
-            local_datasets['transaction_data'].dropna(subset=['order_time_dt'], inplace=True)
-            dropped_rows = initial_rows - len(local_datasets['transaction_data'])
-            if dropped_rows > 0:
-                print(f"Data Utils Info: Dropped {dropped_rows} rows due to invalid '{ts_col}' format.")
-            print(f"Data Utils ✅: Column '{ts_col}' processed into 'order_time_dt'.")
-        else:
-            print(f"Data Utils ⚠️ Critical: Timestamp column '{ts_col}' not found in 'transaction_data'. Cannot proceed.")
+        td_stats = report['tables'].get('transaction_data', {})
+        if td_stats.get('coerced_order_value'):
+            print(f"Data Utils Warning: {td_stats['coerced_order_value']} values in 'order_value' were non-numeric and have been set to 0.")
+        if td_stats.get('dropped_order_time'):
+            print(f"Data Utils Info: Dropped {td_stats['dropped_order_time']} rows due to invalid 'order_time' format.")
+        if 'order_time_dt' not in local_datasets['transaction_data'].columns:
+            print("Data Utils ⚠️ Critical: Timestamp column 'order_time' not found in 'transaction_data'. Cannot proceed.")
             return None # Return None as timestamp is critical
+        print("Data Utils ✅: Column 'order_time' processed into 'order_time_dt'.")
 
         # 4. Check for presence of essential columns used in analysis functions
-        req_cols_check = {
-            'merchant': ['merchant_id', 'city_id'],
-            'transaction_data': ['order_id', 'merchant_id', 'order_time_dt', 'order_value'],
-            'transaction_items': ['order_id', 'item_id', 'merchant_id'],
-            'items': ['item_id', 'item_name', 'cuisine_tag', 'merchant_id']
-        }
+        #    (dtypes are checked when the Dataset is built, see dataset.py)
         all_cols_present = True
-        for table, cols in req_cols_check.items():
+        for table, cols in REQUIRED_COLUMNS.items():
              if table not in local_datasets:
                  print(f"Data Utils ⚠️ Critical: Required data table '{table}' is missing.")
                  all_cols_present = False
@@ -86,10 +257,14 @@ def load_provided_data():
              print("Data Utils ❌: Missing critical columns identified above. Data loading failed.")
              return None # Indicate failure
 
-        # 5. Clean cuisine_tag (strip whitespace, replace empty strings with NA)
-        if 'items' in local_datasets and 'cuisine_tag' in local_datasets['items'].columns:
-             local_datasets['items']['cuisine_tag'] = local_datasets['items']['cuisine_tag'].astype(str).str.strip().replace('', pd.NA)
-             # print(f"Data Utils Info: Unique cuisine tags after cleaning: {local_datasets['items']['cuisine_tag'].dropna().unique()}")
+        # 5. Optionally store IDs as categoricals with shared dictionaries
+        if compact_ids:
+            compact_id_columns(local_datasets)
+
+        # 6. Physical sort orders backing the lookup indexes (see data_index.py):
+        #    transaction_data by (merchant_id, order_time_dt), transaction_items by order_id
+        local_datasets['transaction_data'] = sort_transactions(local_datasets['transaction_data'])
+        local_datasets['transaction_items'] = sort_transaction_items(local_datasets['transaction_items'])
 
         print("Data Utils ✅: Data preprocessing finished successfully.")
         return local_datasets # Return the dictionary of DataFrames
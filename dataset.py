@@ -0,0 +1,217 @@
+# dataset.py
+import itertools
+from collections.abc import Mapping
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+# Columns each table must have once preprocessing is done, and what they must hold:
+#   'id'        - strings, or categoricals (compact mode)
+#   'number'    - numeric dtype
+#   'timestamp' - datetime64 dtype
+#   'any'       - present, any dtype
+REQUIRED_COLUMNS = {
+    'merchant': {'merchant_id': 'id', 'city_id': 'id'},
+    'transaction_data': {'order_id': 'id', 'merchant_id': 'id', 'order_time_dt': 'timestamp', 'order_value': 'number'},
+    'transaction_items': {'order_id': 'id', 'item_id': 'id', 'merchant_id': 'id'},
+    'items': {'item_id': 'id', 'item_name': 'any', 'cuisine_tag': 'any', 'merchant_id': 'id'},
+}
+
+# Every Dataset gets a new version, so results derived from one are never served for another
+_versions = itertools.count(1)
+
+
+class DatasetError(ValueError):
+    """Raised when the tables do not match REQUIRED_COLUMNS."""
+
+
+def is_id_column(series):
+    """ID columns hold strings, or categoricals with shared dictionaries in compact mode."""
+    return series.dtype == 'object' or isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def _check_column(table, col, kind, series):
+    if kind == 'id' and not is_id_column(series):
+        raise DatasetError(f"{table}.{col} is not a string or categorical ID column.")
+    if kind == 'number' and not pd.api.types.is_numeric_dtype(series.dtype):
+        raise DatasetError(f"{table}.{col} is not numeric.")
+    if kind == 'timestamp' and not pd.api.types.is_datetime64_any_dtype(series.dtype):
+        raise DatasetError(f"{table}.{col} is not a datetime column.")
+
+
+def validate_tables(tables):
+    """Checks tables against REQUIRED_COLUMNS, raising DatasetError on the first problem."""
+    missing = [t for t in REQUIRED_COLUMNS if t not in tables or tables[t] is None]
+    if missing:
+        raise DatasetError(f"Missing required data tables: {missing}.")
+    for table, columns in REQUIRED_COLUMNS.items():
+        df = tables[table]
+        missing_cols = [c for c in columns if c not in df.columns]
+        if missing_cols:
+            raise DatasetError(f"Missing required columns in {table}: {missing_cols}.")
+        for col, kind in columns.items():
+            _check_column(table, col, kind, df[col])
+
+
+def _time_bounds(times, merchant_time=None):
+    """(earliest, latest) of order_time_dt, NaT for an empty table.
+
+    With a merchant/time index whose blocks cover every row, only the first and
+    last row of each block are looked at, so a new version after an append does
+    not rescan the whole column.
+    """
+    if not len(times):
+        return pd.NaT, pd.NaT
+    if merchant_time is not None and merchant_time.covers(times) and merchant_time.offsets:
+        blocks = np.array(list(merchant_time.offsets.values()), dtype=np.int64)
+        if int((blocks[:, 1] - blocks[:, 0]).sum()) == len(times):
+            firsts = merchant_time.times[blocks[:, 0]]
+            lasts = merchant_time.times[blocks[:, 1] - 1]
+            return times.iloc[blocks[firsts.argmin(), 0]], times.iloc[blocks[lasts.argmax(), 1] - 1]
+    return times.min(), times.max()
+
+
+def _id_dictionary(series):
+    """Sorted distinct IDs of a column, as strings."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.remove_unused_categories().cat.categories.astype(str)
+    return pd.Index(series.dropna().astype(str).unique()).sort_values()
+
+
+class Dataset(Mapping):
+    """Validated, read-only view of the preprocessed tables and their lookup indexes.
+
+    The schema is checked once, here, and facts every analysis needs (latest
+    timestamp, date bounds, ID dictionaries, row counts) are computed once, so
+    per-request code can trust the tables and skip straight to the work.
+
+    Attributes cannot be reassigned and the table/index mappings are read-only;
+    the DataFrames themselves are shared, not copied, and must not be modified
+    in place. A changed dataset is a new Dataset (with a new version).
+
+    For compatibility with code written against the old dict of DataFrames,
+    a Dataset is also a Mapping of table name -> DataFrame.
+    """
+
+    def __init__(self, tables, indexes=None):
+        tables = {name: df for name, df in tables.items() if name != 'indexes'}
+        validate_tables(tables)
+        td_df = tables['transaction_data']
+        m_df = tables['merchant']
+        times = td_df['order_time_dt']
+
+        set_ = object.__setattr__
+        set_(self, '_tables', MappingProxyType(tables))
+        set_(self, '_indexes', MappingProxyType(dict(indexes or {})))
+        set_(self, 'version', next(_versions))
+        set_(self, 'row_counts', MappingProxyType({name: len(df) for name, df in tables.items()}))
+        earliest, latest = _time_bounds(times, (indexes or {}).get('merchant_time'))
+        set_(self, 'latest_timestamp', latest)
+        set_(self, 'earliest_timestamp', earliest)
+        set_(self, 'merchant_ids', _id_dictionary(m_df['merchant_id']))
+        set_(self, 'city_ids', _id_dictionary(m_df['city_id']))
+        set_(self, 'item_ids', _id_dictionary(tables['items']['item_id']))
+        set_(self, 'tagged_item_rows', int(tables['items']['cuisine_tag'].notna().sum()))
+
+        # city_id -> merchant IDs in that city, in merchant table order
+        located = m_df[['city_id', 'merchant_id']].dropna()
+        by_city = {}
+        city_of = {}
+        for city, merchant in zip(located['city_id'].astype(str), located['merchant_id'].astype(str)):
+            by_city.setdefault(city, {})[merchant] = None
+            city_of.setdefault(merchant, city)
+        set_(self, '_city_by_merchant', MappingProxyType(city_of))
+        set_(self, '_merchants_by_city', MappingProxyType({
+            city: np.array(list(merchants), dtype=object) for city, merchants in by_city.items()
+        }))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Dataset is immutable; build a new one instead.")
+
+    def __delattr__(self, name):
+        raise AttributeError("Dataset is immutable; build a new one instead.")
+
+    # --- Mapping of table name -> DataFrame ---
+    def __getitem__(self, name):
+        return self._tables[name]
+
+    def __iter__(self):
+        return iter(self._tables)
+
+    def __len__(self):
+        return len(self._tables)
+
+    def __repr__(self):
+        counts = ", ".join(f"{name}={rows:,}" for name, rows in self.row_counts.items())
+        return f"<Dataset v{self.version}: {counts}>"
+
+    # --- Typed accessors ---
+    @property
+    def merchants(self):
+        return self._tables['merchant']
+
+    @property
+    def transactions(self):
+        """transaction_data, sorted by (merchant_id, order_time_dt)."""
+        return self._tables['transaction_data']
+
+    @property
+    def transaction_items(self):
+        """transaction_items, sorted by order_id."""
+        return self._tables['transaction_items']
+
+    @property
+    def menu_items(self):
+        """The items table (named so it does not shadow Mapping.items())."""
+        return self._tables['items']
+
+    @property
+    def keywords(self):
+        """The keywords table, read on first use unless it was loaded with the others (None if unreadable)."""
+        if 'keywords' in self._tables:
+            return self._tables['keywords']
+        from data_utils import load_lazy_table
+        return load_lazy_table('keywords')
+
+    @property
+    def indexes(self):
+        """Read-only mapping of index name -> lookup index (see data_index.py)."""
+        return self._indexes
+
+    def index(self, name):
+        """A lookup index by name, or None if it was not built."""
+        return self._indexes.get(name)
+
+    @property
+    def date_bounds(self):
+        """(earliest, latest) order_time_dt, NaT for an empty table."""
+        return self.earliest_timestamp, self.latest_timestamp
+
+    def has_merchant(self, merchant_id):
+        return str(merchant_id) in self.merchant_ids
+
+    def merchants_in_city(self, city_id):
+        """merchant_ids located in the city (empty array for an unknown city)."""
+        return self._merchants_by_city.get(str(city_id), np.array([], dtype=object))
+
+    def city_of(self, merchant_id):
+        """city_id of a merchant (its first row in the merchant table), or None."""
+        return self._city_by_merchant.get(str(merchant_id))
+
+    def tables(self):
+        """A plain dict of the tables (e.g. for writing the cache)."""
+        return dict(self._tables)
+
+
+def as_dataset(datasets):
+    """Returns datasets as a Dataset, validating (and wrapping) a plain dict of DataFrames.
+
+    Raises:
+        DatasetError: If datasets is empty or does not match REQUIRED_COLUMNS.
+    """
+    if isinstance(datasets, Dataset):
+        return datasets
+    if not datasets:
+        raise DatasetError(f"Missing required data tables: {list(REQUIRED_COLUMNS)}.")
+    return Dataset(datasets, indexes=datasets.get('indexes'))
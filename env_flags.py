@@ -0,0 +1,20 @@
+# env_flags.py
+import os
+
+# Spellings accepted for on/off settings (compared lowercased, whitespace stripped)
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_VALUES = ('0', 'false', 'no', 'off')
+
+
+def env_flag(name, default):
+    """An on/off environment setting.
+
+    A setting that defaults to on is only turned off by one of FALSE_VALUES,
+    and one that defaults to off is only turned on by one of TRUE_VALUES, so a
+    typo leaves the default in place.
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    value = value.strip().lower()
+    return value not in FALSE_VALUES if default else value in TRUE_VALUES
@@ -0,0 +1,23 @@
+# gunicorn.conf.py
+# Serves app.py with several worker processes that share one copy of the data:
+#   pip install gunicorn && gunicorn app:app
+import gc
+import os
+
+# Workers memory-map the tables from the data cache (see data_utils._load_shared_tables)
+os.environ.setdefault('MEX_SHARED_DATA', '1')
+# The master loads the data before forking (a background loader thread would not
+# survive the fork); workers start ready
+os.environ.setdefault('MEX_DATA_BACKGROUND', '0')
+
+bind = os.getenv('MEX_BIND', '127.0.0.1:5000')
+workers = int(os.getenv('MEX_WORKERS', '4'))
+
+# app.py (data, indexes) is imported once in the master and inherited by the
+# forked workers, so indexes are built once too
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Keep the collector from touching the preloaded objects, which would copy their pages into every worker
+    gc.freeze()
@@ -0,0 +1,136 @@
+# history_compaction.py
+import os
+import re
+import math
+import functools
+
+try:
+    import tiktoken
+except ImportError:  # optional: token counts fall back to an estimate
+    tiktoken = None
+
+# Prompt size the model is sent at most (system prompt + summary + recent messages)
+PROMPT_TOKEN_BUDGET = int(os.getenv('MEX_PROMPT_TOKEN_BUDGET', '3000'))
+# Latest conversation messages always sent verbatim (2 turns)
+KEEP_RECENT_MESSAGES = int(os.getenv('MEX_HISTORY_KEEP_MESSAGES', '4'))
+SUMMARY_LINE_TOKENS = 40
+# Chat-format framing per message (role and separators), as OpenAI counts it
+MESSAGE_OVERHEAD_TOKENS = 4
+TOKENIZER = 'cl100k_base'  # gpt-4-turbo's encoding
+
+SUMMARY_HEADER = "Summary of the earlier conversation (older messages, shortened):"
+_pieces = re.compile(r"[A-Za-z]+|\d+|[　-鿿가-힯]|[^\sA-Za-z\d]")
+_sentence_end = re.compile(r"(?<=[.!?。！？])\s")
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    """tiktoken's encoding, or None when tiktoken (or its vocabulary file) is unavailable."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKENIZER)
+    except Exception as e:
+        print(f"History Compaction ⚠️: tiktoken unavailable ({e}); estimating token counts.")
+        return None
+
+
+def token_counter():
+    """'tiktoken' or 'estimate', whichever count_tokens uses."""
+    return 'tiktoken' if _encoding() is not None else 'estimate'
+
+
+def count_tokens(text):
+    """Tokens in text: exact with tiktoken, otherwise estimated (about 4 letters
+    per token for words, one per digit group, symbol or CJK character)."""
+    text = str(text or '')
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(math.ceil(len(piece) / 4) if piece[0].isalpha() and piece.isascii() else 1 for piece in _pieces.findall(text))
+
+
+def message_tokens(messages):
+    """Prompt tokens of a chat message list."""
+    return sum(count_tokens(m.get('content')) + MESSAGE_OVERHEAD_TOKENS for m in messages) + 3
+
+
+def _truncate(text, max_tokens):
+    """text cut to about max_tokens, on a word boundary."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    words, kept = text.split(), []
+    for word in words:
+        kept.append(word)
+        if count_tokens(' '.join(kept)) > max_tokens:
+            kept.pop()
+            break
+    return ' '.join(kept) + ' …'
+
+
+@functools.lru_cache(maxsize=4096)
+def summary_line(role, content):
+    """One summary line for a message: its first sentence, at most SUMMARY_LINE_TOKENS.
+
+    Memoized, so each message of a conversation is shortened once however many
+    later requests carry it in their history.
+    """
+    text = ' '.join(str(content or '').split())
+    # Markdown replies: the first sentence without list/heading markup
+    text = re.sub(r"[#*_`>|]+", '', text).strip()
+    first = _sentence_end.split(text, maxsplit=1)[0]
+    speaker = 'Merchant' if role == 'user' else 'Assistant'
+    return f"- {speaker}: {_truncate(first, SUMMARY_LINE_TOKENS)}"
+
+
+def compact_history(messages, budget=PROMPT_TOKEN_BUDGET, keep_recent=KEEP_RECENT_MESSAGES):
+    """Shrinks a chat message list (system prompt first, latest user message last).
+
+    Messages older than the last `keep_recent` are replaced by one system
+    message holding a line per message (summary_line). If the prompt is still
+    over `budget` tokens, the oldest summary lines and then the oldest recent
+    messages are dropped; the system prompt and the latest message are always
+    kept, even if they alone exceed the budget.
+
+    Returns (messages, report): report has the prompt tokens before and after,
+    tokens_saved, and how many messages were summarized or dropped.
+    """
+    system = [m for m in messages[:1] if m.get('role') == 'system']
+    history = messages[len(system):]
+    original_tokens = message_tokens(messages)
+
+    keep = max(1, keep_recent)
+    older, recent = history[:-keep], history[-keep:]
+    lines = [summary_line(m.get('role'), m.get('content')) for m in older]
+    dropped = 0
+
+    def assemble():
+        summary = [{'role': 'system', 'content': '\n'.join([SUMMARY_HEADER] + lines)}] if lines else []
+        return system + summary + recent
+
+    compacted = assemble()
+    tokens = message_tokens(compacted)
+    if tokens >= original_tokens:
+        # A few short older messages can cost less than their summary
+        compacted, tokens, lines, recent = messages, original_tokens, [], history
+        older = []
+    while tokens > budget and (lines or len(recent) > 1):
+        if lines:
+            lines.pop(0)
+        else:
+            recent = recent[1:]
+        dropped += 1
+        compacted = assemble()
+        tokens = message_tokens(compacted)
+
+    report = {
+        'original_tokens': original_tokens,
+        'prompt_tokens': tokens,
+        'tokens_saved': original_tokens - tokens,
+        'summarized_messages': len(older),
+        'dropped_messages': dropped,
+        'over_budget': tokens > budget,
+        'budget': budget,
+        'counter': token_counter(),
+    }
+    return compacted, report
@@ -0,0 +1,198 @@
+# intent_router.py
+import re
+import calendar
+import threading
+from datetime import date, datetime
+from collections import Counter
+
+# --- Keyword groups (matched as substrings of the lowercased message) ---
+KEYWORDS = {
+    'profit': (
+        "profit", "increase profit", "improve profit", "earnings", "make money", "bottom line", "profitability",
+    ),
+    'popular': ("popular", "hot selling", "best selling", "top items"),
+    'sales': ("sale", "sales", "revenue", "performance", "income", "order value", "summary"),
+    'regional': (
+        "recommend", "suggestion", "what to sell", "suitable products", "new merchant", "startup",
+        "regional", "area", "city", "location", "cuisine",
+    ),
+    # Regional recommendations are for someone starting out
+    'new_business': ("new merchant", "what to sell", "startup", "recommend", "suggestion"),
+    # Questions that default to a 90-day window instead of 30
+    'long_window': (
+        "recommend", "suggestion", "what to sell", "startup", "new merchant", "regional", "area",
+        "profit", "earnings", "cuisine",
+    ),
+}
+
+# --- Intents, in priority order: (name, keyword groups required, keyword groups excluded) ---
+INTENTS = (
+    ('profit', ('profit',), ()),
+    ('popular_items', ('popular',), ('regional',)),
+    ('sales', ('sales',), ()),
+    ('regional_cuisine', ('regional', 'new_business'), ()),
+)
+
+DEFAULT_DAYS = 30
+LONG_WINDOW_DAYS = 90
+UNIT_DAYS = {'day': 1, 'week': 7, 'month': 30, 'year': 365}
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+_numbers = {'one': 1, 'two': 2, 'three': 3, 'four': 4, 'six': 6, 'twelve': 12}
+
+# --- Time windows, each starting with one of WINDOW_WORDS (the three original
+# phrases, "last week", "last month" and "last 3 months", keep their meaning) ---
+WINDOW_WORDS = ("last", "past", "previous", "since")
+_month_names = '|'.join(sorted(MONTHS, key=len, reverse=True))
+WINDOW_PATTERNS = (
+    r"(?:last|past|previous)\s+(?P<n>\d+|one|two|three|four|six|twelve)\s+(?P<unit>day|week|month|year)s?",
+    r"(?:last|past|previous)\s+(?P<unit1>week|month|year)",
+    r"since\s+(?P<iso>\d{4}-\d{1,2}-\d{1,2})",
+    rf"since\s+(?P<month>{_month_names})\b\.?(?:\s+(?P<day>\d{{1,2}})(?:st|nd|rd|th)?\b)?(?:,?\s+(?P<year>\d{{4}}))?",
+)
+
+
+def _trie_pattern(words):
+    """A regex matching any of words, factored by common prefix so the engine
+    follows one branch per character instead of trying every word in turn.
+    Optional suffixes are greedy, so the longest word at a position wins."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def pattern(node):
+        end = node.get('') is True
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if end:
+            return '(?:' + body + ')?'
+        return body
+
+    return pattern(trie)
+
+
+class IntentRouter:
+    """Keyword intents and a time window for a message, in one regex pass.
+
+    Every keyword, plus the words a time window starts with, is compiled into
+    one prefix-factored pattern; a single finditer over the message finds them
+    all, and a window pattern is only tried where a window word was found. A
+    keyword counts for its own groups and for those of every keyword it
+    contains ("increase profit" is also "profit"), so substring matching gives
+    the same intents as checking each keyword separately. New keywords and
+    intents do not add another scan of the message.
+    """
+
+    def __init__(self, keywords=KEYWORDS, intents=INTENTS):
+        self.intents = intents
+        words = {word for group_words in keywords.values() for word in group_words}
+        # keyword -> groups of it and of every keyword inside it
+        self._groups = {
+            word: tuple(sorted({group for group, group_words in keywords.items() for other in group_words if other in word}))
+            for word in words
+        }
+        self._pattern = re.compile(_trie_pattern(words | set(WINDOW_WORDS)))
+        self._window = re.compile('|'.join(f"(?:{pattern})" for pattern in WINDOW_PATTERNS))
+        self._lock = threading.Lock()
+        self.counts = Counter()  # intent (None for fallback) -> messages it was the primary intent of
+        self.routed = 0
+
+    def route(self, message, reference_date=None):
+        """match(), counted in stats() under its primary intent."""
+        result = self.match(message, reference_date)
+        with self._lock:
+            self.counts[result['intent']] += 1
+            self.routed += 1
+        return result
+
+    def match(self, message, reference_date=None):
+        """Returns a dict for the (lowercased or not) message:
+
+        intent: the highest-priority matching intent, or None
+        intents: every matching intent, in priority order
+        matches: keyword group -> number of keyword hits
+        days: the analysis window (the longest one mentioned, else 90 for
+              recommendation/profit style questions, else 30);
+              period: it as 'last_N_days'
+        window: the window phrase it came from, or None
+
+        reference_date (a date, default today) is the end of the window, for
+        "since March"; use the latest order date so windows follow the data.
+        """
+        text = str(message or '').lower()
+        matches = {}
+        window_days = 0
+        window_text = None
+        for found in self._pattern.finditer(text):
+            groups = self._groups.get(found.group())
+            if groups is not None:
+                for group in groups:
+                    matches[group] = matches.get(group, 0) + 1
+                continue
+            window = self._window.match(text, found.start())
+            days = self._window_days(window, reference_date) if window else None
+            if days and days > window_days:
+                window_days, window_text = days, window.group()
+
+        intents = [
+            name for name, required, excluded in self.intents
+            if all(group in matches for group in required) and not any(group in matches for group in excluded)
+        ]
+        days = window_days or (LONG_WINDOW_DAYS if 'long_window' in matches else DEFAULT_DAYS)
+        return {
+            'intent': intents[0] if intents else None,
+            'intents': intents,
+            'matches': matches,
+            'days': days,
+            'period': f"last_{days}_days",
+            'window': window_text,
+        }
+
+    @staticmethod
+    def _window_days(match, reference_date):
+        """Days from the window's start through reference_date, or None if it is not a usable window."""
+        groups = match.groupdict()
+        if groups['unit']:
+            n = groups['n']
+            n = int(n) if n.isdigit() else _numbers[n]
+            return n * UNIT_DAYS[groups['unit']] if n > 0 else None
+        if groups['unit1']:
+            return UNIT_DAYS[groups['unit1']]
+
+        reference_date = reference_date or date.today()
+        if isinstance(reference_date, datetime):
+            reference_date = reference_date.date()
+        try:
+            if groups['iso']:
+                start = date.fromisoformat('-'.join(part.zfill(2) for part in groups['iso'].split('-')))
+            else:
+                month = MONTHS[groups['month']]
+                year = int(groups['year']) if groups['year'] else (
+                    reference_date.year if month <= reference_date.month else reference_date.year - 1
+                )
+                start = date(year, month, int(groups['day'] or 1))
+        except ValueError:
+            return None
+        days = (reference_date - start).days + 1
+        return days if days > 0 else None
+
+    def stats(self):
+        """Messages routed so far, by primary intent ('general' for none)."""
+        with self._lock:
+            return {
+                'routed': self.routed,
+                'intents': {intent or 'general': count for intent, count in self.counts.items()},
+            }
+
+
+def parse_time_period(user_message_lower):
+    """The analysis window of a message as a 'last_N_days' period string."""
+    return intent_router.match(user_message_lower)['period']
+
+
+intent_router = IntentRouter()
@@ -0,0 +1,99 @@
+# llm_client.py
+import os
+import random
+import asyncio
+
+import httpx
+import openai
+
+from app_logging import get_logger
+
+# Per-call limits for the async client (see asgi.py)
+LLM_TIMEOUT = float(os.getenv('MEX_LLM_TIMEOUT', '30'))
+LLM_CONNECT_TIMEOUT = float(os.getenv('MEX_LLM_CONNECT_TIMEOUT', '5'))
+LLM_MAX_RETRIES = int(os.getenv('MEX_LLM_RETRIES', '2'))
+LLM_MAX_CONNECTIONS = int(os.getenv('MEX_LLM_MAX_CONNECTIONS', '1000'))
+# Few idle connections: httpcore's pool upkeep is quadratic in idle keep-alive
+# connections, which at hundreds of chats in flight costs more CPU than reconnecting
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv('MEX_LLM_KEEPALIVE_CONNECTIONS', '20'))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+log = get_logger("llm_client")
+
+# Failures worth another attempt: nothing reached the model, or it was busy/overloaded
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+def retry_delay(attempt):
+    """Seconds to wait before retry `attempt` (0-based): exponential backoff with
+    full jitter, so clients that failed together do not retry together."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def make_async_client(api_key=None):
+    """An AsyncOpenAI client with its own pooled HTTP connections.
+
+    The SDK's own retries are off; acomplete/astream retry with jitter instead.
+    OPENAI_BASE_URL (read by the SDK) points it at another server, e.g. the fake
+    one in bench_serving.py.
+    """
+    return openai.AsyncOpenAI(
+        api_key=api_key or os.getenv("OPENAI_API_KEY"),
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        max_retries=0,
+        http_client=openai.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+            ),
+        ),
+    )
+
+
+async def acomplete(client, messages, model, temperature, retries=LLM_MAX_RETRIES):
+    """The whole completion text, retrying RETRYABLE_ERRORS up to `retries` times."""
+    for attempt in range(retries + 1):
+        try:
+            completion = await client.chat.completions.create(
+                model=model, messages=messages, temperature=temperature,
+            )
+            return completion.choices[0].message.content.strip()
+        except RETRYABLE_ERRORS as e:
+            if attempt == retries:
+                raise
+            delay = retry_delay(attempt)
+            log.warning("%s on attempt %d; retrying in %.2fs.", type(e).__name__, attempt + 1, delay)
+            await asyncio.sleep(delay)
+
+
+async def astream(client, messages, model, temperature, retries=LLM_MAX_RETRIES):
+    """Yields the completion text chunk by chunk.
+
+    Retries only until the first chunk arrives; after that a failure is raised,
+    since the caller has already forwarded part of the reply.
+    """
+    for attempt in range(retries + 1):
+        started = False
+        try:
+            stream = await client.chat.completions.create(
+                model=model, messages=messages, temperature=temperature, stream=True,
+            )
+            async with stream:
+                async for chunk in stream:
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if text:
+                        started = True
+                        yield text
+            return
+        except RETRYABLE_ERRORS as e:
+            if started or attempt == retries:
+                raise
+            delay = retry_delay(attempt)
+            log.warning("%s on attempt %d; retrying in %.2fs.", type(e).__name__, attempt + 1, delay)
+            await asyncio.sleep(delay)
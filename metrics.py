@@ -0,0 +1,222 @@
+# metrics.py
+import os
+import math
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+from env_flags import env_flag
+
+# Quantiles reported for every latency series, over its latest SAMPLE_WINDOW samples
+QUANTILES = (0.5, 0.95, 0.99)
+SAMPLE_WINDOW = int(os.getenv('MEX_METRICS_WINDOW', '1024'))
+
+HELP = {
+    'mex_request_seconds': "Chat request latency by route and intent (streams: until the last event).",
+    'mex_span_seconds': "Latency of one stage of a chat request (parse, route, analysis, prompt, cache, openai).",
+    'mex_requests_total': "Chat requests by route, intent and HTTP status.",
+    'mex_errors_total': "Failed chat requests or stages, by stage.",
+    'mex_cache_lookups_total': "Completion cache lookups by result (hit or miss).",
+    'mex_llm_tokens_total': "OpenAI tokens by kind (prompt or completion) and source (usage as reported, or estimate).",
+    'mex_completion_cache_entries': "Replies held in the completion cache's memory.",
+    'mex_completion_cache_bytes': "Bytes of replies held in the completion cache's memory.",
+    'mex_sessions': "Conversations held by the session store.",
+    'mex_data_loaded': "1 when the dataset is loaded and chat requests can be answered.",
+}
+
+
+def metrics_enabled():
+    """The /metrics endpoint is on by default; set MEX_METRICS=0 to hide it."""
+    return env_flag('MEX_METRICS', True)
+
+
+def server_timing_enabled():
+    """Set MEX_SERVER_TIMING=1 to add a Server-Timing header (stage durations) to chat responses."""
+    return env_flag('MEX_SERVER_TIMING', False)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escape = lambda value: value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+
+def _quantile(ordered, q):
+    """Nearest-rank quantile of a sorted list."""
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+class Registry:
+    """Thread-safe counters and latency series, rendered in the Prometheus text format.
+
+    Latencies are summaries: total count and sum since start, and QUANTILES
+    over each series' latest SAMPLE_WINDOW samples. Values are per process;
+    each worker of a multi-process server reports its own.
+    """
+
+    def __init__(self, window=SAMPLE_WINDOW):
+        self.window = window
+        self._counters = {}  # name -> {label key -> value}
+        self._latencies = {}  # name -> {label key -> [count, sum, deque of samples]}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._latencies.setdefault(name, {})
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = [0, 0.0, deque(maxlen=self.window)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2].append(seconds)
+
+    def add_collector(self, collect):
+        """collect() returns (name, labels dict, value) gauges, read at every render."""
+        self._collectors.append(collect)
+
+    def render(self):
+        """The Prometheus text exposition of everything recorded."""
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            latencies = {
+                name: {key: (count, total, sorted(samples)) for key, (count, total, samples) in series.items()}
+                for name, series in self._latencies.items()
+            }
+        lines = []
+        for name in sorted(latencies):
+            lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} summary"]
+            for key, (count, total, ordered) in sorted(latencies[name].items()):
+                for q in QUANTILES:
+                    lines.append(f"{name}{_format_labels(key, [('quantile', str(q))])} {_quantile(ordered, q):.6f}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+        for name in sorted(counters):
+            lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        gauges = {}
+        for collect in self._collectors:
+            try:
+                for name, labels, value in collect():
+                    gauges.setdefault(name, []).append((_label_key(labels), value))
+            except Exception as e:
+                print(f"Metrics ⚠️: A metrics collector failed: {e}")
+        for name in sorted(gauges):
+            lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} gauge"]
+            for key, value in sorted(gauges[name]):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+_current_trace = contextvars.ContextVar('mex_trace', default=None)
+
+
+class Trace:
+    """The stages of one chat request: each span is timed into the registry
+    (mex_span_seconds) and kept for the Server-Timing header; finish() records
+    the whole request under its route and intent."""
+
+    def __init__(self, route):
+        self.route = route
+        self.labels = {'intent': 'none'}
+        self.spans = []  # (name, seconds, description)
+        self.started = time.perf_counter()
+        self.finished = False
+
+    @contextmanager
+    def span(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.spans.append((name, seconds, ','.join(str(v) for v in labels.values())))
+            registry.observe('mex_span_seconds', seconds, span=name, **labels)
+
+    def finish(self, status):
+        """Records the request once (later calls do nothing); 4xx/5xx also count as errors."""
+        if self.finished:
+            return
+        self.finished = True
+        seconds = time.perf_counter() - self.started
+        registry.observe('mex_request_seconds', seconds, route=self.route, **self.labels)
+        registry.inc('mex_requests_total', route=self.route, status=status, **self.labels)
+        if status >= 400:
+            record_error('server' if status >= 500 else 'request')
+
+    def server_timing(self):
+        """Server-Timing header value for the spans so far ('total' is the time until now)."""
+        parts = []
+        for name, seconds, description in self.spans:
+            desc = f';desc="{description}"' if description else ''
+            parts.append(f"{name};dur={seconds * 1000:.2f}{desc}")
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ', '.join(parts)
+
+
+def start_trace(route):
+    """A new Trace, also made the current one for span() and set_label()."""
+    trace = Trace(route)
+    _current_trace.set(trace)
+    return trace
+
+
+def end_trace():
+    """Forgets the current trace (a worker thread moves on to the next request)."""
+    _current_trace.set(None)
+
+
+@contextmanager
+def span(name, **labels):
+    """Times a stage of the current request (or, outside one, only into the registry)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        with trace.span(name, **labels):
+            yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe('mex_span_seconds', time.perf_counter() - started, span=name, **labels)
+
+
+def set_label(**labels):
+    """Labels (e.g. intent) for the current request's mex_request_seconds."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.labels.update({k: str(v) for k, v in labels.items()})
+
+
+def record_error(stage):
+    """stage: 'request' (4xx), 'server' (5xx) or 'openai' (the model call failed)."""
+    registry.inc('mex_errors_total', stage=stage)
+
+
+def record_cache_lookup(hit):
+    registry.inc('mex_cache_lookups_total', cache='completion', result='hit' if hit else 'miss')
+
+
+def record_tokens(prompt_tokens, completion_tokens, source):
+    """Token usage of one OpenAI call; source is 'usage' (reported by the API) or 'estimate'."""
+    if prompt_tokens:
+        registry.inc('mex_llm_tokens_total', prompt_tokens, kind='prompt', source=source)
+    if completion_tokens:
+        registry.inc('mex_llm_tokens_total', completion_tokens, kind='completion', source=source)
@@ -0,0 +1,227 @@
+# profiling.py
+"""Opt-in profiles of single chat requests (see README, "Profiling a slow query").
+
+With MEX_PROFILING=1, a request is profiled when it carries the
+X-MEX-Profile header (its value must equal MEX_PROFILE_TOKEN when that is
+set) or when it is sampled (MEX_PROFILE_SAMPLE_RATE, e.g. 0.001 for 1 in
+1000). Each profile is written to MEX_PROFILE_DIR as:
+
+  <name>.prof       cProfile stats (snakeviz, flameprof, tuna, pstats)
+  <name>.folded     sampled stacks, one "a;b;c count" line per stack
+                    (flamegraph.pl, speedscope, inferno)
+  <name>.alloc.txt  the top tracemalloc allocation sites
+  <name>.json       labels (intent, merchant, window), trigger and timings
+
+where <name> is "<time>-<intent>-<merchant>-<window>d-<pid>".
+`python profiling.py "how were my sales since March"` profiles one message
+against the local data without running the server.
+"""
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import random
+import cProfile
+import threading
+import contextvars
+import tracemalloc
+from collections import Counter
+from contextlib import nullcontext
+
+from env_flags import TRUE_VALUES, env_flag
+
+PROFILE_HEADER = "X-MEX-Profile"
+PROFILE_DIR = os.getenv('MEX_PROFILE_DIR', 'profiles')
+SAMPLE_RATE = float(os.getenv('MEX_PROFILE_SAMPLE_RATE', '0'))
+# Stack sampling period for the .folded file, and how many profiles are kept
+SAMPLE_INTERVAL = float(os.getenv('MEX_PROFILE_INTERVAL_MS', '1')) / 1000
+KEEP_PROFILES = int(os.getenv('MEX_PROFILE_KEEP', '200'))
+ALLOCATION_SITES = 30
+TRACEMALLOC_FRAMES = 16
+
+# One profile at a time: tracemalloc is process-wide, and profiling is for one slow query, not load
+_busy = threading.Lock()
+_current_profile = contextvars.ContextVar('mex_profile', default=None)
+_unsafe = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+def profiling_enabled():
+    """Profiling is off by default; MEX_PROFILING=1 allows the header and sampling triggers."""
+    return env_flag('MEX_PROFILING', False)
+
+
+def profile_trigger(header_value=None):
+    """'header', 'sampled', or None when this request should not be profiled."""
+    if not profiling_enabled():
+        return None
+    if header_value:
+        token = os.getenv('MEX_PROFILE_TOKEN')
+        if token:
+            if hmac.compare_digest(header_value.encode('utf-8'), token.encode('utf-8')):
+                return 'header'
+        elif header_value.strip().lower() in TRUE_VALUES:
+            return 'header'
+    if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        return 'sampled'
+    return None
+
+
+def request_profile(route, header_value=None):
+    """A RequestProfile for this request, or None (not triggered, or another profile is running)."""
+    trigger = profile_trigger(header_value)
+    if trigger is None:
+        return None
+    if not _busy.acquire(blocking=False):
+        print(f"Profiling ℹ️: Skipping a {trigger} profile of {route}; another profile is running.")
+        return None
+    return RequestProfile(route, trigger)
+
+
+def label_profile(**labels):
+    """Labels (intent, merchant, window) for the profile of the current request, if any."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.labels.update({k: v for k, v in labels.items() if v is not None})
+
+
+def run_profiled(profile, function, *args):
+    """function(*args), inside profile when there is one (for worker threads, see asgi.py)."""
+    with profile or nullcontext():
+        return function(*args)
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RequestProfile:
+    """cProfile, a stack sampler and tracemalloc around one request, on the
+    thread that starts it. stop() writes the files and returns their base path."""
+
+    def __init__(self, route, trigger):
+        self.route = route
+        self.trigger = trigger
+        self.labels = {}
+        self._profiler = cProfile.Profile()
+        self._stacks = Counter()
+        self._stop_sampling = threading.Event()
+        self._sampler = None
+        self._started_tracemalloc = False
+        self._context_token = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        self._sampler = threading.Thread(target=self._sample, name="mex-profile-sampler", daemon=True)
+        self._sampler.start()
+        self._context_token = _current_profile.set(self)
+        self._profiler.enable()
+        return self
+
+    def _sample(self):
+        while not self._stop_sampling.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self._stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        try:
+            self._profiler.disable()
+            wall = time.perf_counter() - self._started
+            cpu = time.process_time() - self._cpu_started
+            self._stop_sampling.set()
+            self._sampler.join()
+            snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            if self._context_token is not None:
+                _current_profile.reset(self._context_token)
+            return self._write(wall, cpu, snapshot)
+        except Exception as e:
+            print(f"Profiling ❌: Could not write the profile of {self.route}: {e}")
+            return None
+        finally:
+            _busy.release()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _write(self, wall, cpu, snapshot):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        labels = [
+            str(self.labels.get('intent', 'none')),
+            str(self.labels.get('merchant', 'none')),
+            f"{self.labels['window']}d" if 'window' in self.labels else 'nowindow',
+        ]
+        stamp = f"{time.strftime('%Y%m%dT%H%M%S')}{int(time.time() * 1000) % 1000:03d}"
+        name = '-'.join([stamp, *labels, str(os.getpid())])
+        base = os.path.join(PROFILE_DIR, _unsafe.sub('_', name))
+
+        self._profiler.dump_stats(base + '.prof')
+        with open(base + '.folded', 'w', encoding='utf-8') as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        if snapshot is not None:
+            snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)))
+            with open(base + '.alloc.txt', 'w', encoding='utf-8') as f:
+                for stat in snapshot.statistics('lineno')[:ALLOCATION_SITES]:
+                    f.write(f"{stat}\n")
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump({
+                'route': self.route,
+                'trigger': self.trigger,
+                'labels': self.labels,
+                'wall_seconds': round(wall, 6),
+                'cpu_seconds': round(cpu, 6),
+                'samples': sum(self._stacks.values()),
+                'sample_interval_ms': SAMPLE_INTERVAL * 1000,
+            }, f, indent=2, default=str)
+        print(f"Profiling ✅: {self.route} ({self.trigger}, {wall * 1000:.1f} ms) written to {base}.*")
+        _prune(PROFILE_DIR)
+        return base
+
+
+def _prune(directory, keep=KEEP_PROFILES):
+    """Deletes all but the newest `keep` profiles."""
+    bases = sorted({
+        entry.name.split('.', 1)[0] for entry in os.scandir(directory)
+        if entry.is_file() and entry.name.endswith('.json')
+    })
+    for stale in bases[:max(0, len(bases) - keep)]:
+        for suffix in ('.prof', '.folded', '.alloc.txt', '.json'):
+            try:
+                os.remove(os.path.join(directory, stale + suffix))
+            except FileNotFoundError:
+                pass
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Profile one chat message against the local data (no OpenAI call).")
+    parser.add_argument("message", help="the merchant's question, e.g. \"how were my sales since March\"")
+    parser.add_argument("--repeat", type=int, default=1, help="profile this many runs (the first one is cold)")
+    args = parser.parse_args()
+
+    import app as live
+    import profiling  # the module app.py labels profiles through, not this __main__ copy
+
+    if not live.wait_for_data():
+        sys.exit("Profiling ❌: Data could not be loaded.")
+    history = [{"role": "user", "content": args.message}]
+    for _ in range(args.repeat):
+        profiling._busy.acquire()
+        profiling.run_profiled(profiling.RequestProfile("cli", "cli"), live.build_llm_messages, history, live.datasets, "cli")
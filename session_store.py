@@ -0,0 +1,190 @@
+# session_store.py
+import os
+import json
+import time
+import sqlite3
+import secrets
+import threading
+from collections import OrderedDict
+
+from env_flags import env_flag
+
+# Bounds: conversations kept (least recently used evicted first), idle lifetime,
+# and messages kept per conversation (the chat page keeps the same 20)
+DEFAULT_MAX_SESSIONS = int(os.getenv('MEX_SESSION_MAX', '10000'))
+DEFAULT_TTL = float(os.getenv('MEX_SESSION_TTL', str(24 * 3600)))
+DEFAULT_MAX_MESSAGES = int(os.getenv('MEX_SESSION_MAX_MESSAGES', '20'))
+# The disk table is trimmed back to max_sessions every this many writes
+PRUNE_EVERY = 256
+
+
+def sessions_enabled():
+    """Session mode is available by default; set MEX_SESSIONS=0 to accept full histories only."""
+    return env_flag('MEX_SESSIONS', True)
+
+
+def new_conversation_id():
+    """Unguessable, so an ID is enough to continue (only) one's own conversation."""
+    return secrets.token_urlsafe(16)
+
+
+class MemorySessionStore:
+    """Thread-safe LRU of conversation_id -> message list, with an idle TTL.
+
+    Each worker process has its own; a conversation that lands on another
+    worker (or outlives an eviction) is simply re-sent by the client.
+    """
+
+    kind = 'memory'
+
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS, ttl=DEFAULT_TTL, max_messages=DEFAULT_MAX_MESSAGES):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self._sessions = OrderedDict()  # conversation_id -> (messages, touched_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, conversation_id):
+        """The conversation's messages (a new list), or None if unknown or expired."""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(conversation_id)
+            if session is not None and now - session[1] > self.ttl:
+                del self._sessions[conversation_id]
+                self.expirations += 1
+                session = None
+            if session is None:
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(conversation_id)
+            self.hits += 1
+            return list(session[0])
+
+    def put(self, conversation_id, messages):
+        """Replaces the conversation, keeping its last max_messages messages."""
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+            self._sessions[conversation_id] = (list(messages[-self.max_messages:]), time.time())
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, conversation_id):
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+
+    def stats(self):
+        """Counters for logs and metrics."""
+        with self._lock:
+            return {
+                'kind': self.kind,
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class SqliteSessionStore:
+    """The same interface over a local SQLite file: survives restarts and is shared
+    by worker processes. Messages are stored as JSON. The file is opened (and
+    pruned) on first use in each process, so a connection is never carried
+    across fork()."""
+
+    kind = 'sqlite'
+
+    def __init__(self, path, max_sessions=DEFAULT_MAX_SESSIONS, ttl=DEFAULT_TTL, max_messages=DEFAULT_MAX_MESSAGES):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self._db = None  # (connection, pid), opened by _connection()
+
+    def _connection(self):
+        """This process's connection to the SQLite file; call with the lock held."""
+        if self._db is None or self._db[1] != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(conversation_id TEXT PRIMARY KEY, messages TEXT NOT NULL, touched_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_touched_at ON sessions (touched_at)")
+            self._db = (db, os.getpid())
+            self._prune(time.time())
+        return self._db[0]
+
+    def get(self, conversation_id):
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            row = db.execute(
+                "SELECT messages FROM sessions WHERE conversation_id = ? AND touched_at >= ?",
+                (conversation_id, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE sessions SET touched_at = ? WHERE conversation_id = ?", (now, conversation_id))
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, conversation_id, messages):
+        now = time.time()
+        payload = json.dumps(list(messages[-self.max_messages:]), ensure_ascii=False)
+        with self._lock:
+            self._connection().execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (conversation_id, payload, now))
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._prune(now)
+
+    def delete(self, conversation_id):
+        with self._lock:
+            self._connection().execute("DELETE FROM sessions WHERE conversation_id = ?", (conversation_id,))
+
+    def prune(self):
+        """Drops expired conversations and all but the max_sessions most recently used."""
+        with self._lock:
+            self._connection()
+            self._prune(time.time())
+
+    def _prune(self, now):
+        db = self._db[0]
+        db.execute("DELETE FROM sessions WHERE touched_at < ?", (now - self.ttl,))
+        db.execute(
+            "DELETE FROM sessions WHERE conversation_id NOT IN "
+            "(SELECT conversation_id FROM sessions ORDER BY touched_at DESC LIMIT ?)", (self.max_sessions,)
+        )
+
+    def stats(self):
+        with self._lock:
+            count = self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            return {
+                'kind': self.kind,
+                'path': self.path,
+                'sessions': count,
+                'max_sessions': self.max_sessions,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def load_session_store():
+    """The process-wide store: None when disabled, on disk when MEX_SESSION_STORE_PATH is set."""
+    if not sessions_enabled():
+        return None
+    path = os.getenv('MEX_SESSION_STORE_PATH')
+    return SqliteSessionStore(path) if path else MemorySessionStore()
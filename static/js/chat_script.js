@@ -8,15 +8,47 @@ document.addEventListener('DOMContentLoaded', () => {
     let chatHistory = [];
     const MAX_HISTORY_TURNS = 10; // Max conversation turns (1 turn = user + assistant) to keep
 
-    // Function to add a message to the chatbox (Handles Markdown for AI)
-    function displayMessage(message, sender) {
-        const messageDiv = document.createElement('div');
-        messageDiv.classList.add('message', sender === 'user' ? 'user-message' : 'ai-message');
+    // Endpoints: the SSE variant streams the reply as it is generated; the JSON one
+    // returns it whole (and is used when the server has no streaming route, e.g. app_demo.py)
+    const STREAM_ENDPOINT = '/api/interact-llm/stream';
+    const JSON_ENDPOINT = '/api/interact-llm';
+    let streamingSupported = Boolean(window.ReadableStream && window.TextDecoder);
 
-        // Use a nested div for easier styling and selection if needed
-        const messageContent = document.createElement('div');
-        messageContent.classList.add('message-content');
+    // Session mode: once the server has returned a conversation_id it keeps the
+    // conversation, and each request carries only the new message
+    const USE_SESSIONS = true;
+    let conversationId = null;
+
+    function requestBody(fullHistory) {
+        if (USE_SESSIONS && conversationId && !fullHistory) {
+            return { conversation_id: conversationId, message: chatHistory[chatHistory.length - 1].content };
+        }
+        return USE_SESSIONS ? { session: true, conversation_id: conversationId || undefined, history: chatHistory } : { history: chatHistory };
+    }
 
+    // POSTs the conversation; if the server no longer has it (409), re-sends the full history once
+    async function postChat(url, headers) {
+        const post = (fullHistory) => fetch(url, {
+            method: 'POST',
+            headers: headers,
+            body: JSON.stringify(requestBody(fullHistory))
+        });
+        let response = await post(false);
+        if (response.status === 409 && conversationId) {
+            console.log('Conversation not found on the server; sending the full history.');
+            response = await post(true);
+        }
+        return response;
+    }
+
+    function rememberConversation(data) {
+        if (USE_SESSIONS && data && data.conversation_id) {
+            conversationId = data.conversation_id;
+        }
+    }
+
+    // Renders message text into a message-content element (Markdown for AI)
+    function renderMessage(messageContent, message, sender) {
         if (sender === 'ai' && window.marked) {
             try {
                 messageContent.innerHTML = marked.parse(message, { gfm: true, breaks: true });
@@ -27,9 +59,23 @@ document.addEventListener('DOMContentLoaded', () => {
         } else {
             messageContent.textContent = message; // User or system messages
         }
+    }
+
+    // Function to add a message to the chatbox (Handles Markdown for AI)
+    // Returns the message-content element so a streamed reply can be re-rendered in place
+    function displayMessage(message, sender) {
+        const messageDiv = document.createElement('div');
+        messageDiv.classList.add('message', sender === 'user' ? 'user-message' : 'ai-message');
+
+        // Use a nested div for easier styling and selection if needed
+        const messageContent = document.createElement('div');
+        messageContent.classList.add('message-content');
+
+        renderMessage(messageContent, message, sender);
         messageDiv.appendChild(messageContent);
         chatbox.appendChild(messageDiv);
         chatbox.scrollTop = chatbox.scrollHeight; // Scroll to bottom
+        return messageContent;
     }
 
     // --- NEW: Function to add message object to history and limit size ---
@@ -46,6 +92,173 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
 
+    function removeThinking(thinkingDiv) {
+        if (chatbox.contains(thinkingDiv)) {
+            chatbox.removeChild(thinkingDiv);
+        }
+    }
+
+    // Remove the pending user message from history (the request failed)
+    function dropLastUserMessage() {
+        if (chatHistory.length > 0 && chatHistory[chatHistory.length - 1].role === 'user') { chatHistory.pop(); }
+    }
+
+    // Shows the error of a failed (non-2xx) response
+    async function displayErrorResponse(response) {
+        let errorMsg = `Sorry, an error occurred (Status: ${response.status}).`;
+        try {
+            const errorData = await response.json();
+            errorMsg += ` ${errorData.error || 'Unknown server error.'}`;
+        } catch (e) { /* Ignore if response body isn't JSON */ }
+        displayMessage(errorMsg, 'ai'); // Display error
+        console.error('API Error Status:', response.status, errorMsg);
+        dropLastUserMessage();
+    }
+
+    // Parses one Server-Sent Event ("event: ...\ndata: ...") with a JSON payload
+    function parseSseEvent(block) {
+        let type = 'message';
+        const dataLines = [];
+        for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) {
+                type = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trimStart());
+            }
+        }
+        return { type: type, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : {} };
+    }
+
+    // Streams the reply from the SSE endpoint, rendering it as tokens arrive.
+    // Returns false (without showing anything) if the server has no streaming route.
+    async function sendStreaming(thinkingDiv) {
+        const response = await postChat(STREAM_ENDPOINT, { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' });
+        if (response.status === 404 || response.status === 405) {
+            streamingSupported = false; // Don't try again for this page
+            return false;
+        }
+        if (!response.ok) {
+            removeThinking(thinkingDiv);
+            await displayErrorResponse(response);
+            return true;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let replyText = '';
+        let messageContent = null;
+        let finished = false;
+        let streamError = null;
+        let renderPending = false;
+
+        // Re-render the Markdown at most once per frame, however fast tokens arrive
+        function scheduleRender() {
+            if (renderPending) return;
+            renderPending = true;
+            requestAnimationFrame(() => {
+                renderPending = false;
+                renderMessage(messageContent, replyText, 'ai');
+                chatbox.scrollTop = chatbox.scrollHeight;
+            });
+        }
+
+        while (!finished && !streamError) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const event = parseSseEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+                if (event.type === 'delta') {
+                    if (messageContent === null) {
+                        // First token: swap the thinking indicator for the reply bubble
+                        removeThinking(thinkingDiv);
+                        messageContent = displayMessage('', 'ai');
+                    }
+                    replyText += event.data.text || '';
+                    scheduleRender();
+                } else if (event.type === 'done') {
+                    replyText = event.data.reply;
+                    rememberConversation(event.data);
+                    finished = true;
+                } else if (event.type === 'error') {
+                    streamError = event.data.error || 'Unknown server error.';
+                }
+            }
+        }
+        removeThinking(thinkingDiv);
+
+        if (finished && replyText) {
+            if (messageContent === null) {
+                messageContent = displayMessage('', 'ai');
+            }
+            renderMessage(messageContent, replyText, 'ai');
+            chatbox.scrollTop = chatbox.scrollHeight;
+            addMessageToHistory('assistant', replyText);
+        } else {
+            // Error event, empty reply, or the connection closed before the reply was done
+            displayMessage(streamError || 'Sorry, the reply was interrupted. Please try again.', 'ai');
+            console.error('Streaming Error:', streamError || 'stream ended early');
+            dropLastUserMessage();
+        }
+        return true;
+    }
+
+    // Fetches the whole reply (or list of replies) from the JSON endpoint
+    async function sendJson(thinkingDiv) {
+        const response = await postChat(JSON_ENDPOINT, { 'Content-Type': 'application/json' });
+
+        // Remove thinking indicator
+        removeThinking(thinkingDiv);
+
+        // Check if the response was successful
+        if (!response.ok) {
+            await displayErrorResponse(response);
+            return;
+        }
+
+        // Parse the successful JSON response
+        const data = await response.json();
+        rememberConversation(data);
+        // The live app returns a single `reply`, the demo a list of `replies`
+        const replies = data && Array.isArray(data.replies) ? data.replies : (data && data.reply ? [data.reply] : []);
+
+        // Handle multiple replies (with existing inter-message delay logic)
+        if (replies.length > 0) {
+            for (let i = 0; i < replies.length; i++) {
+                const replyText = replies[i];
+
+                // Optional: Add delay BETWEEN multiple replies (starts from the second reply)
+                if (i > 0) {
+                    const multiReplyDelay = 750; // Delay between multiple messages (can be same or different)
+                    await new Promise(resolve => setTimeout(resolve, multiReplyDelay));
+
+                    // Optional: Add/remove a temporary "typing" indicator during this inter-message delay
+                    const typingIndicator = document.createElement('div');
+                    typingIndicator.classList.add('message', 'ai-message', 'thinking');
+                    typingIndicator.innerHTML = '<div class="message-content">...</div>';
+                    chatbox.appendChild(typingIndicator);
+                    chatbox.scrollTop = chatbox.scrollHeight;
+                    await new Promise(resolve => setTimeout(resolve, 600)); // Adjust timing
+                    removeThinking(typingIndicator);
+                }
+
+                // Display the current reply visually
+                displayMessage(replyText, 'ai');
+                // Add the current AI reply to client-side history
+                addMessageToHistory('assistant', replyText);
+            }
+        } else {
+             // Handle cases where response is empty or invalid replies array
+             displayMessage('Sorry, I received an unexpected response format.', 'ai');
+             console.warn("Received empty or invalid replies array:", data);
+             // Remove user message from history as the response was bad
+             dropLastUserMessage();
+        }
+    }
+
     // Function to send message to backend and display response
     async function sendMessage() {
         const messageText = userInput.value.trim();
@@ -59,7 +272,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
         userInput.value = ''; // Clear input field
 
-        // Display thinking indicator
+        // Display thinking indicator (until the first token, or the whole reply)
         const thinkingDiv = document.createElement('div');
         thinkingDiv.classList.add('message', 'ai-message', 'thinking');
         thinkingDiv.innerHTML = '<div class="message-content">Thinking...</div>'; // Use innerHTML for consistency
@@ -67,73 +280,9 @@ document.addEventListener('DOMContentLoaded', () => {
         chatbox.scrollTop = chatbox.scrollHeight;
 
         try {
-            // Send history in the request body (fetch call)
-            const response = await fetch('/api/interact-llm', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ history: chatHistory })
-            });
-
-            // --- NEW: Add delay AFTER fetch completes, BEFORE showing reply ---
-            const replyDelay = 750; // Delay in milliseconds (e.g., 0.75 seconds). Adjust as needed.
-            await new Promise(resolve => setTimeout(resolve, replyDelay));
-            // --- END NEW DELAY ---
-
-            // Remove thinking indicator (NOW happens AFTER the initial delay)
-            if (chatbox.contains(thinkingDiv)) {
-                chatbox.removeChild(thinkingDiv);
-            }
-
-            // Check if the response was successful
-            if (!response.ok) {
-                let errorMsg = `Sorry, an error occurred (Status: ${response.status}).`;
-                try {
-                    const errorData = await response.json();
-                    errorMsg += ` ${errorData.error || 'Unknown server error.'}`;
-                } catch (e) { /* Ignore if response body isn't JSON */ }
-                displayMessage(errorMsg, 'ai'); // Display error
-                console.error('API Error Status:', response.status, errorMsg);
-                // Remove user message from history on error
-                if(chatHistory.length > 0 && chatHistory[chatHistory.length - 1].role === 'user') { chatHistory.pop(); }
-                return;
-            }
-
-            // Parse the successful JSON response
-            const data = await response.json();
-
-            // Handle multiple replies (with existing inter-message delay logic)
-            if (data && data.replies && Array.isArray(data.replies) && data.replies.length > 0) {
-                for (let i = 0; i < data.replies.length; i++) {
-                    const replyText = data.replies[i];
-
-                    // Optional: Add delay BETWEEN multiple replies (starts from the second reply)
-                    if (i > 0) {
-                        const multiReplyDelay = 750; // Delay between multiple messages (can be same or different)
-                        await new Promise(resolve => setTimeout(resolve, multiReplyDelay));
-
-                        // Optional: Add/remove a temporary "typing" indicator during this inter-message delay
-                        const typingIndicator = document.createElement('div');
-                        typingIndicator.classList.add('message', 'ai-message', 'thinking');
-                        typingIndicator.innerHTML = '<div class="message-content">...</div>';
-                        chatbox.appendChild(typingIndicator);
-                        chatbox.scrollTop = chatbox.scrollHeight;
-                        await new Promise(resolve => setTimeout(resolve, 600)); // Adjust timing
-                        if (chatbox.contains(typingIndicator)) {
-                           chatbox.removeChild(typingIndicator);
-                        }
-                    }
-
-                    // Display the current reply visually
-                    displayMessage(replyText, 'ai');
-                    // Add the current AI reply to client-side history
-                    addMessageToHistory('assistant', replyText);
-                }
-            } else {
-                 // Handle cases where response is empty or invalid replies array
-                 displayMessage('Sorry, I received an unexpected response format.', 'ai');
-                 console.warn("Received empty or invalid replies array:", data);
-                 // Remove user message from history as the response was bad
-                 if(chatHistory.length > 0 && chatHistory[chatHistory.length - 1].role === 'user') { chatHistory.pop(); }
+            const streamed = streamingSupported && await sendStreaming(thinkingDiv);
+            if (!streamed) {
+                await sendJson(thinkingDiv);
             }
             // Log current history state (optional for debugging)
             console.log("Current client history:", chatHistory);
@@ -141,13 +290,11 @@ document.addEventListener('DOMContentLoaded', () => {
         } catch (error) {
              // Network/fetch error handling
              // Ensure thinking indicator is removed even on error
-             if (chatbox.contains(thinkingDiv)){
-                 chatbox.removeChild(thinkingDiv);
-             }
+             removeThinking(thinkingDiv);
              console.error('Fetch/Network Error:', error);
              displayMessage('Sorry, there was an error communicating with the assistant.', 'ai');
              // Also remove user message from history on network error
-             if(chatHistory.length > 0 && chatHistory[chatHistory.length - 1].role === 'user') { chatHistory.pop(); }
+             dropLastUserMessage();
         }
     } // End of sendMessage function
 
@@ -0,0 +1,123 @@
+# tests/test_backend_parity.py
+"""The SQLite backend (analysis_sql.py) answers exactly as the pandas analyses."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_utils
+from analysis import PandasBackend
+from analysis_backend import same_result, verify_parity
+from analysis_sql import SqliteBackend, build_sql_store
+
+
+def _write_fixture_csvs(data_dir):
+    """A small, seeded copy of the data/ CSVs, with the awkward cases the analyses handle:
+    unparseable times and values, items without a name or cuisine tag, items
+    missing from items.csv, ties in the rankings and a merchant without orders."""
+    rng = np.random.default_rng(7)
+    merchants = ["m1", "m2", "m3", "m4"]
+    pd.DataFrame({"merchant_id": merchants, "city_id": ["8", "8", "9", "9"]}).to_csv(
+        os.path.join(data_dir, "merchant.csv"), index=False
+    )
+    items = pd.DataFrame({
+        "item_id": [str(i) for i in range(1, 13)],
+        "cuisine_tag": ["Chinese", "Malay", "", "Western", "Indian", "Chinese", "", "Malay", "Western", "Thai", "Thai", ""],
+        "item_name": [f"Item {i}" if i % 5 else "" for i in range(1, 13)],
+        "merchant_id": ["m1"] * 4 + ["m2"] * 4 + ["m3"] * 4,
+    })
+    items.to_csv(os.path.join(data_dir, "items.csv"), index=False)
+
+    n_orders = 400
+    order_merchants = rng.choice(merchants[:3], n_orders)
+    times = pd.Timestamp("2023-09-01") + pd.to_timedelta(rng.integers(0, 120 * 24 * 3600, n_orders), unit="s")
+    order_time = times.strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object)
+    order_time[::53] = "not a time"
+    order_value = rng.uniform(5, 60, n_orders).round(2).astype(object)
+    order_value[::41] = "n/a"
+    transactions = pd.DataFrame({
+        "order_id": [f"o{k}" for k in range(n_orders)],
+        "order_time": order_time,
+        "order_value": order_value,
+        "eater_id": rng.integers(1, 60, n_orders),
+        "merchant_id": order_merchants,
+    })
+    transactions.to_csv(os.path.join(data_dir, "transaction_data.csv"), index=False)
+
+    own_items = {m: list(items.loc[items["merchant_id"] == m, "item_id"]) + ["99"] for m in merchants[:3]}
+    rows = [
+        (order_id, item_id, merchant)
+        for order_id, merchant in zip(transactions["order_id"], order_merchants)
+        for item_id in rng.choice(own_items[merchant], rng.integers(1, 4))
+    ]
+    pd.DataFrame(rows, columns=["order_id", "item_id", "merchant_id"]).to_csv(
+        os.path.join(data_dir, "transaction_items.csv"), index=False
+    )
+
+
+@pytest.fixture(scope="module")
+def backends(tmp_path_factory):
+    data_dir = str(tmp_path_factory.mktemp("data"))
+    _write_fixture_csvs(data_dir)
+    path = os.path.join(data_dir, "analysis.sqlite")
+    build_sql_store(data_dir, path, data_utils.TABLE_FILES)
+
+    original_dir = data_utils.DATA_DIR
+    data_utils.DATA_DIR = data_dir
+    try:
+        dataset = data_utils.load_provided_data(use_cache=False, compact_ids=False, shared=False)
+    finally:
+        data_utils.DATA_DIR = original_dir
+    assert dataset is not None
+    return PandasBackend(dataset), SqliteBackend(path)
+
+
+def test_every_analysis_matches(backends):
+    pandas_backend, sqlite_backend = backends
+    assert verify_parity(pandas_backend, sqlite_backend, windows=(1, 7, 30, 90)) == []
+
+
+def test_lookups_match(backends):
+    pandas_backend, sqlite_backend = backends
+    assert sqlite_backend.latest_timestamp == pandas_backend.latest_timestamp
+    assert sqlite_backend.merchant_ids() == pandas_backend.merchant_ids()
+    assert sqlite_backend.city_ids() == pandas_backend.city_ids()
+    for merchant_id in pandas_backend.merchant_ids() + ["unknown"]:
+        assert sqlite_backend.city_of(merchant_id) == pandas_backend.city_of(merchant_id)
+
+
+@pytest.mark.parametrize("days", [7, 30])
+def test_sales_summary_compare_previous(backends, days):
+    pandas_backend, sqlite_backend = backends
+    for merchant_id in pandas_backend.merchant_ids():
+        expected = pandas_backend.get_sales_summary(merchant_id, f"last_{days}_days", compare_previous=True)
+        actual = sqlite_backend.get_sales_summary(merchant_id, f"last_{days}_days", compare_previous=True)
+        assert same_result(expected, actual), (merchant_id, expected, actual)
+        if expected is not None:
+            assert "previous_period" in actual and "sales_change_pct" in actual
+
+
+@pytest.mark.parametrize("start_date, end_date", [
+    ("2023-10-01", "2023-10-31"),
+    ("2023-12-25", None),
+    (None, "2023-11-15"),
+    ("2023-12-01", "2023-11-01"),  # start after end: the same error string
+])
+def test_sales_summary_explicit_range(backends, start_date, end_date):
+    pandas_backend, sqlite_backend = backends
+    for merchant_id in pandas_backend.merchant_ids():
+        for compare_previous in (False, True):
+            args = (merchant_id, "last_30_days", start_date, end_date, compare_previous)
+            expected = pandas_backend.get_sales_summary(*args)
+            actual = sqlite_backend.get_sales_summary(*args)
+            assert same_result(expected, actual), (args, expected, actual)
+
+
+def test_unknown_ids(backends):
+    pandas_backend, sqlite_backend = backends
+    for backend in backends:
+        assert backend.get_sales_summary("unknown") is None
+        assert backend.get_popular_items_by_frequency("unknown") is None
+        assert backend.get_low_performing_items("unknown") is None
+        assert backend.get_popular_cuisines_in_city("unknown") is None